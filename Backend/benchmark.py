@@ -0,0 +1,202 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import tempfile
+import time
+import logSink
+from database import DB
+from ingestService import IngestService
+from ingestWriter import IngestWriter
+from logSink import LogSink
+from settingsCache import SettingsCache
+from simulator import BoardSimulator, run_boards
+from stateStore import StateStore
+
+
+class TimingWriter(IngestWriter):
+    """ Store readings like an IngestWriter and record the latency from sending until committing every reading.
+
+    The simulated boards send the time in milliseconds as value, which is compared to the time of the commit.
+    Frames carry no checksum, so a corrupted value can still be decoded. A latency longer than the time since
+    the writer was created cannot be real, those readings are counted in implausible instead.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        """ Initialize class with an empty list of latencies """
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+        self.implausible = 0
+        self.batches = 0
+        self.started = BoardSimulator.timestamp()
+
+    def write(self, batch):
+        """ Write a batch of readings and record their latencies.
+
+        Args:
+            batch: List of (sensor ID, value, screen position, reading time) tuples.
+
+        """
+        super().write(batch)
+        if batch:
+            now = BoardSimulator.timestamp()
+            elapsed = (now - self.started) % (1 << 24)
+            for reading in batch:
+                latency = (now - reading[1]) % (1 << 24)
+                if latency <= elapsed:
+                    self.latencies.append(latency)
+                else:
+                    self.implausible += 1
+            self.batches += 1
+
+
+def percentile(values, q):
+    """ Get a percentile of a sorted list of values.
+
+    Args:
+        values: Sorted list of values.
+        q: The percentile to get, from 0 to 100.
+
+    Returns:
+        The value at the percentile, or None for an empty list.
+
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, len(values) * q // 100)]
+
+
+def written_bytes():
+    """ Get the number of bytes written by this process, from /proc on Linux.
+
+    Returns:
+        The number of bytes written, or None when unknown.
+
+    """
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+
+
+def simulate(boards, duration):
+    """ Run the simulated boards in a process of their own, so they do not share the CPU time measured. """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(run_boards(boards, duration))
+    os._exit(0)
+
+
+def run(boards=10, rate=10.0, duration=10.0, jitter=0.0, drop_rate=0.0, corrupt_rate=0.0, max_batch=500,
+        max_latency=0.25):
+    """ Run the ingest service against simulated boards on a temporary database and measure it.
+
+    Args:
+        boards: Number of simulated boards.
+        rate: Number of readings every board sends per second.
+        duration: Number of seconds to send readings.
+        jitter: Fraction of the interval between readings a reading may be sent earlier or later.
+        drop_rate: Chance of every byte to be dropped.
+        corrupt_rate: Chance of every byte to be corrupted.
+        max_batch: Maximum number of readings written in one transaction.
+        max_latency: Maximum number of seconds a reading waits before being written.
+
+    Returns:
+        Dictionary with the results.
+
+    """
+    directory = tempfile.mkdtemp(prefix='sunroler-benchmark-')
+    try:
+        db = DB(os.path.join(directory, 'db.sqlite3'))
+        db.init()
+        logSink.default_sink = LogSink(db)
+        logSink.default_sink.start()
+
+        interval = 1.0 / rate
+        simulators = [BoardSimulator(i % 5 + 1, interval=interval, jitter=interval * jitter, drop_rate=drop_rate,
+                                     corrupt_rate=corrupt_rate, seed=i)
+                      for i in range(boards)]
+        writer = TimingWriter(db, max_batch=max_batch, max_latency=max_latency)
+        service = IngestService([board.port for board in simulators], writer=writer, settings=SettingsCache(db),
+                                state=StateStore(os.path.join(directory, 'state.bin')))
+
+        async def ingest():
+            task = asyncio.ensure_future(service.run())
+            await asyncio.sleep(0.5)
+            simulator = multiprocessing.Process(target=simulate, args=(simulators, duration))
+            start_cpu = time.process_time()
+            start_written = written_bytes()
+            simulator.start()
+            await asyncio.get_running_loop().run_in_executor(None, simulator.join)
+            # Give the backend the time to store the last readings.
+            await asyncio.sleep(max_latency * 2 + 0.5)
+            for control in service.controls.values():
+                for name, count in control.decoder.counters().items():
+                    decoded[name] = decoded.get(name, 0) + count
+                for name, count in control.commands.counters().items():
+                    commands[name] = commands.get(name, 0) + count
+                command_latencies.extend((confirmed - requested) * 1000
+                                         for position, value, requested, first_sent, confirmed, attempts
+                                         in control.commands.history if confirmed is not None)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            return time.process_time() - start_cpu, start_written
+
+        decoded = {}
+        commands = {}
+        command_latencies = []
+        cpu, start_written = asyncio.run(ingest())
+        end_written = written_bytes()
+        logSink.default_sink.stop()
+
+        stored = writer.written
+        latencies = sorted(writer.latencies)
+
+        result = {
+            'boards': boards,
+            'readings_stored': stored,
+            'readings_per_second': stored / duration,
+            'latency_ms_p50': percentile(latencies, 50),
+            'latency_ms_p95': percentile(latencies, 95),
+            'latency_ms_p99': percentile(latencies, 99),
+            'latency_implausible': writer.implausible,
+            'cpu_us_per_reading': cpu / stored * 1e6 if stored else None,
+            'transactions': writer.batches,
+            'bytes_written_per_reading': (end_written - start_written) / stored
+            if stored and start_written is not None else None,
+            'database_bytes_per_reading': sum(os.path.getsize(os.path.join(directory, f))
+                                              for f in os.listdir(directory) if f.startswith('db.sqlite3')) / stored
+            if stored else None,
+        }
+        result.update(('decoder_' + name, count) for name, count in decoded.items())
+        result.update(('commands_' + name, count) for name, count in commands.items())
+        command_latencies.sort()
+        result['command_latency_ms_p50'] = percentile(command_latencies, 50)
+        return result
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the ingest service against simulated control units.')
+    parser.add_argument('--boards', type=int, default=10, help='Number of simulated boards')
+    parser.add_argument('--rate', type=float, default=10.0, help='Readings per second per board')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to send readings')
+    parser.add_argument('--jitter', type=float, default=0.1, help='Fraction of the interval readings may vary')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='Chance of every byte to be dropped')
+    parser.add_argument('--corrupt-rate', type=float, default=0.0, help='Chance of every byte to be corrupted')
+    parser.add_argument('--max-batch', type=int, default=500, help='Maximum readings per transaction')
+    parser.add_argument('--max-latency', type=float, default=0.25, help='Maximum seconds before a reading is stored')
+    arguments = parser.parse_args()
+    print(json.dumps(run(arguments.boards, arguments.rate, arguments.duration, arguments.jitter,
+                         arguments.drop_rate, arguments.corrupt_rate, arguments.max_batch, arguments.max_latency),
+                     indent=2))
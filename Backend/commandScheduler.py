@@ -0,0 +1,173 @@
+import collections
+import time
+import metrics
+
+# Byte sent to a control unit to keep it from working autonomously, without moving the sunscreen.
+KEEPALIVE = 255
+
+
+class Command:
+    """ A roll distance to send to a control unit until its readings confirm the sunscreen position. """
+
+    __slots__ = ('position', 'value', 'requested', 'first_sent', 'sent', 'attempts')
+
+    def __init__(self, position, value, requested):
+        """ Initialize command which has not been sent yet """
+        self.position = position
+        self.value = value
+        self.requested = requested
+        self.first_sent = None
+        self.sent = None
+        self.attempts = 0
+
+
+class CommandScheduler:
+    """ Queue the commands sent to the control unit on a port.
+
+    Only the last requested position is kept, so a command still waiting is replaced by a newer one and a
+    command for the position the sunscreen already has is dropped. Commands are sent at most once per
+    interval, because the control unit reads a single byte from its receive buffer every few seconds.
+    A command is sent again when a reading arriving after the control unit had time to act on it does
+    not show the requested screen position, until it does or the maximum number of attempts is reached.
+    When nothing has been sent for the keepalive interval a keepalive is sent.
+
+    Attributes:
+        send: Function sending a byte to the control unit.
+        log: Function logging a message, messages are not logged when omitted.
+        min_interval: Minimum number of seconds between two bytes sent.
+        ack_delay: Number of seconds the control unit gets to move the sunscreen before a reading
+            showing another position makes the command be sent again.
+        retry_interval: Number of seconds after which an unconfirmed command is sent again anyway,
+            for instance when readings are lost.
+        max_attempts: Number of times a command is sent before it is given up.
+        keepalive_interval: Maximum number of seconds between two bytes sent.
+        history_size: Number of confirmed and given up commands which are kept.
+
+    """
+
+    def __init__(self, send, log=None, min_interval=5.0, ack_delay=10.0, retry_interval=120.0,
+                 max_attempts=5, keepalive_interval=60.0, history_size=100):
+        """ Initialize scheduler without commands, the position of the sunscreen is unknown until the first reading """
+        self.send = send
+        self.log = log
+        self.min_interval = min_interval
+        self.ack_delay = ack_delay
+        self.retry_interval = retry_interval
+        self.max_attempts = max_attempts
+        self.keepalive_interval = keepalive_interval
+        self.position = None
+        self.pending = None
+        self.last_sent = time.monotonic()
+        self.history = collections.deque(maxlen=history_size)
+        self.sent = 0
+        self.confirmed = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.expired = 0
+        self.keepalives = 0
+
+    def request(self, position, value, now=None):
+        """ Request the sunscreen to be moved to a position, replacing the command still waiting.
+
+        Args:
+            position: The wanted screen position.
+            value: The roll distance to send to the control unit.
+            now: The current monotonic time, the time of the call when omitted.
+
+        """
+        now = time.monotonic() if now is None else now
+        if self.pending is not None:
+            if self.pending.position == position and self.pending.value == value:
+                return
+            self.coalesced += 1
+            metrics.inc('sunroler_commands_total', 'Number of commands by result', result='coalesced')
+            self.pending = None
+        if position != self.position:
+            self.pending = Command(position, value, now)
+        self.poll(now)
+
+    def confirm(self, position, now=None):
+        """ Handle the screen position of a reading from the control unit.
+
+        Args:
+            position: The screen position received.
+            now: The current monotonic time, the time of the call when omitted.
+
+        """
+        now = time.monotonic() if now is None else now
+        self.position = position
+        command = self.pending
+        if command is None or command.sent is None:
+            return
+        if command.position == position:
+            self.pending = None
+            self.confirmed += 1
+            self.history.append((command.position, command.value, command.requested, command.first_sent,
+                                 now, command.attempts))
+            metrics.inc('sunroler_commands_total', 'Number of commands by result', result='confirmed')
+            metrics.observe('sunroler_command_latency_seconds', 'Duration from requesting a command until a '
+                            'reading confirms it', now - command.requested)
+        elif now - command.sent >= self.ack_delay:
+            command.sent = None
+
+    def poll(self, now=None):
+        """ Send the command waiting, or a keepalive, when the rate limit allows it.
+
+        Args:
+            now: The current monotonic time, the time of the call when omitted.
+
+        """
+        now = time.monotonic() if now is None else now
+        if now - self.last_sent < self.min_interval:
+            return
+
+        command = self.pending
+        if command is not None and command.sent is not None and now - command.sent >= self.retry_interval:
+            command.sent = None
+
+        if command is not None and command.sent is None:
+            if command.attempts >= self.max_attempts:
+                self.pending = None
+                self.expired += 1
+                self.history.append((command.position, command.value, command.requested, command.first_sent,
+                                     None, command.attempts))
+                metrics.inc('sunroler_commands_total', 'Number of commands by result', result='expired')
+                if self.log is not None:
+                    self.log('Sunscreen did not move to position {p} after {a} attempts.'
+                             .format(p=command.position, a=command.attempts))
+                return
+            if command.attempts:
+                self.retried += 1
+                metrics.inc('sunroler_commands_total', 'Number of commands by result', result='retried')
+            else:
+                command.first_sent = now
+            command.attempts += 1
+            command.sent = now
+            self.transmit(command.value, now)
+            self.sent += 1
+            metrics.inc('sunroler_commands_total', 'Number of commands by result', result='sent')
+        elif now - self.last_sent >= self.keepalive_interval:
+            self.transmit(KEEPALIVE, now)
+            self.keepalives += 1
+
+    def transmit(self, value, now):
+        """ Send a byte to the control unit.
+
+        Args:
+            value: The byte to send.
+            now: The current monotonic time.
+
+        """
+        self.last_sent = now
+        self.send(value)
+
+    def counters(self):
+        """ Get the scheduler counters.
+
+        Returns:
+            Dictionary with the number of commands sent, confirmed, replaced before they were confirmed,
+            sent again and given up, and the number of keepalives sent.
+
+        """
+        return {'sent': self.sent, 'confirmed': self.confirmed, 'coalesced': self.coalesced,
+                'retried': self.retried, 'expired': self.expired, 'keepalives': self.keepalives}
@@ -1,5 +1,166 @@
 import sqlite3
+import sys
+import threading
 import time
+import metrics
+from reading import Reading
+from sensorRegistry import DEFAULT_SENSORS
+
+# Sizes in seconds of the buckets readings are rolled up in: a minute, an hour and a day.
+ROLLUP_RESOLUTIONS = (60, 3600, 86400)
+
+
+class ConnectionPool:
+    """ Hand out long-lived SQLite connections, one per thread.
+
+    SQLite connections may only be used by the thread that created them, so every thread
+    gets its own warm connection. Connections are opened in WAL mode with a relaxed
+    synchronous level, keep a statement cache for prepared statements and are checked
+    for health before being handed out again after being idle. A connection is only ever
+    closed by its own thread, or by another thread once its own thread has finished.
+
+    Attributes:
+        path: Path to the database file.
+        check_interval: Seconds a connection may be idle before it is health checked.
+
+    """
+
+    def __init__(self, path, check_interval=30):
+        """ Initialize pool with database path and health check interval """
+        self.path = path
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self.connections = {}
+        self.last_used = {}
+
+    def connect(self):
+        """ Open and configure a new database connection.
+
+        Returns:
+            conn: Database connection object.
+
+        """
+        conn = sqlite3.connect(self.path, timeout=5, cached_statements=128, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def healthy(self, conn):
+        """ Check whether a connection can still be used.
+
+        Args:
+            conn: Database connection object.
+
+        Returns:
+            True if the connection answers a trivial query, False otherwise.
+
+        """
+        try:
+            conn.execute("SELECT 1").fetchone()
+        except sqlite3.Error:
+            return False
+        return True
+
+    def acquire(self):
+        """ Get the connection of the calling thread, opening or reopening it when needed.
+
+        Returns:
+            conn: Database connection object.
+
+        """
+        ident = threading.get_ident()
+        now = time.monotonic()
+
+        with self.lock:
+            conn = self.connections.get(ident)
+            last_used = self.last_used.get(ident, now)
+
+        # No other thread closes the connection of a live thread, so it can be checked without the lock.
+        if conn is not None and now - last_used > self.check_interval and not self.healthy(conn):
+            self.discard(ident)
+            conn = None
+
+        if conn is None:
+            conn = self.connect()
+            with self.lock:
+                finished = self.prune()
+                self.connections[ident] = conn
+                self.last_used[ident] = now
+            for old in finished:
+                old.close()
+        else:
+            with self.lock:
+                self.last_used[ident] = now
+        return conn
+
+    def discard(self, ident):
+        """ Close and forget the connection of a thread.
+
+        Args:
+            ident: Identifier of the thread owning the connection, which must be the calling thread
+                or a thread which has finished.
+
+        """
+        with self.lock:
+            conn = self.connections.pop(ident, None)
+            self.last_used.pop(ident, None)
+        if conn is not None:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def prune(self):
+        """ Forget the connections of threads that are no longer alive.
+
+        Must be called while holding the pool lock.
+
+        Returns:
+            List of the connections forgotten, to be closed after releasing the lock.
+
+        """
+        alive = {thread.ident for thread in threading.enumerate()}
+        finished = []
+        for ident in [i for i in self.connections if i not in alive]:
+            finished.append(self.connections.pop(ident))
+            self.last_used.pop(ident, None)
+        return finished
+
+    def close_all(self):
+        """ Close every connection in the pool. """
+        with self.lock:
+            connections = list(self.connections.values())
+            self.connections.clear()
+            self.last_used.clear()
+        for conn in connections:
+            conn.close()
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(path):
+    """ Get the connection pool shared by every DB object using the same database file.
+
+    Args:
+        path: Path to the database file.
+
+    Returns:
+        pool: ConnectionPool for the database file.
+
+    """
+    with pools_lock:
+        if path not in pools:
+            pools[path] = ConnectionPool(path)
+        return pools[path]
+
+
+def close_pools():
+    """ Close every connection of every pool, for instance before forking, since connections must not be shared. """
+    with pools_lock:
+        for pool in pools.values():
+            pool.close_all()
 
 
 class DB:
@@ -7,9 +168,19 @@ class DB:
 
     This class provides functions to open and close a database connection
     and to insert sensor values, settings and log messages.
+    Connections are taken from a pool shared by all DB objects using the same
+    database file, so they stay open between calls.
+
+    Attributes:
+        path: Path to the database file.
 
     """
 
+    def __init__(self, path='../Central/db.sqlite3'):
+        """ Initialize class with the connection pool of the database file """
+        self.path = path
+        self.pool = get_pool(path)
+
     def open(self):
         """ Open a connection with the database.
 
@@ -18,34 +189,30 @@ class DB:
             c: Cursor database connection object.
 
         """
-        conn = sqlite3.connect('../Central/db.sqlite3')
+        conn = self.pool.acquire()
         c = conn.cursor()
         return conn, c
 
     def close(self, conn):
         """ Close a connection with the database.
 
+        The changes are committed and the connection is handed back to the pool.
+
         Args:
             conn: Database connection object.
 
         """
         conn.commit()
-        conn.close()
 
     def init(self):
         """ Initialize database.
 
-        Create tables to be able to store log messages, sensor settings and sensor values.
-        Insert specified sensor names in table 'sensor_settings' to be able to store sensor settings.
+        Create tables to be able to store log messages and sensor settings.
+        Insert the names of the default sensors in table 'sensor_settings' to be able to store sensor settings.
         Insert default roll in and roll out distances and default values for sensor settings.
 
         """
-        conn, c = self.open()  # Specify sensor identification, name, default minimal value and default maximum value.
-        sensors = {1: ['anemometer', 0, 0],
-                   2: ['rain', 0, 0],
-                   3: ['temperature', 20, 25],
-                   4: ['humidity', 0, 0],
-                   5: ['light', 150, 250]}
+        conn, c = self.open()
 
         c.execute("CREATE TABLE {tn} ({id_fn} {id_ft}, {s_fn} {s_ft}, {s_n_fn} {s_n_ft}, {s_v_fn} {s_v_ft})"
                   .format(tn='sensor_settings',
@@ -70,14 +237,7 @@ class DB:
         c.execute("INSERT INTO sensor_settings (sensor, setting_name, setting_value) VALUES (?, ?, ?)",
                   insert_values)
 
-        for key, value in sensors.items():
-            c.execute("CREATE TABLE {tn} ({id_fn} {id_ft}, {sv_fn} {sv_ft}, {sp_fn} {sp_ft}, {rt_fn} {rt_ft})"
-                      .format(tn=value[0],
-                              id_fn='ID', id_ft='INTEGER PRIMARY KEY AUTOINCREMENT',
-                              sv_fn='sensor_value', sv_ft='INTEGER',
-                              sp_fn='screen_position', sp_ft='INTEGER',
-                              rt_fn='reading_time', rt_ft='INTEGER'))
-
+        for key, value in DEFAULT_SENSORS.items():
             insert_values = (key, 'sensor_name', value[0])
             c.execute("INSERT INTO sensor_settings (sensor, setting_name, setting_value) VALUES (?, ?, ?)",
                       insert_values)
@@ -100,6 +260,83 @@ class DB:
 
         self.close(conn)
 
+        self.upgrade()
+
+    def upgrade(self):
+        """ Upgrade an existing database to the current schema.
+
+        Every statement is idempotent, so this can be run on every start.
+        Create table 'settings_version' holding a counter which is increased by triggers
+        whenever a row in 'sensor_settings' is inserted, updated or deleted, no matter whether
+        that is done by the backend, the web interface or the admin.
+        Create table 'readings' storing the values of every sensor, indexed on sensor and reading time,
+        and move the values of databases which still have a table per sensor into it.
+        Create table 'rollups' with the minimum, maximum, total and count of the values of every sensor
+        per minute, hour and day, filled from the existing readings when it is created.
+        Create table 'spool_state' holding the sequence number of the last reading of the reading spool
+        which has been stored, so replaying the spool never stores a reading twice.
+        Create table 'readings_version' holding a counter which is increased in every transaction storing
+        readings, so the web interface knows when the stored readings changed.
+
+        """
+        conn, c = self.open()
+
+        c.execute("CREATE TABLE IF NOT EXISTS {tn} ({id_fn} {id_ft}, {s_fn} {s_ft}, {sv_fn} {sv_ft}, "
+                  "{sp_fn} {sp_ft}, {rt_fn} {rt_ft})"
+                  .format(tn='readings',
+                          id_fn='ID', id_ft='INTEGER PRIMARY KEY AUTOINCREMENT',
+                          s_fn='sensor_id', s_ft='INTEGER',
+                          sv_fn='sensor_value', sv_ft='INTEGER',
+                          sp_fn='screen_position', sp_ft='INTEGER',
+                          rt_fn='reading_time', rt_ft='INTEGER'))
+        c.execute("CREATE INDEX IF NOT EXISTS readings_sensor_time ON readings (sensor_id, reading_time)")
+
+        c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        tables = {row[0] for row in c.fetchall()}
+        c.execute("SELECT sensor, setting_value FROM sensor_settings WHERE setting_name = 'sensor_name'")
+        for sensor_id, sensor_name in c.fetchall():
+            if sensor_name in tables:
+                c.execute("INSERT INTO readings (sensor_id, sensor_value, screen_position, reading_time) "
+                          "SELECT ?, sensor_value, screen_position, reading_time FROM {tn} ORDER BY ID"
+                          .format(tn=sensor_name), (sensor_id,))
+                c.execute("DROP TABLE {tn}".format(tn=sensor_name))
+
+        if 'rollups' not in tables:
+            c.execute("CREATE TABLE {tn} ({id_fn} {id_ft}, {s_fn} {s_ft}, {r_fn} {r_ft}, {b_fn} {b_ft}, "
+                      "{mi_fn} {mi_ft}, {ma_fn} {ma_ft}, {t_fn} {t_ft}, {c_fn} {c_ft})"
+                      .format(tn='rollups',
+                              id_fn='ID', id_ft='INTEGER PRIMARY KEY AUTOINCREMENT',
+                              s_fn='sensor_id', s_ft='INTEGER',
+                              r_fn='resolution', r_ft='INTEGER',
+                              b_fn='bucket', b_ft='INTEGER',
+                              mi_fn='min_value', mi_ft='INTEGER',
+                              ma_fn='max_value', ma_ft='INTEGER',
+                              t_fn='total', t_ft='INTEGER',
+                              c_fn='count', c_ft='INTEGER'))
+            c.execute("CREATE UNIQUE INDEX rollups_sensor_bucket ON rollups (sensor_id, resolution, bucket)")
+
+            for resolution in ROLLUP_RESOLUTIONS:
+                c.execute("INSERT INTO rollups (sensor_id, resolution, bucket, min_value, max_value, total, count) "
+                          "SELECT sensor_id, ?, reading_time / ? * ?, MIN(sensor_value), MAX(sensor_value), "
+                          "SUM(sensor_value), COUNT(*) FROM readings GROUP BY sensor_id, reading_time / ?",
+                          (resolution, resolution, resolution, resolution))
+
+        c.execute("CREATE TABLE IF NOT EXISTS settings_version (ID INTEGER PRIMARY KEY, version INTEGER)")
+        c.execute("INSERT OR IGNORE INTO settings_version (ID, version) VALUES (1, 0)")
+
+        c.execute("CREATE TABLE IF NOT EXISTS spool_state (ID INTEGER PRIMARY KEY, sequence INTEGER)")
+        c.execute("INSERT OR IGNORE INTO spool_state (ID, sequence) VALUES (1, 0)")
+
+        c.execute("CREATE TABLE IF NOT EXISTS readings_version (ID INTEGER PRIMARY KEY, version INTEGER)")
+        c.execute("INSERT OR IGNORE INTO readings_version (ID, version) VALUES (1, 0)")
+
+        for event in ('insert', 'update', 'delete'):
+            c.execute("CREATE TRIGGER IF NOT EXISTS sensor_settings_{e} AFTER {e} ON sensor_settings "
+                      "BEGIN UPDATE settings_version SET version = version + 1 WHERE ID = 1; END"
+                      .format(e=event))
+
+        self.close(conn)
+
     def insert_sensor_value(self, sensor_id, value, screen_pos):
         """ Insert sensor values in database.
 
@@ -109,15 +346,55 @@ class DB:
             screen_pos: The position of the sunscreen.
 
         """
-        conn, c = self.open()
+        self.insert_sensor_values([(sensor_id, value, screen_pos, int(time.time()))])
+
+    @metrics.timed('sunroler_db_commit_seconds', 'Duration of storing a batch of readings')
+    def insert_sensor_values(self, readings, spool_sequence=None):
+        """ Insert a batch of sensor values in database in a single transaction.
 
-        sensor_name = self.select_sensor_setting(sensor_id, 'sensor_name')
+        The rollups of the sensor values and the readings version are updated in the same transaction, like
+        the sequence number of the last reading of the spool when the readings are replayed from the reading spool.
 
-        insert_values = (value, screen_pos, int(time.time()))
-        c.execute("INSERT INTO {s} (sensor_value, screen_position, reading_time) VALUES (?, ?, ?)".format(
-            s=sensor_name[0]), insert_values)
+        Args:
+            readings: List of (sensor ID, value, screen position, reading time) tuples.
+            spool_sequence: Sequence number in the reading spool of the last reading of the batch.
+
+        """
+        rollups = {}
+        for sensor_id, value, screen_pos, reading_time in readings:
+            for resolution in ROLLUP_RESOLUTIONS:
+                key = (sensor_id, resolution, reading_time // resolution * resolution)
+                rollup = rollups.get(key)
+                if rollup is None:
+                    rollups[key] = [value, value, value, 1]
+                else:
+                    if value < rollup[0]:
+                        rollup[0] = value
+                    if value > rollup[1]:
+                        rollup[1] = value
+                    rollup[2] += value
+                    rollup[3] += 1
+
+        conn, c = self.open()
+
+        try:
+            c.executemany("INSERT INTO readings (sensor_id, sensor_value, screen_position, reading_time) "
+                          "VALUES (?, ?, ?, ?)", readings)
+            c.executemany("INSERT INTO rollups (sensor_id, resolution, bucket, min_value, max_value, total, count) "
+                          "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (sensor_id, resolution, bucket) DO UPDATE SET "
+                          "min_value = MIN(min_value, excluded.min_value), "
+                          "max_value = MAX(max_value, excluded.max_value), "
+                          "total = total + excluded.total, count = count + excluded.count",
+                          [key + tuple(rollup) for key, rollup in rollups.items()])
+            if spool_sequence is not None:
+                c.execute("UPDATE spool_state SET sequence = ? WHERE ID = 1", (spool_sequence,))
+            c.execute("UPDATE readings_version SET version = version + 1 WHERE ID = 1")
+        except sqlite3.Error:
+            conn.rollback()
+            raise
 
         self.close(conn)
+        metrics.inc('sunroler_db_readings_total', 'Number of readings stored', len(readings))
 
     def select_last_sensor_value(self, sensor_id):
         """ Select last sensor value and last known screen position from database.
@@ -125,23 +402,25 @@ class DB:
         Args:
             sensor_id: ID of sensor to select value from.
 
+        Returns:
+            The last Reading of the sensor, a Reading with zero value, screen position and time when
+            the sensor has no readings.
+
         """
         conn, c = self.open()
 
-        sensor_name = self.select_sensor_setting(sensor_id, 'sensor_name')
-
-        c.execute("SELECT sensor_value, screen_position FROM {tn} ORDER BY reading_time DESC LIMIT 1".format(
-            tn=sensor_name[0]))
+        c.execute("SELECT sensor_value, screen_position, reading_time FROM readings WHERE sensor_id = ? "
+                  "ORDER BY reading_time DESC LIMIT 1", (sensor_id,))
 
         fetched_row = c.fetchone()
 
         self.close(conn)
 
         if fetched_row:
-            return fetched_row
+            return Reading(sensor_id, *fetched_row)
         else:
             # If no reading found, return zero.
-            return [{'sensor_value': 0, 'screen_position': 0}]
+            return Reading(sensor_id, 0, 0, 0)
 
     def select_sensor_setting(self, sensor_id, setting_name):
         """ Select setting from sensor_setting table.
@@ -153,8 +432,8 @@ class DB:
         """
         conn, c = self.open()
 
-        c.execute("SELECT setting_value FROM sensor_settings WHERE sensor = {s} AND setting_name = '{sn}'"
-                  .format(s=sensor_id, sn=setting_name))
+        c.execute("SELECT setting_value FROM sensor_settings WHERE sensor = ? AND setting_name = ?",
+                  (sensor_id, setting_name))
 
         fetched_row = c.fetchone()
 
@@ -162,6 +441,57 @@ class DB:
 
         return fetched_row
 
+    def select_sensor_settings(self):
+        """ Select every setting from sensor_setting table.
+
+        Returns:
+            List of (sensor, setting name, setting value) tuples.
+
+        """
+        conn, c = self.open()
+
+        c.execute("SELECT sensor, setting_name, setting_value FROM sensor_settings")
+
+        fetched_rows = c.fetchall()
+
+        self.close(conn)
+
+        return fetched_rows
+
+    def select_settings_version(self):
+        """ Select the version of the settings, which changes whenever a setting changes.
+
+        Returns:
+            The settings version.
+
+        """
+        conn, c = self.open()
+
+        c.execute("SELECT version FROM settings_version WHERE ID = 1")
+
+        fetched_row = c.fetchone()
+
+        self.close(conn)
+
+        return fetched_row[0] if fetched_row else 0
+
+    def select_spool_sequence(self):
+        """ Select the sequence number of the last reading of the reading spool which has been stored.
+
+        Returns:
+            The sequence number, 0 when no reading of the spool has been stored yet.
+
+        """
+        conn, c = self.open()
+
+        c.execute("SELECT sequence FROM spool_state WHERE ID = 1")
+
+        fetched_row = c.fetchone()
+
+        self.close(conn)
+
+        return fetched_row[0] if fetched_row else 0
+
     def insert_log_message(self, message):
         """ Insert log message into database.
 
@@ -176,7 +506,23 @@ class DB:
 
         self.close(conn)
 
+    def insert_log_messages(self, messages):
+        """ Insert a batch of log messages into database in a single transaction.
+
+        Args:
+            messages: List of (message, log time) tuples.
+
+        """
+        conn, c = self.open()
+
+        c.executemany("INSERT INTO log (message, log_time) VALUES (?, ?)", messages)
+
+        self.close(conn)
+
 if __name__ == "__main__":
-    # Initialize database when this script is being called directly.
+    # Initialize database when this script is being called directly, or upgrade it when asked to.
     db = DB()
-    db.init()
+    if sys.argv[1:] == ['upgrade']:
+        db.upgrade()
+    else:
+        db.init()
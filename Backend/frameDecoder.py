@@ -0,0 +1,134 @@
+import struct
+import time
+import metrics
+
+FRAME = struct.Struct('>BBI')
+
+
+class FrameDecoder:
+    """ Decode readings from the bytes sent by a control unit.
+
+    A control unit sends every reading as six bytes: the sensor ID, the screen position
+    and the 32 bits sensor value, most significant byte first. There is no marker at the
+    start of a reading, so a lost or corrupted byte would shift every following reading.
+    To recover from this the decoder only accepts a reading when the sensor ID and screen
+    position are valid. After an invalid reading bytes are skipped one at a time, until a
+    valid reading is found which is followed by the start of a valid reading or by the end
+    of the received data.
+    A partial reading which is not completed within the gap time is discarded as well,
+    since control units send a reading at once and then stay silent for seconds.
+
+    Attributes:
+        sensor_ids: The sensor IDs which can be received.
+        positions: The screen positions which can be received.
+        max_value: The highest sensor value which can be received.
+        gap: Number of seconds after which a partial reading is discarded.
+
+    """
+
+    def __init__(self, sensor_ids=range(1, 6), positions=(0, 1), max_value=0xFFFFFF, gap=1.0):
+        """ Initialize class with an empty buffer and zeroed counters """
+        self.sensor_ids = frozenset(sensor_ids)
+        self.positions = frozenset(positions)
+        self.max_value = max_value
+        self.gap = gap
+        self.buffer = bytearray()
+        self.received = None
+        self.synced = False
+        self.frames = 0
+        self.bad_bytes = 0
+        self.resyncs = 0
+        self.discarded = 0
+
+    def valid(self, sensor_id, screen_pos, value):
+        """ Check whether a decoded reading can be a real reading.
+
+        Args:
+            sensor_id: The decoded sensor ID.
+            screen_pos: The decoded screen position.
+            value: The decoded sensor value.
+
+        Returns:
+            True if every field is within range.
+
+        """
+        return sensor_id in self.sensor_ids and screen_pos in self.positions and value <= self.max_value
+
+    @metrics.timed('sunroler_decode_seconds', 'Duration of decoding a chunk of received bytes')
+    def feed(self, data, now=None):
+        """ Decode the readings in a chunk of received data.
+
+        Bytes of a reading which is not complete yet are kept until the next call.
+
+        Args:
+            data: The bytes received from the control unit.
+            now: Monotonic time the data was received at, defaults to now.
+
+        Returns:
+            List of (sensor ID, screen position, sensor value) tuples.
+
+        """
+        if now is None:
+            now = time.monotonic()
+
+        buffer = self.buffer
+        if buffer and self.received is not None and now - self.received > self.gap:
+            self.discarded += len(buffer)
+            buffer.clear()
+            self.synced = True
+        self.received = now
+
+        buffer += data
+        end = len(buffer)
+        offset = 0
+        skipped = 0
+        readings = []
+        unpack_from = FRAME.unpack_from
+        sensor_ids = self.sensor_ids
+        synced = self.synced
+
+        while end - offset >= 6:
+            reading = unpack_from(buffer, offset)
+            if self.valid(*reading) and (synced or offset + 6 == end or buffer[offset + 6] in sensor_ids):
+                if not synced and self.bad_bytes + skipped:
+                    self.resyncs += 1
+                synced = True
+                readings.append(reading)
+                offset += 6
+            else:
+                synced = False
+                skipped += 1
+                offset += 1
+
+        self.bad_bytes += skipped
+        self.synced = synced
+        self.frames += len(readings)
+        del buffer[:offset]
+        return readings
+
+    def counters(self):
+        """ Get the decoder counters.
+
+        Returns:
+            Dictionary with the number of readings decoded, bytes skipped, resynchronisations and
+            bytes discarded because a reading was not completed in time.
+
+        """
+        return {'frames': self.frames, 'bad_bytes': self.bad_bytes,
+                'resyncs': self.resyncs, 'discarded': self.discarded}
+
+
+if __name__ == '__main__':
+    # Measure decoding speed on generated data with an occasional corrupted byte.
+    import random
+    capture = bytearray()
+    for i in range(200000):
+        capture += FRAME.pack(random.randint(1, 5), random.randint(0, 1), random.randint(0, 100000))
+        if i % 1000 == 0:
+            capture.append(random.randint(6, 255))
+    decoder = FrameDecoder()
+    start = time.perf_counter()
+    for i in range(0, len(capture), 4096):
+        decoder.feed(capture[i:i + 4096], now=0)
+    duration = time.perf_counter() - start
+    print('{mb:.1f} MB/s, {c}'.format(mb=len(capture) / duration / 1e6, c=decoder.counters()))
@@ -0,0 +1,230 @@
+import asyncio
+import atexit
+import functools
+import os
+import sys
+import metrics
+import readiness
+from serial import SerialException
+from database import DB
+from logSink import get_sink
+from portWatcher import PortWatcher
+from readingSpool import SpoolWriter
+from ruleEngine import RuleEngine
+from sensor import Control
+from settingsCache import SettingsCache
+from stateStore import StateStore
+
+DEFAULT_PORTS = ['/dev/ttyUSB0', '/dev/ttyUSB1']
+
+
+class IngestService:
+    """ Read data from any number of control units concurrently.
+
+    Every port is watched by its own asyncio task. The task waits on the file descriptor of
+    the serial port until data is available, so idle ports cost no CPU, and then reads
+    everything waiting at once. When a port cannot be opened or fails while reading, the task
+    waits and connects again without affecting the other ports. A port which does not exist,
+    like a USB adapter which has not been found yet after a power cut, is connected as soon as
+    it appears. A port which exists but cannot be opened is tried again after a delay which
+    doubles with every failure.
+
+    When started by systemd with Type=notify, systemd is told the service is ready once the
+    readings left in the spool by a previous run are stored, or storing them failed and is
+    retried by the writer thread, and is kept informed about the ports. The time
+    from the start of the process until then and until the first reading has been processed
+    is logged and kept as metrics.
+
+    Attributes:
+        ports: The ports to read data from.
+        baud_rate: The baud rate to use on the connections.
+        reconnect_delay: Number of seconds to wait before connecting to a failed port again.
+        max_reconnect_delay: Maximum number of seconds to wait before connecting to a failed or missing port again.
+        manual_interval: Number of seconds between checks whether the user controls the sunscreen manually.
+        writer: The IngestWriter to store readings with, a SpoolWriter when omitted.
+        settings: The SettingsCache to read sensor settings from.
+        state: The StateStore to share the last state of the sensors with.
+        rules: The RuleEngine deciding the position of every sunscreen.
+        startup: Dictionary of the number of seconds from the start of the process until the service
+            was 'ready' and until the 'first_reading' was processed.
+
+    """
+
+    def __init__(self, ports, baud_rate=19200, reconnect_delay=1.0, max_reconnect_delay=60.0, manual_interval=1.0,
+                 writer=None, settings=None, state=None, rules=None):
+        """ Initialize class with the ports to read and the writer and settings shared by every port """
+        self.ports = list(ports)
+        self.baud_rate = baud_rate
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.manual_interval = manual_interval
+        self.writer = writer if writer is not None else SpoolWriter()
+        self.settings = settings if settings is not None else SettingsCache(self.writer.db)
+        self.state = state if state is not None else StateStore()
+        self.rules = rules if rules is not None else RuleEngine(self.settings)
+        self.controls = {}
+        self.watcher = PortWatcher()
+        self.startup = {}
+        for stage in ('ready', 'first_reading'):
+            metrics.gauge('sunroler_startup_seconds', 'Seconds from the start of the process until a stage of startup',
+                          functools.partial(self.startup.get, stage, float('nan')), stage=stage)
+
+    def connect(self, port):
+        """ Open a connection with the control unit on a port.
+
+        Args:
+            port: The port to connect to.
+
+        Returns:
+            Control object reading from the port.
+
+        """
+        return Control(port, self.baud_rate, timeout=0, writer=self.writer, settings=self.settings, state=self.state,
+                       rules=self.rules)
+
+    async def watch(self, port):
+        """ Read data from a port until cancelled, connecting again whenever the connection fails.
+
+        Args:
+            port: The port to read data from.
+
+        """
+        loop = asyncio.get_running_loop()
+        delay = self.reconnect_delay
+        while True:
+            if not await self.watcher.wait(port, self.max_reconnect_delay):
+                continue
+            try:
+                control = self.connect(port)
+            except SerialException:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+            delay = self.reconnect_delay
+
+            failed = loop.create_future()
+
+            def readable():
+                try:
+                    control.read_data()
+                except SerialException as e:
+                    if not failed.done():
+                        failed.set_result(e)
+                except Exception as e:
+                    # Keep reading the port, a bug must not stop the readings of every port.
+                    control.ser.log('Failed to process data from {p}: {e!r}'.format(p=port, e=e))
+                if 'first_reading' not in self.startup and control.decoder.frames:
+                    self.started('first_reading', control)
+
+            self.controls[port] = control
+            self.report()
+            loop.add_reader(control.fileno(), readable)
+            try:
+                await failed
+                control.ser.log('Lost connection with {p}, reconnecting.'.format(p=port))
+            finally:
+                loop.remove_reader(control.fileno())
+                self.controls.pop(port, None)
+                self.report()
+                try:
+                    control.close()
+                except SerialException:
+                    pass
+            await asyncio.sleep(self.reconnect_delay)
+
+    def started(self, stage, control=None):
+        """ Record and log how long it took from the start of the process until a stage of startup.
+
+        Args:
+            stage: The stage reached, 'ready' or 'first_reading'.
+            control: The Control to log with, the log sink of the process is used when omitted.
+
+        """
+        age = readiness.process_age()
+        self.startup[stage] = age
+        uptime = readiness.uptime()
+        message = 'Ingest service reached {s} {a} after start, {u} after boot.'.format(
+            s=stage.replace('_', ' '),
+            a='{a:.2f}s'.format(a=age) if age is not None else 'unknown time',
+            u='{u:.1f}s'.format(u=uptime) if uptime is not None else 'unknown time')
+        if control is not None:
+            control.ser.log(message)
+        else:
+            get_sink().log(message)
+
+    def report(self):
+        """ Tell systemd how many ports are connected. """
+        waiting = [port for port in self.ports if port not in self.controls]
+        readiness.notify('STATUS=Connected to {c} of {n} ports{w}'.format(
+            c=len(self.controls), n=len(self.ports), w=', waiting for ' + ', '.join(waiting) if waiting else ''))
+
+    async def control_manual(self):
+        """ Check periodically whether the user wants to roll in or roll out the sunscreens manually.
+
+        The overriding rules are updated from the state store as well, so sensors read by another
+        process, like an anemometer on a port of another worker, override the sunscreens of this one.
+
+        """
+        while True:
+            await asyncio.sleep(self.manual_interval)
+            try:
+                self.rules.sync(self.state)
+            except Exception as e:
+                get_sink().log('Failed to update the overriding rules: {e!r}'.format(e=e))
+            for control in list(self.controls.values()):
+                if control.get_sensor_id() != 0:
+                    try:
+                        control.control_sunscreen_manual(control.get_sensor_id())
+                    except SerialException:
+                        pass
+                    except Exception as e:
+                        control.ser.log('Failed to control sunscreen manually: {e!r}'.format(e=e))
+
+    async def run(self):
+        """ Read data from every port until cancelled. """
+        # Store the readings left in the spool by a previous run before reporting the service ready.
+        try:
+            self.writer.flush()
+        except Exception as e:
+            get_sink().log('Failed to store the readings left by a previous run, retrying: {e!r}'.format(e=e))
+        self.writer.start()
+        self.watcher.start()
+        tasks = [asyncio.ensure_future(self.watch(port)) for port in self.ports]
+        tasks.append(asyncio.ensure_future(self.control_manual()))
+        self.started('ready')
+        readiness.notify('READY=1')
+        self.report()
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            readiness.notify('STOPPING=1')
+            for task in tasks:
+                task.cancel()
+            self.watcher.close()
+            self.writer.stop()
+
+
+def main(ports=None):
+    """ Read data from the ports given, from the SUNROLER_PORTS environment variable or from the default ports.
+
+    Args:
+        ports: List of ports to read data from.
+
+    """
+    if not ports:
+        ports = os.environ.get('SUNROLER_PORTS', ','.join(DEFAULT_PORTS)).split(',')
+
+    # Make sure the database has the tables and triggers the backend relies on.
+    DB().upgrade()
+
+    metrics.serve()
+    service = IngestService(ports)
+    atexit.register(service.writer.stop)
+    try:
+        asyncio.run(service.run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
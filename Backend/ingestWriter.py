@@ -0,0 +1,168 @@
+import threading
+import time
+import metrics
+from database import DB
+from reading import ReadingBuffer
+
+
+class IngestWriter:
+    """ Write sensor readings to the database in batches from a background thread.
+
+    Readings are appended to an in-memory ring buffer and flushed in one transaction per batch,
+    either when the batch is full or when the oldest buffered reading has waited long enough.
+    When the buffer is full, adding a reading blocks until the writer has caught up. A batch which
+    fails, for instance because another process holds a lock on the database, is written again until
+    it succeeds, while new readings wait in the buffer.
+
+    Attributes:
+        db: DB object used to store the readings.
+        max_batch: Maximum number of readings written in one transaction.
+        max_latency: Maximum number of seconds a reading waits in the buffer.
+        capacity: Maximum number of readings kept in the buffer.
+        failed: Number of readings in batches which failed, counted once however often a batch is retried.
+        retries: Number of times a batch has been written again after it failed.
+
+    """
+
+    def __init__(self, db=None, max_batch=500, max_latency=0.25, capacity=10000):
+        """ Initialize class with an empty buffer, the writer thread is started by start() """
+        self.db = db if db is not None else DB()
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.capacity = capacity
+        self.buffer = ReadingBuffer(capacity)
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+        self.failing = None
+        metrics.gauge('sunroler_ingest_queue_depth', 'Number of readings waiting to be stored',
+                      lambda: self.backlog())
+        metrics.gauge('sunroler_ingest_failed', 'Number of readings which could not be stored',
+                      lambda: self.failed)
+        metrics.gauge('sunroler_ingest_retries', 'Number of times a batch was written again after it failed',
+                      lambda: self.retries)
+
+    def start(self):
+        """ Start the background writer thread. """
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self.run, name='ingest-writer', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """ Stop the background writer thread after flushing a failing batch and every buffered reading. """
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.failing is not None:
+            self.write(self.failing)
+        self.flush()
+
+    def backlog(self):
+        """ Get the number of readings waiting to be written. """
+        return len(self.buffer)
+
+    def put(self, sensor_id, value, screen_pos, reading_time=None, timeout=None):
+        """ Add a reading to the buffer.
+
+        Args:
+            sensor_id: ID of sensor the value was read from.
+            value: Value of reading to store.
+            screen_pos: The position of the sunscreen.
+            reading_time: Time of the reading, defaults to now.
+            timeout: Maximum number of seconds to wait for room in the buffer, None waits forever.
+
+        Returns:
+            True if the reading was buffered, False if the buffer stayed full until the timeout.
+
+        """
+        if reading_time is None:
+            reading_time = int(time.time())
+
+        if not self.running and len(self.buffer) >= self.capacity:
+            # Without the writer thread nothing makes room in the buffer.
+            self.flush()
+
+        with self.condition:
+            if len(self.buffer) >= self.capacity and not self.condition.wait_for(
+                    lambda: len(self.buffer) < self.capacity or not self.running, timeout):
+                return False
+            self.buffer.append(sensor_id, value, screen_pos, reading_time)
+            if len(self.buffer) >= self.max_batch:
+                self.condition.notify_all()
+
+        if not self.running:
+            self.flush()
+        return True
+
+    def take(self):
+        """ Remove the next batch of readings from the buffer.
+
+        Must be called while holding the condition lock.
+
+        Returns:
+            List of at most max_batch readings.
+
+        """
+        batch = self.buffer.take(self.max_batch)
+        self.condition.notify_all()
+        return batch
+
+    def write(self, batch):
+        """ Write a batch of readings to the database.
+
+        Args:
+            batch: List of (sensor ID, value, screen position, reading time) tuples.
+
+        """
+        if not batch:
+            return
+        retry = batch is self.failing
+        if retry:
+            self.retries += 1
+        try:
+            self.db.insert_sensor_values(batch)
+        except Exception:
+            if not retry:
+                self.failed += len(batch)
+                self.failing = batch
+            raise
+        self.failing = None
+        self.written += len(batch)
+
+    def flush(self):
+        """ Write every buffered reading to the database from the calling thread. """
+        while True:
+            with self.condition:
+                batch = self.take()
+            if not batch:
+                return
+            self.write(batch)
+
+    def run(self):
+        """ Flush batches until the writer is stopped, writing a failing batch again until it succeeds. """
+        batch = None
+        while True:
+            if not batch:
+                with self.condition:
+                    if self.running and self.backlog() < self.max_batch:
+                        self.condition.wait(self.max_latency)
+                    if not self.running and not self.backlog():
+                        return
+                    batch = self.take()
+            try:
+                self.write(batch)
+                batch = None
+            except Exception:
+                if not self.running:
+                    # Stopping, stop() writes the failing batch once more instead of retrying it forever.
+                    return
+                time.sleep(self.max_latency)
@@ -0,0 +1,125 @@
+import atexit
+import collections
+import threading
+import time
+import metrics
+from database import DB
+
+
+class LogSink:
+    """ Write log messages to the database from a background thread without blocking the caller.
+
+    Messages are queued in memory and written in batches. A message which is logged again within
+    the coalesce window is not queued again, but counted, and written once as a summary like
+    'Timeout has occurred during read of serial port. x 312 in last 10s' when the window ends.
+    When the queue is full the oldest messages are dropped and counted.
+
+    Attributes:
+        db: DB object used to store the messages.
+        interval: Number of seconds between writes to the database.
+        window: Number of seconds repeated messages are coalesced over.
+        capacity: Maximum number of messages kept in the queue.
+
+    """
+
+    def __init__(self, db=None, interval=1.0, window=10, capacity=1000):
+        """ Initialize class with an empty queue, the writer thread is started by start() """
+        self.db = db if db is not None else DB()
+        self.interval = interval
+        self.window = window
+        self.capacity = capacity
+        self.queue = collections.deque()
+        self.repeats = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+        self.dropped = 0
+        metrics.gauge('sunroler_log_queue_depth', 'Number of log messages waiting to be stored',
+                      lambda: len(self.queue))
+
+    def start(self):
+        """ Start the background writer thread. """
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.run, name='log-sink', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """ Stop the background writer thread after writing every queued message and summary. """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush(final=True)
+
+    def log(self, message):
+        """ Queue a log message.
+
+        Args:
+            message: The message to log.
+
+        """
+        now = time.time()
+        with self.lock:
+            repeat = self.repeats.get(message)
+            if repeat is not None:
+                repeat[0] += 1
+                return
+            self.repeats[message] = [1, now]
+            if len(self.queue) >= self.capacity:
+                self.queue.popleft()
+                self.dropped += 1
+            self.queue.append((message, int(now)))
+
+    def flush(self, final=False):
+        """ Write queued messages and the summaries of ended coalesce windows to the database.
+
+        Args:
+            final: Write the summaries of every coalesce window, also those which did not end yet.
+
+        """
+        now = time.time()
+        with self.lock:
+            messages = list(self.queue)
+            self.queue.clear()
+            for message, (count, first) in list(self.repeats.items()):
+                if final or now - first >= self.window:
+                    del self.repeats[message]
+                    if count > 1:
+                        messages.append(('{m} x {c} in last {w}s'.format(m=message, c=count, w=self.window),
+                                         int(now)))
+            if self.dropped:
+                messages.append(('{d} log messages dropped.'.format(d=self.dropped), int(now)))
+                self.dropped = 0
+
+        if messages:
+            self.db.insert_log_messages(messages)
+
+    def run(self):
+        """ Write to the database every interval until the sink is stopped. """
+        while not self.stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                # Logging must never stop the backend, try again next interval.
+                pass
+
+
+default_sink = None
+default_sink_lock = threading.Lock()
+
+
+def get_sink():
+    """ Get the log sink shared by the whole process, starting it on first use.
+
+    Returns:
+        sink: The started LogSink.
+
+    """
+    global default_sink
+    with default_sink_lock:
+        if default_sink is None:
+            default_sink = LogSink()
+            default_sink.start()
+            atexit.register(default_sink.stop)
+        return default_sink
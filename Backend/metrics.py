@@ -0,0 +1,204 @@
+import bisect
+import functools
+import os
+import threading
+import time
+
+# Metrics are collected when the SUNROLER_METRICS environment variable is set. When it is not set, timed()
+# returns the functions it decorates unchanged and every other function returns at once, so the hot path
+# has no overhead at all.
+enabled = os.environ.get('SUNROLER_METRICS', '') not in ('', '0')
+port = int(os.environ.get('SUNROLER_METRICS_PORT', 9100))
+
+# Upper bounds in seconds of the buckets of every histogram.
+BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def label_text(labels):
+    """ Format labels like Prometheus does, for instance {view="sensors"}. """
+    if not labels:
+        return ''
+    return '{' + ','.join('{k}="{v}"'.format(k=k, v=v) for k, v in sorted(labels.items())) + '}'
+
+
+class Counter:
+    """ Count events. """
+
+    def __init__(self):
+        """ Initialize counter at zero """
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        """ Increase the counter. """
+        with self.lock:
+            self.value += amount
+
+    def render(self, name, labels):
+        """ Get the lines of the counter in the Prometheus text format. """
+        return ['{n}{l} {v}'.format(n=name, l=label_text(labels), v=self.value)]
+
+
+class Histogram:
+    """ Count observed durations per bucket, with their total. """
+
+    def __init__(self):
+        """ Initialize histogram with empty buckets """
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        """ Count a duration in seconds. """
+        index = bisect.bisect_left(BUCKETS, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def render(self, name, labels):
+        """ Get the lines of the histogram in the Prometheus text format. """
+        lines = []
+        total = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), self.counts):
+            total += count
+            lines.append('{n}_bucket{l} {c}'.format(n=name, l=label_text(dict(labels, le=bound)), c=total))
+        lines.append('{n}_sum{l} {s}'.format(n=name, l=label_text(labels), s=self.sum))
+        lines.append('{n}_count{l} {c}'.format(n=name, l=label_text(labels), c=total))
+        return lines
+
+
+class Gauge:
+    """ Report a current value, like a queue depth, read from a function when the metrics are rendered. """
+
+    def __init__(self, function):
+        """ Initialize gauge with the function returning its value """
+        self.function = function
+
+    def render(self, name, labels):
+        """ Get the lines of the gauge in the Prometheus text format. """
+        return ['{n}{l} {v}'.format(n=name, l=label_text(labels), v=self.function())]
+
+
+class Registry:
+    """ Keep every metric by name and labels and render them in the Prometheus text format. """
+
+    def __init__(self):
+        """ Initialize an empty registry """
+        self.metrics = {}
+        self.help = {}
+        self.lock = threading.Lock()
+
+    def get(self, kind, name, help_text, labels, *args):
+        """ Get a metric by name and labels, creating it with the arguments given on first use. """
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.get(key)
+                if metric is None:
+                    metric = self.metrics[key] = kind(*args)
+                    self.help[name] = (help_text, kind.__name__.lower())
+        return metric
+
+    def render(self):
+        """ Get every metric in the Prometheus text format. """
+        lines = []
+        described = set()
+        for (name, labels), metric in sorted(self.metrics.items(), key=lambda item: item[0]):
+            if name not in described:
+                described.add(name)
+                help_text, kind = self.help[name]
+                lines.append('# HELP {n} {h}'.format(n=name, h=help_text))
+                lines.append('# TYPE {n} {k}'.format(n=name, k=kind))
+            lines.extend(metric.render(name, dict(labels)))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def counter(name, help_text, **labels):
+    """ Get a counter, creating it on first use. """
+    return registry.get(Counter, name, help_text, labels)
+
+
+def histogram(name, help_text, **labels):
+    """ Get a histogram of durations in seconds, creating it on first use. """
+    return registry.get(Histogram, name, help_text, labels)
+
+
+def gauge(name, help_text, function, **labels):
+    """ Report the value returned by a function as a gauge, when metrics are enabled. """
+    if enabled:
+        registry.get(Gauge, name, help_text, labels, function).function = function
+
+
+def inc(name, help_text, amount=1, **labels):
+    """ Increase a counter, when metrics are enabled. """
+    if enabled:
+        counter(name, help_text, **labels).inc(amount)
+
+
+def observe(name, help_text, value, **labels):
+    """ Observe a duration in seconds in a histogram, when metrics are enabled. """
+    if enabled:
+        histogram(name, help_text, **labels).observe(value)
+
+
+def timed(name, help_text, **labels):
+    """ Decorate a function to observe its duration in a histogram.
+
+    When metrics are disabled the function is returned unchanged.
+
+    """
+    def decorate(function):
+        if not enabled:
+            return function
+        observed = histogram(name, help_text, **labels)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observed.observe(time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+
+def serve(metrics_port=None):
+    """ Serve the metrics on localhost from a background thread, when metrics are enabled.
+
+    Args:
+        metrics_port: The port to listen on, the SUNROLER_METRICS_PORT environment variable when omitted.
+
+    """
+    if not enabled:
+        return None
+
+    # Imported here, so a process without metrics does not spend its startup time on loading an HTTP server.
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        """ Answer GET /metrics with every metric in the Prometheus text format. """
+
+        def do_GET(self):
+            """ Send the metrics. """
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            """ Do not log every request. """
+            pass
+
+    server = HTTPServer(('127.0.0.1', metrics_port or port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import struct
+
+# Events of a directory which can make a serial port appear or become accessible: a device node or link
+# created in it, moved into it, or given other permissions, like udev does after creating the node.
+IN_ATTRIB = 0x4
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+WATCH_EVENTS = IN_ATTRIB | IN_MOVED_TO | IN_CREATE
+
+# Event sent when a watch was removed, because its directory was removed, and the header of every event
+# of watch descriptor, event mask, cookie and length of the name following it.
+IN_IGNORED = 0x8000
+EVENT = struct.Struct('iIII')
+
+
+class PortWatcher:
+    """ Wait for serial ports to appear, like USB adapters found by udev after a power cut.
+
+    The directories of the ports are watched with inotify, so a waiting port costs no CPU at all and is
+    connected as soon as its device node appears. Where inotify is not available, the port is checked at
+    intervals which double every time, up to the timeout.
+
+    Attributes:
+        poll_interval: Number of seconds before the first check when inotify is not available.
+
+    """
+
+    def __init__(self, poll_interval=0.5):
+        """ Initialize class, inotify is set up by start() """
+        self.poll_interval = poll_interval
+        self.fd = None
+        self.libc = None
+        self.watched = {}
+        self.changed = None
+
+    def start(self):
+        """ Start watching for changes in the event loop running the ports, when inotify is available. """
+        self.changed = asyncio.Event()
+        try:
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (ImportError, OSError, AttributeError):
+            return
+        if fd < 0:
+            return
+        self.fd = fd
+        self.libc = libc
+        asyncio.get_running_loop().add_reader(fd, self.read_events)
+
+    def close(self):
+        """ Stop watching. """
+        if self.fd is not None:
+            asyncio.get_running_loop().remove_reader(self.fd)
+            os.close(self.fd)
+            self.fd = None
+            self.watched.clear()
+
+    def read_events(self):
+        """ Read every waiting inotify event and wake every waiting port to check whether it appeared. """
+        try:
+            while True:
+                data = os.read(self.fd, 4096)
+                if not data:
+                    break
+                for descriptor, mask, cookie, length in self.parse(data):
+                    if mask & IN_IGNORED:
+                        self.watched = {d: w for d, w in self.watched.items() if w != descriptor}
+        except BlockingIOError:
+            pass
+        self.changed.set()
+
+    @staticmethod
+    def parse(data):
+        """ Get the header of every event in data read from inotify. """
+        offset = 0
+        events = []
+        while offset + EVENT.size <= len(data):
+            event = EVENT.unpack_from(data, offset)
+            events.append(event)
+            offset += EVENT.size + event[3]
+        return events
+
+    def watch(self, port):
+        """ Watch the nearest existing directory of a port.
+
+        The directory of a port may not exist yet either, like /dev/serial/by-id before the first
+        adapter is found, its parent is watched then until it appears.
+
+        Args:
+            port: Path to the port.
+
+        Returns:
+            True if changes of the directory are watched.
+
+        """
+        if self.fd is None:
+            return False
+        directory = os.path.dirname(port)
+        while directory != os.path.dirname(directory) and not os.path.isdir(directory):
+            directory = os.path.dirname(directory)
+        if directory not in self.watched:
+            descriptor = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_EVENTS)
+            if descriptor < 0:
+                return False
+            self.watched[directory] = descriptor
+        return True
+
+    async def wait(self, port, timeout):
+        """ Wait until a port exists.
+
+        Args:
+            port: Path to the port. Ports which are not a path, like the URLs pyserial accepts, are not waited for.
+            timeout: Maximum number of seconds to wait.
+
+        Returns:
+            True if the port exists, False if it did not appear within the timeout.
+
+        """
+        if not os.path.isabs(port):
+            return True
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        interval = self.poll_interval
+        while True:
+            watched = self.watch(port)
+            self.changed.clear()
+            if os.path.exists(port):
+                return True
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            if watched:
+                try:
+                    await asyncio.wait_for(self.changed.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(min(interval, remaining))
+                interval *= 2
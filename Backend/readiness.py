@@ -0,0 +1,52 @@
+import os
+import socket
+import time
+
+
+def notify(*states):
+    """ Tell systemd about the state of the service, when it is started by systemd with Type=notify.
+
+    Args:
+        states: Assignments like 'READY=1' or 'STATUS=Waiting for /dev/ttyUSB0'.
+
+    Returns:
+        True if systemd was notified.
+
+    """
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return False
+    if address.startswith('@'):
+        # An abstract socket address.
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC) as sock:
+            sock.sendto('\n'.join(states).encode(), address)
+    except OSError:
+        return False
+    return True
+
+
+def uptime():
+    """ Get the number of seconds since the system booted, None when unknown. """
+    try:
+        return time.clock_gettime(time.CLOCK_BOOTTIME)
+    except (AttributeError, OSError):
+        return None
+
+
+def process_age():
+    """ Get the number of seconds since this process started, including the startup of Python itself.
+
+    Returns:
+        The age of the process, None when unknown.
+
+    """
+    booted = uptime()
+    try:
+        with open('/proc/self/stat') as f:
+            # The start time is the 22nd field, the 2nd field is the name which may contain spaces.
+            started = int(f.read().rsplit(')', 1)[1].split()[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+    return booted - started if booted is not None else None
@@ -0,0 +1,128 @@
+import array
+import collections
+
+
+class Reading(collections.namedtuple('Reading', ('sensor_id', 'sensor_value', 'screen_position', 'reading_time'))):
+    """ A single reading of a sensor.
+
+    A reading is a tuple without an instance dictionary, so it takes no more memory than a plain tuple
+    and can be handed to the database as query parameters as it is.
+
+    Attributes:
+        sensor_id: ID of sensor the value was read from.
+        sensor_value: Value of the reading.
+        screen_position: The position of the sunscreen.
+        reading_time: Time of the reading in seconds since the epoch.
+
+    """
+
+    __slots__ = ()
+
+
+class ReadingBuffer:
+    """ Ring buffer of readings, stored in preallocated arrays with one column per field.
+
+    A buffered reading takes 21 bytes in the arrays instead of a tuple and its integer objects, and
+    buffering a reading allocates no objects at all, so a full buffer gives the garbage collector
+    nothing to track.
+
+    Attributes:
+        capacity: Maximum number of readings kept in the buffer.
+
+    """
+
+    def __init__(self, capacity):
+        """ Initialize buffer with the arrays for capacity readings """
+        self.capacity = capacity
+        self.sensor_ids = array.array('I', bytes(4 * capacity))
+        self.values = array.array('q', bytes(8 * capacity))
+        self.positions = array.array('B', bytes(capacity))
+        self.times = array.array('q', bytes(8 * capacity))
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        """ Get the number of buffered readings. """
+        return self.count
+
+    def append(self, sensor_id, value, screen_pos, reading_time):
+        """ Add a reading at the end of the buffer.
+
+        Args:
+            sensor_id: ID of sensor the value was read from.
+            value: Value of the reading.
+            screen_pos: The position of the sunscreen.
+            reading_time: Time of the reading.
+
+        Raises:
+            IndexError: The buffer is full.
+
+        """
+        if self.count == self.capacity:
+            raise IndexError('reading buffer is full')
+        index = self.start + self.count
+        if index >= self.capacity:
+            index -= self.capacity
+        self.sensor_ids[index] = sensor_id
+        self.values[index] = value
+        self.positions[index] = screen_pos
+        self.times[index] = reading_time
+        self.count += 1
+
+    def take(self, count):
+        """ Remove readings from the start of the buffer.
+
+        Args:
+            count: Maximum number of readings to remove.
+
+        Returns:
+            List of at most count (sensor ID, value, screen position, reading time) tuples, oldest first.
+
+        """
+        count = min(count, self.count)
+        end = self.start + count
+        batch = list(zip(self.sensor_ids[self.start:end], self.values[self.start:end],
+                         self.positions[self.start:end], self.times[self.start:end]))
+        if end > self.capacity:
+            end -= self.capacity
+            batch.extend(zip(self.sensor_ids[:end], self.values[:end], self.positions[:end], self.times[:end]))
+        self.start = end % self.capacity
+        self.count -= count
+        return batch
+
+
+if __name__ == '__main__':
+    # Compare the memory and the objects allocated per buffered reading of a deque of tuples and a reading buffer.
+    import gc
+    import sys
+    import time
+    import tracemalloc
+
+    def fill_deque(count, base):
+        buffer = collections.deque()
+        for i in range(count):
+            buffer.append((i % 5 + 1, 100000 + i, i % 2, base + i))
+        return buffer
+
+    def fill_buffer(count, base):
+        buffer = ReadingBuffer(count)
+        for i in range(count):
+            buffer.append(i % 5 + 1, 100000 + i, i % 2, base + i)
+        return buffer
+
+    readings = 100000
+    for name, fill in (('deque of tuples', fill_deque), ('reading buffer', fill_buffer)):
+        start = time.perf_counter()
+        fill(readings, int(time.time()))
+        duration = time.perf_counter() - start
+
+        gc.collect()
+        tracemalloc.start()
+        blocks = sys.getallocatedblocks()
+        filled = fill(readings, int(time.time()))
+        blocks = sys.getallocatedblocks() - blocks
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del filled
+        print('{n}: {b:.1f} bytes and {o:.2f} objects per reading, {us:.2f} us per reading'.format(
+            n=name, b=size / readings, o=blocks / readings, us=duration / readings * 1e6))
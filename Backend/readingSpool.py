@@ -0,0 +1,259 @@
+import os
+import struct
+import threading
+import time
+import zlib
+from ingestWriter import IngestWriter
+
+# The spool starts with a header of the size of a record holding the sequence number of the last reading
+# appended before the spool was emptied, followed by records of sequence number, sensor ID, value,
+# screen position, reading time and a CRC32 of the other fields.
+HEADER = struct.Struct('<4sIQ16x')
+RECORD = struct.Struct('<QIiB3xq')
+CHECKSUM = struct.Struct('<I')
+RECORD_SIZE = RECORD.size + CHECKSUM.size
+MAGIC = b'SRSP'
+FORMAT_VERSION = 1
+
+
+class ReadingSpool:
+    """ Append-only file of readings which have not been stored in the database yet.
+
+    Readings are appended with an increasing sequence number and synced to disk in batches.
+    Every record has a checksum, so a record which was only partly written when the power failed is
+    detected when the spool is opened, and the spool is truncated at that record. The file is emptied
+    once every reading in it has been stored.
+
+    Attributes:
+        path: Path to the spool file.
+
+    """
+
+    def __init__(self, path='../Central/reading_spool.bin'):
+        """ Initialize class with the spool file, which is created when it does not exist """
+        self.path = path
+        self.lock = threading.Lock()
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.records = 0
+        self.sequence = 0
+        self.dirty = False
+        self.record = bytearray(RECORD_SIZE)
+        self.checked = memoryview(self.record)[:RECORD.size]
+
+        header = os.pread(self.fd, HEADER.size, 0)
+        if len(header) < HEADER.size or HEADER.unpack(header)[:2] != (MAGIC, FORMAT_VERSION):
+            self.reset_file()
+            return
+        self.sequence = HEADER.unpack(header)[2]
+
+        size = os.fstat(self.fd).st_size
+        count = (size - HEADER.size) // RECORD_SIZE
+        for index, (sequence, reading) in enumerate(self.read(0, count)):
+            if sequence is None:
+                count = index
+                break
+            self.sequence = sequence
+        self.records = count
+        if size != HEADER.size + count * RECORD_SIZE:
+            os.ftruncate(self.fd, HEADER.size + count * RECORD_SIZE)
+
+    def reset_file(self):
+        """ Empty the spool, keeping only the header with the last sequence number. """
+        os.ftruncate(self.fd, 0)
+        os.pwrite(self.fd, HEADER.pack(MAGIC, FORMAT_VERSION, self.sequence), 0)
+        os.fsync(self.fd)
+        self.records = 0
+
+    def append(self, sensor_id, value, screen_pos, reading_time):
+        """ Append a reading to the spool, without waiting for it to be synced to disk.
+
+        Args:
+            sensor_id: ID of sensor the value was read from.
+            value: Value of reading.
+            screen_pos: The position of the sunscreen.
+            reading_time: Time of the reading.
+
+        Returns:
+            The sequence number of the reading.
+
+        """
+        with self.lock:
+            self.sequence += 1
+            record = self.record
+            RECORD.pack_into(record, 0, self.sequence, sensor_id, value, screen_pos, reading_time)
+            CHECKSUM.pack_into(record, RECORD.size, zlib.crc32(self.checked))
+            os.pwrite(self.fd, record, HEADER.size + self.records * RECORD_SIZE)
+            self.records += 1
+            self.dirty = True
+            return self.sequence
+
+    def sync(self):
+        """ Make sure every appended reading survives a crash or power failure. """
+        if self.dirty:
+            self.dirty = False
+            os.fsync(self.fd)
+
+    def read(self, index, count):
+        """ Read records from the spool.
+
+        Args:
+            index: Index of the first record to read.
+            count: Maximum number of records to read.
+
+        Returns:
+            List of tuples of sequence number and (sensor ID, value, screen position, reading time) tuple.
+            A record with a wrong checksum ends the list, as a tuple with None as sequence number.
+
+        """
+        data = os.pread(self.fd, count * RECORD_SIZE, HEADER.size + index * RECORD_SIZE)
+        records = []
+        for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+            record = data[offset:offset + RECORD.size]
+            if CHECKSUM.unpack_from(data, offset + RECORD.size)[0] != zlib.crc32(record):
+                records.append((None, None))
+                break
+            sequence, sensor_id, value, screen_pos, reading_time = RECORD.unpack(record)
+            records.append((sequence, (sensor_id, value, screen_pos, reading_time)))
+        return records
+
+    def find(self, sequence):
+        """ Find the first record after a sequence number.
+
+        Args:
+            sequence: The sequence number of the last reading which has been stored.
+
+        Returns:
+            Index of the first record with a higher sequence number.
+
+        """
+        with self.lock:
+            self.sequence = max(self.sequence, sequence)
+            low, high = 0, self.records
+            while low < high:
+                middle = (low + high) // 2
+                if self.read(middle, 1)[0][0] <= sequence:
+                    low = middle + 1
+                else:
+                    high = middle
+            return low
+
+    def truncate(self, index):
+        """ Empty the spool when every record has been stored.
+
+        Args:
+            index: Number of records which have been stored.
+
+        Returns:
+            True if the spool has been emptied.
+
+        """
+        with self.lock:
+            if index != self.records:
+                return False
+            self.reset_file()
+            return True
+
+    def close(self):
+        """ Close the spool file. """
+        os.close(self.fd)
+
+
+class SpoolWriter(IngestWriter):
+    """ Write sensor readings to the database through a reading spool.
+
+    Readings are appended to the spool, so adding a reading never waits for the database. The writer
+    thread stores the readings in the spool in batches, syncing the spool to disk first, and stores the
+    sequence number of the last reading of a batch in the same transaction. A batch which fails, for
+    instance because another process holds a lock on the database, is retried until it succeeds.
+    After a crash the readings in the spool which have not been stored yet are stored when the writer
+    is started again, every reading exactly once.
+
+    Attributes:
+        spool: The ReadingSpool the readings are appended to.
+        position: Index in the spool of the first reading which has not been stored yet, None until
+            it has been looked up with the sequence number stored in the database.
+        truncate_records: Number of records after which the spool is emptied, once they have been stored.
+
+    """
+
+    def __init__(self, db=None, spool=None, max_batch=500, max_latency=0.25, truncate_records=4096):
+        """ Initialize class with the reading spool, the default spool is opened when omitted """
+        super().__init__(db, max_batch, max_latency, capacity=0)
+        self.spool = spool if spool is not None else ReadingSpool()
+        self.truncate_records = truncate_records
+        self.position = None
+        # Sequence number of the last reading counted in self.failed, so a batch which is retried is counted once.
+        self.failed_sequence = 0
+
+    def recover(self):
+        """ Find the first reading in the spool which has not been stored yet, left by a previous run. """
+        if self.position is None:
+            self.position = self.spool.find(self.db.select_spool_sequence())
+
+    def start(self):
+        """ Find the readings in the spool which have not been stored yet and start the writer thread. """
+        self.recover()
+        super().start()
+
+    def backlog(self):
+        """ Get the number of readings in the spool which have not been stored yet. """
+        return self.spool.records - (self.position or 0)
+
+    def put(self, sensor_id, value, screen_pos, reading_time=None, timeout=None):
+        """ Append a reading to the spool.
+
+        Args:
+            sensor_id: ID of sensor the value was read from.
+            value: Value of reading to store.
+            screen_pos: The position of the sunscreen.
+            reading_time: Time of the reading, defaults to now.
+            timeout: Unused, appending to the spool does not wait for the database.
+
+        Returns:
+            True, since the reading is always spooled.
+
+        """
+        if reading_time is None:
+            reading_time = int(time.time())
+        self.recover()
+        self.spool.append(sensor_id, value, screen_pos, reading_time)
+        if self.backlog() >= self.max_batch:
+            with self.condition:
+                self.condition.notify_all()
+        if not self.running:
+            self.flush()
+        return True
+
+    def take(self):
+        """ Read the next batch of readings from the spool, which stay in the spool until written.
+
+        Returns:
+            List of at most max_batch tuples of sequence number and reading.
+
+        """
+        self.recover()
+        return self.spool.read(self.position, min(self.max_batch, self.backlog()))
+
+    def write(self, batch):
+        """ Sync the spool and write a batch of readings to the database with its last sequence number.
+
+        Args:
+            batch: List of tuples of sequence number and (sensor ID, value, screen position, reading time) tuple.
+
+        """
+        if not batch:
+            return
+        self.spool.sync()
+        if batch[0][0] <= self.failed_sequence:
+            self.retries += 1
+        try:
+            self.db.insert_sensor_values([reading for sequence, reading in batch], batch[-1][0])
+        except Exception:
+            self.failed += sum(1 for sequence, reading in batch if sequence > self.failed_sequence)
+            self.failed_sequence = max(self.failed_sequence, batch[-1][0])
+            raise
+        self.written += len(batch)
+        with self.condition:
+            self.position += len(batch)
+            if self.position >= self.truncate_records and self.spool.truncate(self.position):
+                self.position = 0
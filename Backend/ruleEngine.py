@@ -0,0 +1,200 @@
+import time
+
+# Positions of the sunscreen, as reported by the control units.
+ROLLED_IN = 0
+ROLLED_OUT = 1
+
+# Default behaviour per kind of sensor: priority of the rule, and the position wanted when the value is
+# above the maximum value and below the minimum value. A rule with a higher priority overrides every rule
+# with a lower priority, so strong wind or rain rolls the sunscreens in whatever the light or temperature.
+DEFAULT_RULES = {
+    'anemometer': (10, ROLLED_IN, None),
+    'rain': (10, ROLLED_IN, None),
+}
+DEFAULT_RULE = (0, ROLLED_OUT, ROLLED_IN)
+
+
+class Rule:
+    """ Decide the wanted position of the sunscreens based on the value of a single sensor.
+
+    Above the maximum value the rule wants the above position, below the minimum value the below
+    position. In between the rule keeps what it wanted before, so the band between the minimum and
+    maximum value acts as hysteresis. A change is only taken over once it has been wanted for the
+    debounce time.
+
+    Attributes:
+        sensor_id: ID of the sensor the rule is about.
+        priority: Rules with a higher priority override rules with a lower priority.
+        min_value: Value below which the below position is wanted.
+        max_value: Value above which the above position is wanted.
+        above: Position wanted above the maximum value, None to want nothing.
+        below: Position wanted below the minimum value, None to want nothing.
+        debounce: Number of seconds a change must be wanted before it is taken over.
+
+    """
+
+    __slots__ = ('sensor_id', 'priority', 'min_value', 'max_value', 'above', 'below', 'debounce',
+                 'vote', 'pending', 'pending_since')
+
+    def __init__(self, sensor_id, priority, min_value, max_value, above, below, debounce=0):
+        """ Initialize rule without a wanted position """
+        self.sensor_id = sensor_id
+        self.priority = priority
+        self.min_value = min_value
+        self.max_value = max_value
+        self.above = above
+        self.below = below
+        self.debounce = debounce
+        self.vote = None
+        self.pending = None
+        self.pending_since = 0.0
+
+    def update(self, value, now):
+        """ Update the wanted position with a new value of the sensor.
+
+        Args:
+            value: New value of the sensor.
+            now: Monotonic time of the value.
+
+        Returns:
+            True if the wanted position changed.
+
+        """
+        if value > self.max_value:
+            wanted = self.above
+        elif value < self.min_value:
+            wanted = self.below
+        else:
+            wanted = self.vote
+
+        if wanted == self.vote:
+            self.pending = None
+            return False
+
+        if wanted != self.pending:
+            self.pending = wanted
+            self.pending_since = now
+        if now - self.pending_since < self.debounce:
+            return False
+
+        self.vote = wanted
+        self.pending = None
+        return True
+
+
+class RuleEngine:
+    """ Decide the wanted position of the sunscreens based on the values of every sensor.
+
+    The rules are compiled once from the sensor settings into a plan ordered by priority and compiled
+    again only when the settings change. A new value only updates the rule of its sensor, and decisions
+    are only recomputed when a rule changed what it wants.
+    Every screen is controlled by the rules of its own sensors and by every rule with a priority above
+    zero, so one anemometer can roll in every sunscreen.
+
+    Attributes:
+        settings: The SettingsCache to compile the rules from.
+
+    """
+
+    def __init__(self, settings):
+        """ Initialize class with the settings to compile the rules from, rules are compiled on first use """
+        self.settings = settings
+        self.version = None
+        self.rules = {}
+        self.plan = []
+        self.overrides = []
+        self.generation = 0
+        self.decisions = {}
+
+    def compile(self):
+        """ Compile the rules of every sensor in the settings into a plan ordered by priority.
+
+        Sensors with both a minimum and maximum value of zero have no rule.
+
+        """
+        previous = self.rules
+        rules = {}
+        for sensor_id in self.settings.sensor_ids():
+            min_value = self.settings.get(sensor_id, 'min_value', 0)
+            max_value = self.settings.get(sensor_id, 'max_value', 0)
+            if min_value == 0 and max_value == 0:
+                continue
+            priority, above, below = DEFAULT_RULES.get(self.settings.sensors().get(sensor_id).kind, DEFAULT_RULE)
+            rule = Rule(sensor_id, self.settings.get(sensor_id, 'priority', priority), min_value, max_value,
+                        above, below, self.settings.get(sensor_id, 'debounce', 0))
+            if sensor_id in previous:
+                rule.vote = previous[sensor_id].vote
+            rules[sensor_id] = rule
+
+        self.rules = rules
+        self.plan = sorted(rules.values(), key=lambda r: -r.priority)
+        self.overrides = [rule for rule in self.plan if rule.priority > 0]
+        self.version = self.settings.version
+        self.changed()
+
+    def changed(self):
+        """ Forget every decision, since what a rule wants has changed. """
+        self.generation += 1
+        self.decisions.clear()
+
+    def update(self, sensor_id, value, now=None):
+        """ Update the rule of a sensor with a new value.
+
+        Args:
+            sensor_id: ID of the sensor the value was read from.
+            value: New value of the sensor.
+            now: Monotonic time of the value, defaults to now.
+
+        """
+        self.settings.refresh()
+        if self.version != self.settings.version:
+            self.compile()
+
+        rule = self.rules.get(sensor_id)
+        if rule is not None and rule.update(value, time.monotonic() if now is None else now):
+            self.changed()
+
+    def decide(self, sensor_ids):
+        """ Decide the wanted position of a screen.
+
+        Args:
+            sensor_ids: IDs of the sensors of the screen.
+
+        Returns:
+            The wanted position, or None if no rule wants anything.
+
+        """
+        key = frozenset(sensor_ids)
+        if key in self.decisions:
+            return self.decisions[key]
+
+        decision = None
+        priority = None
+        for rule in self.plan:
+            if priority is not None and rule.priority < priority:
+                break
+            if rule.vote is None or (rule.priority <= 0 and rule.sensor_id not in key):
+                continue
+            # Rolling in is the safe choice when rules of the same priority disagree.
+            if decision is None or rule.vote == ROLLED_IN:
+                decision = rule.vote
+            priority = rule.priority
+
+        self.decisions[key] = decision
+        return decision
+
+    def sync(self, state):
+        """ Update the overriding rules with the last values in the state store.
+
+        Args:
+            state: The StateStore holding the last value of every sensor.
+
+        """
+        self.settings.refresh()
+        if self.version != self.settings.version:
+            self.compile()
+
+        for rule in self.overrides:
+            last = state.get(rule.sensor_id)
+            if last is not None:
+                self.update(rule.sensor_id, last[0])
@@ -1,6 +1,18 @@
+import functools
+import sys
+import time
+import metrics
 from serial import SerialException, SerialTimeoutException
+from commandScheduler import CommandScheduler
 from database import DB
+from frameDecoder import FrameDecoder
+from ingestWriter import IngestWriter
+from reading import Reading
+from ruleEngine import ROLLED_IN, ROLLED_OUT, RuleEngine
+from sensorRegistry import DEFAULT_SENSORS
 from serialCom import SC
+from settingsCache import SettingsCache
+from stateStore import StateStore
 
 
 class Control:
@@ -13,16 +25,34 @@ class Control:
         port: The port to use to connect to the device.
         baud_rate: The baud rate to use on the connection.
         timeout: The timeout value to use on the connection.
+        writer: The IngestWriter to store readings with, a writer of its own is started when omitted.
+        settings: The SettingsCache to read sensor settings from, a cache of its own is created when omitted.
+        state: The StateStore to share the last state of the sensors with, the default store is used when omitted.
+        rules: The RuleEngine deciding the position of the sunscreen, an engine of its own is created when omitted.
+        commands: The CommandScheduler sending commands to the control unit.
 
     """
 
-    def __init__(self, port, baud_rate=19200, timeout=0):
+    def __init__(self, port, baud_rate=19200, timeout=0, writer=None, settings=None, state=None, rules=None):
         """ Initialize class with serial connection object, open the serial connection and create DB object """
         self.ser = SC(port, baud_rate, timeout=timeout)
         self.conn = self.ser.open()
         self.sensor_id = 0
-        self.frames = []
         self.db = DB()
+        if writer is None:
+            writer = IngestWriter(self.db)
+            writer.start()
+        self.writer = writer
+        self.settings = settings if settings is not None else SettingsCache(self.db)
+        self.state = state if state is not None else StateStore()
+        self.rules = rules if rules is not None else RuleEngine(self.settings)
+        self.sensor_ids = set()
+        self.commands = CommandScheduler(self.send_data, self.ser.log)
+        self.registry = self.settings.sensors()
+        self.decoder = FrameDecoder(self.registry.ids() or DEFAULT_SENSORS)
+        for name in ('frames', 'bad_bytes', 'resyncs', 'discarded'):
+            metrics.gauge('sunroler_decoder_' + name, 'Decoder counter ' + name + ' of the current connection',
+                          functools.partial(getattr, self.decoder, name), port=port)
 
     def set_sensor_id(self, sensor_id):
         """ Set the sensor ID instance variable.
@@ -42,41 +72,69 @@ class Control:
         """
         return self.sensor_id
 
+    @metrics.timed('sunroler_serial_read_seconds', 'Duration of reading and processing the waiting bytes')
     def read_data(self):
         """ Read data from the control unit.
 
-        Data is split up in frames. The frames are being put in a list.
-        When five frames are received, extract sensor ID, sunscreen position and sensor values from list
-        and convert to integers. Insert received values in database.
+        Read every byte waiting on the serial port at once and process it.
 
         Raises:
-            ValueError: There has not been any data send from the control unit.
             SerialTimeoutException: A timeout has occurred during reading of the serial port.
 
         """
         try:
-            frame = self.conn.read()
-            try:
-                if frame.hex() != '':
-                    self.frames.append(frame.hex())
-                if len(self.frames) == 6:
-                    sensor_id = int(self.frames.pop(0), 16)
-                    screen_pos = int(self.frames.pop(0), 16)
-                    sensor_value = int(''.join(self.frames), 16)
-                    self.db.insert_sensor_value(sensor_id, sensor_value, screen_pos)
-                    self.control_sunscreen_auto(sensor_id)
-                    self.frames.clear()
-                    self.set_sensor_id(sensor_id)
-            except ValueError:
-                # Some frames are empty. Just continue reading frames when this is the case.
-                pass
+            self.process(self.conn.read(self.conn.in_waiting or 1))
         except SerialTimeoutException:
-            self.conn.log('Timeout has occurred during read of serial port.')
+            self.ser.log('Timeout has occurred during read of serial port.')
+
+    def process(self, data):
+        """ Process data received from the control unit.
+
+        The data is decoded into readings of sensor ID, sunscreen position and sensor value, accepting
+        the IDs of the sensors currently in the sensor registry. Hand received values to the ingest writer,
+        which stores them in database, and share them through the state store.
+
+        Args:
+            data: The bytes received from the control unit.
+
+        """
+        registry = self.settings.sensors()
+        if registry is not self.registry:
+            self.registry = registry
+            self.decoder.sensor_ids = frozenset(registry.ids() or DEFAULT_SENSORS)
+
+        # A control unit sends its readings at once, so every reading in the data gets the same time.
+        reading_time = int(time.time())
+        for sensor_id, screen_pos, sensor_value in self.decoder.feed(data):
+            self.commands.confirm(screen_pos)
+            self.writer.put(sensor_id, sensor_value, screen_pos, reading_time)
+            self.state.update(sensor_id, sensor_value, screen_pos, reading_time)
+            self.set_sensor_id(sensor_id)
+            try:
+                self.control_sunscreen_auto(sensor_id, sensor_value)
+            except Exception as e:
+                # Still store the other readings of the data when a control decision fails.
+                self.ser.log('Failed to control sunscreen for sensor {s}: {e!r}'.format(s=sensor_id, e=e))
 
+    def fileno(self):
+        """ Get the file descriptor of the serial connection, to wait for data to become available.
+
+        Returns:
+            File descriptor of the serial port.
+
+        """
+        return self.conn.fileno()
+
+    def close(self):
+        """ Close the serial connection with the control unit. """
+        self.ser.close(self.conn)
+
+    @metrics.timed('sunroler_send_seconds', 'Duration of sending a byte to a control unit')
     def send_data(self, data):
         """ Send data to control unit.
 
-        Encode the data to bytes and send the data to the control unit.
+        Encode the data to bytes and send the data to the control unit. Commands are sent through
+        the command scheduler instead, which calls this function when the control unit can take them.
 
         Args:
             data: The data to send to the control unit.
@@ -89,35 +147,54 @@ class Control:
             self.conn.write(data.to_bytes(1, byteorder='big'))
 
         except SerialException:
-            self.conn.log("Couldn't control sunscreen.")
+            self.ser.log("Couldn't control sunscreen.")
+
+    def last_reading(self, sensor_id):
+        """ Get the last sensor value and screen position of a sensor.
+
+        The state store is used, the database only when the state store does not know the sensor yet.
 
-    def control_sunscreen_auto(self, sensor_id):
+        Args:
+            sensor_id: The ID of the sensor to get the last reading of.
+
+        Returns:
+            The last Reading of the sensor, with zero value and screen position when it has no readings.
+
+        """
+        state = self.state.get(sensor_id)
+        if state is not None:
+            return Reading(sensor_id, *state)
+        return self.db.select_last_sensor_value(sensor_id)
+
+    @metrics.timed('sunroler_control_seconds', 'Duration of a control decision', mode='auto')
+    def control_sunscreen_auto(self, sensor_id, value=None):
         """ Check whether sunscreen need to be rolled in or rolled out
             and send roll in or roll out distance to control unit.
 
+        The rule engine decides the wanted position based on the sensors of this control unit and on
+        the sensors overriding every sunscreen. The command scheduler drops the command when the sunscreen
+        already is in the wanted position, and keeps the control unit alive.
+
         Args:
             sensor_id: The ID of the sensor of which to control the sunscreens of.
+            value: The value just read from the sensor, the last known value is looked up when omitted.
 
         """
-        roll_out_distance = self.db.select_sensor_setting(0, "roll_out_distance")
-        roll_in_distance = self.db.select_sensor_setting(0, "roll_in_distance")
-
-        last_reading = self.db.select_last_sensor_value(sensor_id)
+        if value is None:
+            value = self.last_reading(sensor_id).sensor_value
 
-        sensor_min_value = self.db.select_sensor_setting(sensor_id, "min_value")
-        sensor_max_value = self.db.select_sensor_setting(sensor_id, "max_value")
+        self.sensor_ids.add(sensor_id)
+        self.rules.update(sensor_id, value)
+        wanted = self.rules.decide(self.sensor_ids)
 
-        if last_reading[0] < int(sensor_min_value[0]):
-            if last_reading[1] == 0:
-                self.send_data(255)
-            else:
-                self.send_data(int(roll_in_distance[0]))
-        elif last_reading[0] > int(sensor_max_value[0]):
-            if last_reading[1] == 1:
-                self.send_data(255)
-            else:
-                self.send_data(int(roll_out_distance[0]))
+        if wanted is None:
+            return
+        if wanted == ROLLED_IN:
+            self.commands.request(ROLLED_IN, self.settings.get(0, "roll_in_distance"))
+        else:
+            self.commands.request(ROLLED_OUT, self.settings.get(0, "roll_out_distance"))
 
+    @metrics.timed('sunroler_control_seconds', 'Duration of a control decision', mode='manual')
     def control_sunscreen_manual(self, sensor_id):
         """ Control sunscreen manually.
 
@@ -125,41 +202,23 @@ class Control:
             sensor_id: The ID of the sensor of which to control the sunscreens of.
 
         """
-        roll_out_distance = self.db.select_sensor_setting(0, "roll_out_distance")
-        roll_in_distance = self.db.select_sensor_setting(0, "roll_in_distance")
+        roll_out_distance = self.settings.get(0, "roll_out_distance")
+        roll_in_distance = self.settings.get(0, "roll_in_distance")
 
-        position_up = self.db.select_sensor_setting(sensor_id, "motor_override_up")
-        position_down = self.db.select_sensor_setting(sensor_id, "motor_override_down")
+        position_up = self.settings.get(sensor_id, "motor_override_up")
+        position_down = self.settings.get(sensor_id, "motor_override_down")
 
-        last_position = self.db.select_last_sensor_value(sensor_id)
+        last_position = self.last_reading(sensor_id).screen_position
 
-        if (position_down[0] == 1) and (last_position[1] == 1):
-            self.send_data(int(roll_in_distance[0]))
-        elif (position_up[0] == 1) and (last_position[1] == 0):
-            self.send_data(int(roll_out_distance[0]))
+        if (position_down == 1) and (last_position == 1):
+            self.commands.request(ROLLED_IN, roll_in_distance)
+        elif (position_up == 1) and (last_position == 0):
+            self.commands.request(ROLLED_OUT, roll_out_distance)
+        else:
+            self.commands.poll()
 
 
 if __name__ == '__main__':
-
-    # Try to make a connection with the sensors and read the data which is being sent.
-    while True:
-        try:
-            s1 = Control("/dev/ttyUSB0")
-            s2 = Control("/dev/ttyUSB1")
-
-        # If connection fails, try to connect again.
-        except SerialException:
-            continue
-        break
-
-    while True:
-        s1.read_data()
-        s2.read_data()
-
-        # Check if user wants to roll in or roll out the sunscreen manually
-
-        if s1.get_sensor_id() != 0:
-            s1.control_sunscreen_manual(s1.get_sensor_id())
-
-        if s2.get_sensor_id() != 0:
-            s2.control_sunscreen_manual(s2.get_sensor_id())
+    # Read the data sent by the sensors on the ports given as arguments.
+    from ingestService import main
+    main(sys.argv[1:])
@@ -0,0 +1,132 @@
+# Properties of every kind of sensor, used for the sensors which do not set them in their settings.
+# A sensor of a kind which is not listed here gets the properties of GENERIC_KIND.
+KINDS = {
+    'anemometer': {'unit': 'm/s'},
+    'rain': {'unit': ''},
+    'temperature': {'unit': '℃'},
+    'humidity': {'unit': '%'},
+    'light': {'unit': 'lx'},
+}
+GENERIC_KIND = {'unit': ''}
+
+# Sensors created in a new database, by ID with their name, minimum value and maximum value.
+DEFAULT_SENSORS = {
+    1: ('anemometer', 0, 0),
+    2: ('rain', 0, 0),
+    3: ('temperature', 20, 25),
+    4: ('humidity', 0, 0),
+    5: ('light', 150, 250),
+}
+
+
+def number(value, default):
+    """ Convert a setting value, stored as text or already converted, to a number.
+
+    Args:
+        value: The setting value, None when the setting does not exist.
+        default: Value to return when the setting does not exist or is not a number.
+
+    Returns:
+        The value as integer when it is a whole number, else as float.
+
+    """
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    return int(value) if value.is_integer() else value
+
+
+class Sensor:
+    """ Description of a single sensor.
+
+    Attributes:
+        id: ID of the sensor, sent by the control unit in every reading.
+        name: Unique name of the sensor.
+        kind: Kind of the sensor, like temperature, the name of the sensor when not set.
+        unit: Unit of the converted values.
+        scale: Factor the values sent by the control unit are multiplied with.
+        offset: Number added to the values after scaling.
+        min_value: Value below which the sunscreen moves, in the values sent by the control unit.
+        max_value: Value above which the sunscreen moves, in the values sent by the control unit.
+
+    """
+
+    __slots__ = ('id', 'name', 'kind', 'unit', 'scale', 'offset', 'min_value', 'max_value')
+
+    def __init__(self, sensor_id, settings):
+        """ Initialize sensor from its settings by name """
+        self.id = sensor_id
+        self.name = str(settings['sensor_name'])
+        self.kind = str(settings.get('kind') or self.name)
+        self.unit = str(settings.get('unit', KINDS.get(self.kind, GENERIC_KIND)['unit']))
+        self.scale = number(settings.get('scale'), 1)
+        self.offset = number(settings.get('offset'), 0)
+        self.min_value = number(settings.get('min_value'), 0)
+        self.max_value = number(settings.get('max_value'), 0)
+
+    def convert(self, value):
+        """ Convert a value sent by the control unit to the unit of the sensor.
+
+        Args:
+            value: The value sent by the control unit.
+
+        Returns:
+            The converted value.
+
+        """
+        if self.scale == 1 and self.offset == 0:
+            return value
+        return value * self.scale + self.offset
+
+
+class SensorRegistry:
+    """ Every sensor known from the settings, by ID and by name.
+
+    A registry is built once from the settings and does not change, build a new one when the
+    settings change.
+
+    Attributes:
+        sensors: Dictionary of every sensor by ID.
+        names: Dictionary of every sensor by name.
+
+    """
+
+    def __init__(self, settings=()):
+        """ Initialize registry from sensor settings
+
+        Args:
+            settings: Iterable of tuples of sensor ID, setting name and setting value. Every sensor with
+                a 'sensor_name' setting is registered.
+
+        """
+        by_sensor = {}
+        for sensor_id, name, value in settings:
+            by_sensor.setdefault(sensor_id, {})[name] = value
+        self.sensors = {sensor_id: Sensor(sensor_id, values)
+                        for sensor_id, values in sorted(by_sensor.items()) if values.get('sensor_name')}
+        self.names = {sensor.name: sensor for sensor in self.sensors.values()}
+
+    def __iter__(self):
+        """ Iterate over every sensor, ordered by ID. """
+        return iter(self.sensors.values())
+
+    def __len__(self):
+        """ Get the number of sensors. """
+        return len(self.sensors)
+
+    def get(self, sensor_id):
+        """ Get a sensor by ID, None when it is unknown. """
+        return self.sensors.get(sensor_id)
+
+    def find(self, name):
+        """ Get a sensor by name, None when it is unknown. """
+        return self.names.get(name)
+
+    def of_kind(self, kind):
+        """ Get every sensor of a kind, ordered by ID. """
+        return [sensor for sensor in self.sensors.values() if sensor.kind == kind]
+
+    def ids(self):
+        """ Get the IDs of every sensor. """
+        return set(self.sensors)
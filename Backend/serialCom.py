@@ -1,4 +1,4 @@
-from database import DB
+from logSink import get_sink
 from serial import SerialException
 import serial
 
@@ -13,15 +13,16 @@ class SC:
         port: The port to use to connect to the device.
         baud_rate: The baud rate to use on the connection.
         timeout: The timeout value to use on the connection.
+        sink: The LogSink to log messages to, the sink shared by the process is used when omitted.
 
     """
 
-    def __init__(self, port, baud_rate=19200, timeout=0):
-        """ Initialize class with serial connection information and create DB object """
+    def __init__(self, port, baud_rate=19200, timeout=0, sink=None):
+        """ Initialize class with serial connection information and the log sink """
         self.port = port
         self.baud_rate = baud_rate
         self.timeout = timeout
-        self.db = DB()
+        self.sink = sink if sink is not None else get_sink()
 
     def open(self):
         """ Open a serial connection.
@@ -50,11 +51,11 @@ class SC:
         """ Log errors.
 
         Log errors occurred while opening and closing a serial connection or while
-        reading and writing values to and from the serial device. Messages are being
-        inserted in database.
+        reading and writing values to and from the serial device. Messages are handed to
+        the log sink, which inserts them in database in the background without blocking.
 
         Args:
             message: The message to log.
 
         """
-        self.db.insert_log_message(message)
+        self.sink.log(message)
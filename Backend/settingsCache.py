@@ -0,0 +1,102 @@
+import time
+import metrics
+from database import DB
+from sensorRegistry import SensorRegistry
+
+
+class SettingsCache:
+    """ Keep every sensor setting in memory.
+
+    Settings are loaded once from the 'sensor_settings' table and converted to integers where possible.
+    The settings version in the database is checked at most once per refresh interval and all settings
+    are reloaded when it has changed, so changes made in the web interface or the admin are picked up
+    within that interval. The sensors described by the settings are kept in a SensorRegistry,
+    which is rebuilt whenever the settings are reloaded.
+
+    Attributes:
+        db: DB object to load the settings from.
+        refresh_interval: Number of seconds between checks of the settings version.
+
+    """
+
+    def __init__(self, db=None, refresh_interval=1.0):
+        """ Initialize class with an empty cache, settings are loaded on first use """
+        self.db = db if db is not None else DB()
+        self.refresh_interval = refresh_interval
+        self.settings = {}
+        self.registry = SensorRegistry()
+        self.version = None
+        self.checked = 0.0
+
+    @staticmethod
+    def convert(value):
+        """ Convert a setting value stored as text to an integer when possible.
+
+        Args:
+            value: The stored setting value.
+
+        Returns:
+            The value as integer, or unchanged when it is not a number.
+
+        """
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return value
+
+    @metrics.timed('sunroler_settings_load_seconds', 'Duration of loading every setting')
+    def load(self):
+        """ Load every setting from the database. """
+        version = self.db.select_settings_version()
+        self.settings = {(sensor, name): self.convert(value)
+                         for sensor, name, value in self.db.select_sensor_settings()}
+        self.registry = SensorRegistry((sensor, name, value) for (sensor, name), value in self.settings.items())
+        self.version = version
+
+    def invalidate(self):
+        """ Force the settings to be reloaded on next use. """
+        self.version = None
+        self.checked = 0.0
+
+    def refresh(self):
+        """ Reload the settings when the refresh interval has passed and the settings version has changed. """
+        now = time.monotonic()
+        if self.version is not None and now - self.checked < self.refresh_interval:
+            return
+        self.checked = now
+        if self.version is None or self.db.select_settings_version() != self.version:
+            self.load()
+
+    def get(self, sensor_id, setting_name, default=None):
+        """ Get a setting of a sensor.
+
+        Args:
+            sensor_id: ID of sensor, 0 for settings of the sunscreen itself.
+            setting_name: Name of setting to get value of.
+            default: Value to return when the setting does not exist.
+
+        Returns:
+            The setting value.
+
+        """
+        self.refresh()
+        return self.settings.get((sensor_id, setting_name), default)
+
+    def sensors(self):
+        """ Get the registry of every known sensor.
+
+        Returns:
+            The SensorRegistry built from the current settings.
+
+        """
+        self.refresh()
+        return self.registry
+
+    def sensor_ids(self):
+        """ Get the IDs of every known sensor.
+
+        Returns:
+            Set of IDs of the sensors which have a name.
+
+        """
+        return self.sensors().ids()
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import random
+import struct
+import time
+import tty
+
+FRAME = struct.Struct('>BBI')
+
+
+class BoardSimulator:
+    """ Emulate a control unit on a pseudo terminal, so the backend can be run without hardware.
+
+    The simulator sends a reading every interval, using the same six byte frames as uart_transmit_value,
+    and handles the distances sent back like the control unit does: a distance further than the current
+    one rolls the sunscreen out, a shorter one rolls it in and 255 is a keepalive. Like the control unit
+    it only takes one byte from its receive buffer per command interval. Bytes can be dropped or
+    corrupted on purpose to test recovery.
+
+    Attributes:
+        sensor_id: The sensor ID sent in every reading.
+        interval: Average number of seconds between readings.
+        jitter: Maximum number of seconds a reading is sent earlier or later.
+        drop_rate: Chance of every byte to be dropped.
+        corrupt_rate: Chance of every byte to be replaced by a random byte.
+        command_interval: Number of seconds between two bytes taken from the receive buffer.
+        value: Function returning the value to send, the current time in milliseconds when omitted.
+        seed: Seed of the random number generator.
+
+    """
+
+    def __init__(self, sensor_id, interval=60.0, jitter=0.0, drop_rate=0.0, corrupt_rate=0.0,
+                 command_interval=5.0, value=None, seed=None):
+        """ Initialize class with a new pseudo terminal pair, the port attribute is the name to connect to """
+        self.sensor_id = sensor_id
+        self.interval = interval
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.command_interval = command_interval
+        self.value = value if value is not None else self.timestamp
+        self.random = random.Random(seed)
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+        self.received = bytearray()
+        self.distance = 10
+        self.position = 0
+        self.frames = 0
+        self.dropped = 0
+        self.corrupted = 0
+        self.commands = 0
+        self.moves = 0
+
+    @staticmethod
+    def timestamp():
+        """ Get the current time in milliseconds, within the range of values the decoder accepts.
+
+        Sending this as value allows measuring the latency until the reading is stored.
+
+        Returns:
+            The current time in milliseconds modulo 2 ** 24.
+
+        """
+        return int(time.time() * 1000) % (1 << 24)
+
+    def frame(self):
+        """ Get the bytes of the next reading, with bytes dropped or corrupted at the configured rates.
+
+        Returns:
+            The bytes to send.
+
+        """
+        data = bytearray()
+        for byte in FRAME.pack(self.sensor_id, self.position, self.value()):
+            chance = self.random.random()
+            if chance < self.drop_rate:
+                self.dropped += 1
+            elif chance < self.drop_rate + self.corrupt_rate:
+                self.corrupted += 1
+                data.append(self.random.randrange(256))
+            else:
+                data.append(byte)
+        return data
+
+    def receive(self):
+        """ Move every byte sent by the backend to the receive buffer. """
+        try:
+            self.received += os.read(self.master, 4096)
+        except BlockingIOError:
+            pass
+
+    def handle(self, command):
+        """ Handle a byte sent by the backend like the control unit does.
+
+        Args:
+            command: The byte received.
+
+        """
+        self.commands += 1
+        if command == 0 or command == 255:
+            return
+        if command > self.distance:
+            self.position = 1
+        elif command < self.distance:
+            self.position = 0
+        else:
+            return
+        self.distance = command
+        self.moves += 1
+
+    async def send(self):
+        """ Send a reading every interval. """
+        while True:
+            await asyncio.sleep(max(0.0, self.interval + self.random.uniform(-self.jitter, self.jitter)))
+            try:
+                os.write(self.master, self.frame())
+            except BlockingIOError:
+                # The backend is not reading, like a real serial line the bytes are lost.
+                self.dropped += 6
+            self.frames += 1
+
+    async def consume(self):
+        """ Take one byte from the receive buffer every command interval. """
+        while True:
+            await asyncio.sleep(self.command_interval)
+            if self.received:
+                self.handle(self.received.pop(0))
+
+    async def run(self):
+        """ Emulate the control unit until cancelled. """
+        loop = asyncio.get_running_loop()
+        loop.add_reader(self.master, self.receive)
+        try:
+            await asyncio.gather(self.send(), self.consume())
+        finally:
+            loop.remove_reader(self.master)
+
+    def counters(self):
+        """ Get the simulator counters.
+
+        Returns:
+            Dictionary with the number of frames sent, bytes dropped and corrupted, commands received and moves.
+
+        """
+        return {'frames': self.frames, 'dropped': self.dropped, 'corrupted': self.corrupted,
+                'commands': self.commands, 'moves': self.moves}
+
+    def close(self):
+        """ Close the pseudo terminal pair. """
+        os.close(self.master)
+        os.close(self.slave)
+
+
+async def run_boards(boards, duration=None):
+    """ Emulate control units until cancelled or until the duration has passed.
+
+    Args:
+        boards: List of BoardSimulator objects.
+        duration: Number of seconds to run, forever when omitted.
+
+    """
+    tasks = [asyncio.ensure_future(board.run()) for board in boards]
+    try:
+        await asyncio.wait_for(asyncio.gather(*tasks), duration)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+if __name__ == '__main__':
+    # Emulate a board per sensor ID given as argument and print the ports to connect the backend to.
+    import sys
+    boards = [BoardSimulator(int(sensor_id), interval=5.0, jitter=1.0) for sensor_id in sys.argv[1:] or ['3', '5']]
+    print(' '.join(board.port for board in boards), flush=True)
+    try:
+        asyncio.run(run_boards(boards))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,119 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+
+HEADER = struct.Struct('<4sIQ')
+RECORD = struct.Struct('<IqBxxxq')
+SEQUENCE = struct.Struct('<I')
+MAGIC = b'SRST'
+FORMAT_VERSION = 1
+SLOTS = 256
+
+# Number of times a record which is being written is read again before giving up, a writer takes a few
+# microseconds, so only a writer which died halfway through a record keeps it from being read this long.
+MAX_READ_ATTEMPTS = 10000
+
+
+class StateStore:
+    """ Share the last known state of every sensor between processes through a memory mapped file.
+
+    The file holds a header with an update counter and one fixed size record per sensor ID with the
+    last value, screen position and reading time. The ingest service writes a record whenever it
+    decodes a reading, the control logic and the web interface read them without touching the database.
+    Every record has a sequence number which is odd while the record is being written, so readers can
+    detect and retry a read which overlapped with a write. Writers lock the first byte of the file, a lock
+    which is released when its process dies, so writers in several processes do not overwrite each other's
+    records or updates. A record left odd by a writer which died halfway is not returned, and is repaired by
+    the next write of the sensor.
+
+    Attributes:
+        path: Path to the state file.
+
+    """
+
+    def __init__(self, path='../Central/sensor_state.bin'):
+        """ Initialize class with the state file, which is created when it does not exist """
+        self.path = path
+        size = HEADER.size + SLOTS * RECORD.size
+        self.lock = threading.Lock()
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+        self.map = mmap.mmap(self.fd, size)
+
+        magic, version, updates = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.map[:] = bytes(size)
+            HEADER.pack_into(self.map, 0, MAGIC, FORMAT_VERSION, 0)
+
+    def update(self, sensor_id, value, screen_pos, reading_time=None):
+        """ Store the last state of a sensor.
+
+        Args:
+            sensor_id: ID of sensor to store state of.
+            value: Last value of the sensor.
+            screen_pos: Last known position of the sunscreen.
+            reading_time: Time of the reading, defaults to now.
+
+        Returns:
+            True if the state was stored, False if the sensor ID does not fit in the store.
+
+        """
+        if not 0 <= sensor_id < SLOTS:
+            return False
+        if reading_time is None:
+            reading_time = int(time.time())
+        offset = HEADER.size + sensor_id * RECORD.size
+        with self.lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, 1)
+            try:
+                # The sequence is only odd here when a writer died halfway, which this write repairs.
+                sequence = SEQUENCE.unpack_from(self.map, offset)[0] | 1
+                SEQUENCE.pack_into(self.map, offset, sequence)
+                RECORD.pack_into(self.map, offset, sequence + 1, value, screen_pos, reading_time)
+                magic, version, updates = HEADER.unpack_from(self.map, 0)
+                HEADER.pack_into(self.map, 0, magic, version, updates + 1)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, 1)
+        return True
+
+    def get(self, sensor_id):
+        """ Get the last state of a sensor.
+
+        Args:
+            sensor_id: ID of sensor to get state of.
+
+        Returns:
+            Tuple of last value, screen position and reading time, or None if no reading is known or the
+            record stayed half written, like when its writer died.
+
+        """
+        if not 0 <= sensor_id < SLOTS:
+            return None
+        offset = HEADER.size + sensor_id * RECORD.size
+        for attempt in range(MAX_READ_ATTEMPTS):
+            sequence, value, screen_pos, reading_time = RECORD.unpack_from(self.map, offset)
+            if sequence % 2 == 0 and SEQUENCE.unpack_from(self.map, offset)[0] == sequence:
+                break
+        else:
+            return None
+        if reading_time == 0:
+            return None
+        return value, screen_pos, reading_time
+
+    def updates(self):
+        """ Get the number of updates stored so far, which changes whenever any sensor state changes.
+
+        Returns:
+            The update counter.
+
+        """
+        return HEADER.unpack_from(self.map, 0)[2]
+
+    def close(self):
+        """ Close the memory map and the state file. """
+        self.map.close()
+        os.close(self.fd)
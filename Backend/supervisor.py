@@ -0,0 +1,254 @@
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import time
+import metrics
+import readiness
+from database import DB, close_pools
+from ingestWriter import IngestWriter
+from readingSpool import SpoolWriter
+
+# Seconds to wait before restarting a process which stopped unexpectedly.
+RESTART_DELAY = 1.0
+
+# Seconds a stopping writer waits for batches of workers which have not said they stopped, and seconds a
+# stopping process gets before it is killed.
+DRAIN_TIMEOUT = 2.0
+STOP_TIMEOUT = 10.0
+
+
+class QueueWriter(IngestWriter):
+    """ Buffer readings like an IngestWriter, but hand every batch to the writer process instead of the database. """
+
+    def __init__(self, batches, **kwargs):
+        """ Initialize class with the queue to hand batches to """
+        super().__init__(**kwargs)
+        self.batches = batches
+
+    def write(self, batch):
+        """ Hand a batch of readings to the writer process.
+
+        Args:
+            batch: List of (sensor ID, value, screen position, reading time) tuples.
+
+        """
+        if batch:
+            self.batches.put(batch)
+            self.written += len(batch)
+
+
+def run_writer(batches, workers, max_batch=5000, metrics_port=None):
+    """ Write batches from the worker processes to the database until stopped with SIGTERM.
+
+    The readings are appended to the reading spool, from which they are written to the database in as few
+    transactions as possible, so a locked database does not stall the workers. When stopped, the writer
+    keeps taking batches until every worker has handed over its last batch, which a worker follows with
+    a None, or until no batch arrived for the drain timeout, because a worker died without saying so.
+
+    Args:
+        batches: Queue of batches of readings.
+        workers: Number of worker processes handing batches to the queue.
+        max_batch: Maximum number of readings written in one transaction.
+        metrics_port: The port to serve the metrics of the writer on.
+
+    """
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, stop)
+    metrics.serve(metrics_port)
+    writer = SpoolWriter(DB(), max_batch=max_batch)
+    writer.start()
+    stopped = 0
+    try:
+        while True:
+            try:
+                readings = batches.get(timeout=DRAIN_TIMEOUT if stopping else RESTART_DELAY)
+            except queue.Empty:
+                if stopping:
+                    break
+                continue
+            if readings is None:
+                stopped += 1
+                if stopped >= workers and stopping:
+                    break
+                continue
+            for reading in readings:
+                writer.put(*reading)
+    finally:
+        writer.stop()
+
+
+def run_worker(ports, batches, metrics_port=None):
+    """ Read data from a shard of the ports, handing readings to the writer process.
+
+    When stopped with SIGTERM or SIGINT the buffered readings are handed over, followed by a None to
+    tell the writer process that this worker has handed over its last batch.
+
+    Args:
+        ports: The ports to read data from.
+        batches: Queue to hand batches of readings to.
+        metrics_port: The port to serve the metrics of the worker on.
+
+    """
+    import asyncio
+    from ingestService import IngestService
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    # Only the supervisor tells systemd about the state of the service.
+    os.environ.pop('NOTIFY_SOCKET', None)
+    metrics.serve(metrics_port)
+    service = IngestService(ports, writer=QueueWriter(batches))
+    stopped = False
+    try:
+        asyncio.run(service.run())
+    except KeyboardInterrupt:
+        stopped = True
+    finally:
+        service.writer.stop()
+    if stopped:
+        batches.put(None)
+
+
+class Supervisor:
+    """ Read data from many ports with one worker process per core.
+
+    The ports are divided over the workers, which each decode and batch their readings independently.
+    Every batch is handed to a single writer process, so only one process writes to the database.
+    A worker or the writer which stops unexpectedly is restarted without affecting the other processes.
+    The readings a crashed worker had buffered, at most its maximum latency of readings, are lost.
+    A writer killed by a signal has most likely died waiting for a batch while holding the lock of the
+    queue, which would block the restarted writer forever, so then the queue is replaced and every
+    worker is restarted as well, losing the batches in the old queue and the readings buffered by the
+    workers. When stopped, the workers hand over their buffered readings and the writer stores every
+    batch before it stops.
+    When metrics are enabled the writer serves them on the metrics port plus one and every worker
+    on the metrics port plus two plus the index of its shard.
+
+    Attributes:
+        ports: The ports to read data from.
+        workers: The number of worker processes, one per core when omitted.
+
+    """
+
+    def __init__(self, ports, workers=None):
+        """ Initialize class with the ports divided in shards, one for every worker """
+        self.ports = list(ports)
+        workers = workers or os.cpu_count() or 1
+        workers = max(1, min(workers, len(self.ports)))
+        self.shards = [self.ports[i::workers] for i in range(workers)]
+        self.batches = None
+        self.writer = None
+        self.processes = [None] * len(self.shards)
+        self.running = False
+
+    def start_writer(self):
+        """ Start the writer process. """
+        close_pools()
+        self.writer = multiprocessing.Process(target=run_writer,
+                                              args=(self.batches, len(self.shards), 5000, metrics.port + 1),
+                                              name='ingest-writer')
+        self.writer.start()
+
+    def start_worker(self, shard):
+        """ Start the worker process of a shard.
+
+        Args:
+            shard: Index of the shard to start the worker of.
+
+        """
+        close_pools()
+        process = multiprocessing.Process(target=run_worker,
+                                          args=(self.shards[shard], self.batches, metrics.port + 2 + shard),
+                                          name='ingest-worker-{s}'.format(s=shard))
+        process.start()
+        self.processes[shard] = process
+
+    def start_all(self):
+        """ Start the writer and every worker with a new queue of batches. """
+        self.batches = multiprocessing.Queue(maxsize=1000)
+        self.start_writer()
+        for shard in range(len(self.shards)):
+            self.start_worker(shard)
+
+    @staticmethod
+    def join(process):
+        """ Wait for a stopping process, killing it when it does not stop within the stop timeout. """
+        process.join(STOP_TIMEOUT)
+        if process.is_alive():
+            process.kill()
+            process.join()
+
+    def monitor(self):
+        """ Restart every process which stopped, until the supervisor is stopped. """
+        while self.running:
+            if not self.writer.is_alive():
+                metrics.inc('sunroler_restarts_total', 'Number of processes restarted', process='writer')
+                DB().insert_log_message('Ingest writer stopped with exit code {c}, restarting.'
+                                        .format(c=self.writer.exitcode))
+                if self.writer.exitcode < 0:
+                    # The queue cannot be trusted anymore, none of the workers can hand over their batches.
+                    for process in self.processes:
+                        process.kill()
+                        process.join()
+                    self.start_all()
+                else:
+                    self.start_writer()
+            for shard, process in enumerate(self.processes):
+                if not process.is_alive():
+                    metrics.inc('sunroler_restarts_total', 'Number of processes restarted', process='worker')
+                    DB().insert_log_message('Ingest worker for {p} stopped with exit code {c}, restarting.'
+                                            .format(p=', '.join(self.shards[shard]), c=process.exitcode))
+                    self.start_worker(shard)
+            time.sleep(RESTART_DELAY)
+
+    def run(self):
+        """ Start every process and keep them running until interrupted. """
+        DB().upgrade()
+        metrics.serve()
+        self.running = True
+        self.start_all()
+        readiness.notify('READY=1', 'STATUS=Running {w} workers for {p} ports'.format(
+            w=len(self.shards), p=len(self.ports)))
+
+        def stop(signum, frame):
+            self.running = False
+
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            self.monitor()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        """ Stop every worker, then stop the writer once it has written every batch. """
+        self.running = False
+        readiness.notify('STOPPING=1')
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                self.join(process)
+        if self.writer is not None:
+            if self.writer.is_alive():
+                self.writer.terminate()
+            self.join(self.writer)
+
+
+if __name__ == '__main__':
+    # Read the data sent by the sensors on the ports given as arguments, with the number of
+    # worker processes given by the SUNROLER_WORKERS environment variable.
+    from ingestService import DEFAULT_PORTS
+    ports = sys.argv[1:] or os.environ.get('SUNROLER_PORTS', ','.join(DEFAULT_PORTS)).split(',')
+    Supervisor(ports, int(os.environ.get('SUNROLER_WORKERS', 0))).run()
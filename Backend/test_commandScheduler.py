@@ -0,0 +1,116 @@
+import os
+import time
+import unittest
+from commandScheduler import KEEPALIVE, CommandScheduler
+from simulator import BoardSimulator
+
+
+class CommandSchedulerTest(unittest.TestCase):
+    """ Test sending commands to a simulated board, which acts on them like a control unit. """
+
+    def setUp(self):
+        """ Open a simulated board with a scheduler sending to its pseudo terminal """
+        self.board = BoardSimulator(3, seed=1)
+        self.messages = []
+        self.scheduler = CommandScheduler(self.send, log=self.messages.append, min_interval=5, ack_delay=10,
+                                          retry_interval=120, max_attempts=3, keepalive_interval=60)
+        self.scheduler.last_sent = 0
+
+    def tearDown(self):
+        """ Close both ends of the pseudo terminal """
+        os.close(self.board.master)
+        os.close(self.board.slave)
+
+    def send(self, value):
+        """ Send a byte to the board. """
+        os.write(self.board.slave, bytes([value]))
+
+    def received(self):
+        """ Get the bytes the board received since the last call. """
+        deadline = time.monotonic() + 1
+        while time.monotonic() < deadline:
+            self.board.receive()
+            if self.board.received:
+                break
+        received = bytes(self.board.received)
+        self.board.received.clear()
+        return received
+
+    def test_coalescing(self):
+        self.scheduler.confirm(0, now=0)
+        self.scheduler.request(1, 30, now=1)
+        self.scheduler.request(1, 35, now=2)
+        self.scheduler.request(1, 40, now=3)
+        self.scheduler.request(1, 40, now=4)
+        self.assertEqual(self.scheduler.coalesced, 2)
+        self.scheduler.poll(now=5)
+        self.assertEqual(self.received(), bytes([40]))
+        self.assertEqual(self.scheduler.sent, 1)
+
+    def test_request_for_current_position_is_dropped(self):
+        self.scheduler.confirm(1, now=0)
+        self.scheduler.request(0, 10, now=1)
+        self.scheduler.request(1, 30, now=2)
+        self.assertEqual(self.scheduler.coalesced, 1)
+        self.assertIsNone(self.scheduler.pending)
+        self.scheduler.poll(now=5)
+        self.assertEqual(self.scheduler.sent, 0)
+
+    def test_acknowledged_by_reading(self):
+        self.scheduler.confirm(0, now=0)
+        self.scheduler.request(1, 30, now=5)
+        for command in self.received():
+            self.board.handle(command)
+        self.assertEqual(self.board.position, 1)
+        self.scheduler.confirm(self.board.position, now=8)
+        self.assertIsNone(self.scheduler.pending)
+        self.assertEqual(self.scheduler.counters()['confirmed'], 1)
+        self.assertEqual(self.scheduler.history[-1], (1, 30, 5, 5, 8, 1))
+
+    def test_retried_until_acknowledged(self):
+        self.scheduler.confirm(0, now=0)
+        self.scheduler.request(1, 30, now=5)
+        self.assertEqual(self.received(), bytes([30]))
+        # The byte was lost, a reading within the ack delay does not send it again yet.
+        self.scheduler.confirm(0, now=10)
+        self.scheduler.poll(now=12)
+        self.assertEqual(self.scheduler.retried, 0)
+        self.scheduler.confirm(0, now=15)
+        self.scheduler.poll(now=16)
+        self.assertEqual(self.scheduler.retried, 1)
+        for command in self.received():
+            self.board.handle(command)
+        self.scheduler.confirm(self.board.position, now=20)
+        self.assertEqual(self.scheduler.counters()['confirmed'], 1)
+        self.assertEqual(self.scheduler.history[-1][-1], 2)
+
+    def test_retried_without_readings(self):
+        self.scheduler.confirm(0, now=0)
+        self.scheduler.request(1, 30, now=5)
+        self.scheduler.poll(now=100)
+        self.assertEqual(self.scheduler.retried, 0)
+        self.scheduler.poll(now=125)
+        self.assertEqual(self.scheduler.retried, 1)
+
+    def test_given_up_after_max_attempts(self):
+        self.scheduler.confirm(0, now=0)
+        self.scheduler.request(1, 30, now=5)
+        for now in (20, 35, 50):
+            self.scheduler.confirm(0, now=now)
+            self.scheduler.poll(now=now)
+        self.assertIsNone(self.scheduler.pending)
+        self.assertEqual(self.scheduler.counters()['expired'], 1)
+        self.assertEqual(self.received(), bytes([30, 30, 30]))
+        self.assertEqual(len(self.messages), 1)
+
+    def test_keepalive(self):
+        self.scheduler.poll(now=59)
+        self.assertEqual(self.scheduler.keepalives, 0)
+        self.scheduler.poll(now=60)
+        self.assertEqual(self.received(), bytes([KEEPALIVE]))
+        self.board.handle(KEEPALIVE)
+        self.assertEqual(self.board.moves, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from database import DB, ConnectionPool
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    """ Test handing out a connection per thread and closing connections of finished threads. """
+
+    def setUp(self):
+        """ Create a database in a temporary directory """
+        self.directory = tempfile.mkdtemp(prefix='sunroler-test-')
+        self.path = os.path.join(self.directory, 'db.sqlite3')
+        self.pool = ConnectionPool(self.path)
+
+    def tearDown(self):
+        """ Close the pool and remove the directory """
+        self.pool.close_all()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def in_thread(self, target):
+        """ Run a function in a new thread until it finishes. """
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+
+    def test_connection_per_thread(self):
+        conn = self.pool.acquire()
+        self.assertIs(self.pool.acquire(), conn)
+        connections = []
+        barrier = threading.Barrier(4)
+
+        def acquire():
+            connections.append(self.pool.acquire())
+            # Keep the thread alive until every thread has its connection.
+            barrier.wait()
+
+        threads = [threading.Thread(target=acquire) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(c) for c in connections + [conn]}), 5)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+
+    def test_connection_of_finished_thread_closed(self):
+        connections = []
+        self.in_thread(lambda: connections.append(self.pool.acquire()))
+        self.assertEqual(len(self.pool.connections), 1)
+        # The next connection opened prunes the connection of the finished thread.
+        self.pool.acquire()
+        self.assertEqual(len(self.pool.connections), 1)
+        with self.assertRaises(sqlite3.ProgrammingError):
+            connections[0].execute("SELECT 1")
+
+    def test_idle_connection_checked(self):
+        with mock.patch('database.time.monotonic', return_value=1000):
+            conn = self.pool.acquire()
+        conn.close()
+        # A connection used recently is handed out without a check.
+        with mock.patch('database.time.monotonic', return_value=1000 + self.pool.check_interval):
+            self.assertIs(self.pool.acquire(), conn)
+        with mock.patch('database.time.monotonic', return_value=1001 + 2 * self.pool.check_interval):
+            new = self.pool.acquire()
+        self.assertIsNot(new, conn)
+        self.assertEqual(new.execute("SELECT 1").fetchone()[0], 1)
+
+    def test_writers_in_several_threads(self):
+        db = DB(self.path)
+        db.pool = self.pool
+        db.init()
+
+        def insert():
+            for value in range(50):
+                db.insert_sensor_values([(3, value, 0, 1700000000 + value)])
+
+        threads = [threading.Thread(target=insert) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        conn, c = db.open()
+        c.execute("SELECT COUNT(*) FROM readings")
+        self.assertEqual(c.fetchone()[0], 400)
+        db.close(conn)
+
+
+if __name__ == '__main__':
+    unittest.main()
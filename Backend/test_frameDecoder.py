@@ -0,0 +1,79 @@
+import os
+import unittest
+from frameDecoder import FRAME, FrameDecoder
+from simulator import BoardSimulator
+
+
+class FrameDecoderTest(unittest.TestCase):
+    """ Test decoding readings and recovering from lost and corrupted bytes. """
+
+    def setUp(self):
+        """ Open a pseudo terminal pair of a simulated board to send the bytes through """
+        self.board = BoardSimulator(3, seed=1)
+        self.port = os.open(self.board.port, os.O_RDONLY | os.O_NONBLOCK)
+        self.decoder = FrameDecoder()
+
+    def tearDown(self):
+        """ Close both ends of the pseudo terminal """
+        os.close(self.port)
+        os.close(self.board.master)
+        os.close(self.board.slave)
+
+    def transfer(self, data, now=0):
+        """ Send bytes from the board and decode what the port receives. """
+        os.write(self.board.master, data)
+        received = bytearray()
+        while len(received) < len(data):
+            received += os.read(self.port, 4096)
+        return self.decoder.feed(bytes(received), now=now)
+
+    def test_readings(self):
+        readings = self.transfer(FRAME.pack(3, 1, 1234) + FRAME.pack(5, 0, 0xFFFFFF))
+        self.assertEqual(readings, [(3, 1, 1234), (5, 0, 0xFFFFFF)])
+        self.assertEqual(self.decoder.counters(), {'frames': 2, 'bad_bytes': 0, 'resyncs': 0, 'discarded': 0})
+
+    def test_split_reading(self):
+        data = FRAME.pack(3, 1, 1234)
+        self.assertEqual(self.transfer(data[:4]), [])
+        self.assertEqual(self.transfer(data[4:]), [(3, 1, 1234)])
+
+    def test_resync_after_dropped_byte(self):
+        data = FRAME.pack(3, 1, 1234)
+        readings = self.transfer(data[1:] + FRAME.pack(4, 0, 20) + FRAME.pack(5, 1, 300))
+        self.assertEqual(readings, [(4, 0, 20), (5, 1, 300)])
+        self.assertEqual(self.decoder.counters()['bad_bytes'], 5)
+        self.assertEqual(self.decoder.counters()['resyncs'], 1)
+
+    def test_resync_after_corrupted_byte(self):
+        data = bytearray(FRAME.pack(3, 1, 1234))
+        data[1] = 0x80
+        readings = self.transfer(bytes(data) + FRAME.pack(4, 0, 20) + FRAME.pack(5, 1, 300))
+        self.assertEqual(readings[-2:], [(4, 0, 20), (5, 1, 300)])
+        self.assertEqual(self.decoder.counters()['resyncs'], 1)
+
+    def test_partial_reading_discarded_after_gap(self):
+        self.assertEqual(self.transfer(FRAME.pack(3, 1, 1234)[:3], now=0), [])
+        self.assertEqual(self.transfer(FRAME.pack(4, 0, 20), now=5), [(4, 0, 20)])
+        self.assertEqual(self.decoder.counters()['discarded'], 3)
+        self.assertEqual(self.decoder.counters()['bad_bytes'], 0)
+
+    def test_recovers_from_simulated_line_errors(self):
+        board = BoardSimulator(3, drop_rate=0.01, corrupt_rate=0.01, value=lambda: 1000, seed=2)
+        try:
+            data = bytearray()
+            for _ in range(500):
+                data += board.frame()
+            data += FRAME.pack(3, 0, 1000) * 3
+            readings = self.transfer(bytes(data))
+        finally:
+            os.close(board.master)
+            os.close(board.slave)
+        self.assertGreater(board.dropped + board.corrupted, 0)
+        self.assertGreater(self.decoder.counters()['resyncs'], 0)
+        self.assertEqual(readings[-3:], [(3, 0, 1000)] * 3)
+        # A line error loses the reading it hit, and at most the reading after it while resyncing.
+        self.assertGreaterEqual(len(readings), 500 - 2 * (board.dropped + board.corrupted))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import threading
+import time
+import unittest
+from ingestWriter import IngestWriter
+
+
+class FlakyDB:
+    """ Store readings in a list, failing a number of times first, like a locked database. """
+
+    def __init__(self, failures=0):
+        """ Initialize with the number of failures """
+        self.failures = failures
+        self.readings = []
+        self.lock = threading.Lock()
+
+    def insert_sensor_values(self, readings):
+        """ Fail or store the readings. """
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError('database is locked')
+            self.readings.extend(readings)
+
+
+class IngestWriterTest(unittest.TestCase):
+    """ Test batching readings and retrying failed batches. """
+
+    def test_failed_batch_is_retried(self):
+        db = FlakyDB(failures=3)
+        writer = IngestWriter(db, max_batch=10, max_latency=0.01, capacity=100)
+        writer.start()
+        for value in range(25):
+            writer.put(3, value, 0, 1700000000)
+        deadline = time.monotonic() + 5
+        while writer.written < 25 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        writer.stop()
+        self.assertEqual(sorted(reading[1] for reading in db.readings), list(range(25)))
+        self.assertEqual(writer.retries, 3)
+        self.assertEqual(writer.written, 25)
+        self.assertLessEqual(writer.failed, 10)
+
+    def test_failing_batch_written_on_stop(self):
+        db = FlakyDB(failures=1000)
+        writer = IngestWriter(db, max_batch=10, max_latency=0.01, capacity=100)
+        writer.start()
+        for value in range(5):
+            writer.put(3, value, 0, 1700000000)
+        while writer.failing is None:
+            time.sleep(0.001)
+        db.failures = 0
+        writer.stop()
+        self.assertEqual([reading[1] for reading in db.readings], list(range(5)))
+
+    def test_put_without_thread_on_full_buffer(self):
+        db = FlakyDB()
+        writer = IngestWriter(db, max_batch=10, capacity=4)
+        for value in range(4):
+            writer.buffer.append(3, value, 0, 1700000000)
+        self.assertTrue(writer.put(3, 4, 0, 1700000000))
+        self.assertEqual([reading[1] for reading in db.readings], list(range(5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import unittest
+from database import DB
+from readingSpool import HEADER, RECORD_SIZE, ReadingSpool, SpoolWriter
+
+
+class FailingDB:
+    """ Forward to a DB, failing a number of times to store readings first, like a locked database. """
+
+    def __init__(self, db, failures):
+        """ Initialize with the DB to forward to and the number of failures """
+        self.db = db
+        self.failures = failures
+
+    def select_spool_sequence(self):
+        """ Select the sequence number of the last stored reading. """
+        return self.db.select_spool_sequence()
+
+    def insert_sensor_values(self, readings, spool_sequence=None):
+        """ Fail or store the readings. """
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('database is locked')
+        self.db.insert_sensor_values(readings, spool_sequence)
+
+
+class ReadingSpoolTest(unittest.TestCase):
+    """ Test recovering the spool and replaying it into the database after a crash. """
+
+    def setUp(self):
+        """ Create a database and the path of a spool in a temporary directory """
+        self.directory = tempfile.mkdtemp(prefix='sunroler-test-')
+        self.db = DB(os.path.join(self.directory, 'db.sqlite3'))
+        self.db.init()
+        self.path = os.path.join(self.directory, 'spool.bin')
+        self.spools = []
+
+    def tearDown(self):
+        """ Close every spool and remove the directory """
+        for spool in self.spools:
+            spool.close()
+        self.db.pool.close_all()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def open_spool(self):
+        """ Open the spool, like the ingest service does when it starts. """
+        spool = ReadingSpool(self.path)
+        self.spools.append(spool)
+        return spool
+
+    def stored(self):
+        """ Get the values of every stored reading, in the order they were stored. """
+        conn, c = self.db.open()
+        c.execute("SELECT sensor_value FROM readings ORDER BY ID")
+        values = [row[0] for row in c.fetchall()]
+        self.db.close(conn)
+        return values
+
+    def append(self, spool, values):
+        """ Append a reading of sensor 3 for every value. """
+        for value in values:
+            spool.append(3, value, 0, 1700000000 + value)
+
+    def test_torn_write(self):
+        spool = self.open_spool()
+        self.append(spool, range(3))
+        spool.sync()
+        # The power failed halfway through writing the fourth record.
+        with open(self.path, 'ab') as f:
+            f.write(b'\x04' * (RECORD_SIZE // 2))
+
+        spool = self.open_spool()
+        self.assertEqual(spool.records, 3)
+        self.assertEqual(os.path.getsize(self.path), HEADER.size + 3 * RECORD_SIZE)
+        self.assertEqual(spool.append(3, 3, 0, 1700000003), 4)
+        self.assertEqual([sequence for sequence, reading in spool.read(0, 10)], [1, 2, 3, 4])
+
+    def test_corrupted_record(self):
+        spool = self.open_spool()
+        self.append(spool, range(5))
+        spool.sync()
+        with open(self.path, 'r+b') as f:
+            f.seek(HEADER.size + 2 * RECORD_SIZE + 9)
+            f.write(b'\xff')
+
+        spool = self.open_spool()
+        # Records after a corrupted record cannot be trusted either.
+        self.assertEqual(spool.records, 2)
+        self.assertEqual(spool.read(0, 10)[-1][1], (3, 1, 0, 1700000001))
+
+    def test_replay_after_crash(self):
+        spool = self.open_spool()
+        writer = SpoolWriter(self.db, spool, max_batch=4)
+        self.append(spool, range(10))
+        writer.write(writer.take())
+        self.assertEqual(self.stored(), [0, 1, 2, 3])
+        # The process crashed here, before the other readings were stored.
+
+        writer = SpoolWriter(self.db, self.open_spool(), max_batch=4)
+        writer.start()
+        writer.stop()
+        self.assertEqual(self.stored(), list(range(10)))
+        self.assertEqual(writer.backlog(), 0)
+
+    def test_replay_after_emptied_spool(self):
+        writer = SpoolWriter(self.db, self.open_spool(), truncate_records=4)
+        self.append(writer.spool, range(4))
+        writer.flush()
+        self.assertEqual(os.path.getsize(self.path), HEADER.size)
+
+        spool = self.open_spool()
+        self.assertEqual(spool.append(3, 4, 0, 1700000004), 5)
+        writer = SpoolWriter(self.db, spool)
+        writer.flush()
+        self.assertEqual(self.stored(), list(range(5)))
+
+    def test_failed_batch_retried(self):
+        writer = SpoolWriter(FailingDB(self.db, 2), self.open_spool(), max_batch=10)
+        self.append(writer.spool, range(3))
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                writer.write(writer.take())
+        self.append(writer.spool, range(3, 5))
+        writer.flush()
+        self.assertEqual(self.stored(), list(range(5)))
+        self.assertEqual(writer.failed, 3)
+        self.assertEqual(writer.retries, 2)
+        self.assertEqual(writer.written, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import unittest
+from database import DB
+from ruleEngine import ROLLED_IN, ROLLED_OUT, Rule, RuleEngine
+from settingsCache import SettingsCache
+
+
+class RuleTest(unittest.TestCase):
+    """ Test the hysteresis and debounce of a single rule. """
+
+    def test_hysteresis(self):
+        rule = Rule(5, 0, 150, 250, ROLLED_OUT, ROLLED_IN)
+        self.assertFalse(rule.update(200, 0))
+        self.assertIsNone(rule.vote)
+        self.assertTrue(rule.update(251, 1))
+        self.assertEqual(rule.vote, ROLLED_OUT)
+        # Within the band the rule keeps what it wanted.
+        self.assertFalse(rule.update(150, 2))
+        self.assertFalse(rule.update(249, 3))
+        self.assertEqual(rule.vote, ROLLED_OUT)
+        self.assertTrue(rule.update(149, 4))
+        self.assertEqual(rule.vote, ROLLED_IN)
+        self.assertFalse(rule.update(250, 5))
+        self.assertEqual(rule.vote, ROLLED_IN)
+
+    def test_debounce(self):
+        rule = Rule(5, 0, 150, 250, ROLLED_OUT, ROLLED_IN, debounce=10)
+        self.assertFalse(rule.update(300, 0))
+        self.assertFalse(rule.update(300, 9))
+        self.assertIsNone(rule.vote)
+        self.assertTrue(rule.update(300, 10))
+        self.assertEqual(rule.vote, ROLLED_OUT)
+
+    def test_debounce_restarts_when_change_is_no_longer_wanted(self):
+        rule = Rule(5, 0, 150, 250, ROLLED_OUT, ROLLED_IN, debounce=10)
+        rule.update(300, 0)
+        rule.update(300, 10)
+        self.assertFalse(rule.update(100, 20))
+        # A value in the band keeps the current position, which cancels the pending change.
+        self.assertFalse(rule.update(200, 25))
+        self.assertFalse(rule.update(100, 31))
+        self.assertEqual(rule.vote, ROLLED_OUT)
+        self.assertTrue(rule.update(100, 41))
+        self.assertEqual(rule.vote, ROLLED_IN)
+
+
+class RuleEngineTest(unittest.TestCase):
+    """ Test deciding screen positions from the default sensors of a new database. """
+
+    def setUp(self):
+        """ Create a database with the default sensors and a rule for the anemometer """
+        self.directory = tempfile.mkdtemp(prefix='sunroler-test-')
+        self.db = DB(os.path.join(self.directory, 'db.sqlite3'))
+        self.db.init()
+        self.set(1, 'max_value', 10)
+        self.set(5, 'debounce', 30)
+        self.engine = RuleEngine(SettingsCache(self.db, refresh_interval=0))
+
+    def tearDown(self):
+        """ Remove the database """
+        self.db.pool.close_all()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def set(self, sensor_id, name, value):
+        """ Change or add a setting of a sensor. """
+        conn, c = self.db.open()
+        c.execute("DELETE FROM sensor_settings WHERE sensor = ? AND setting_name = ?", (sensor_id, name))
+        c.execute("INSERT INTO sensor_settings (sensor, setting_name, setting_value) VALUES (?, ?, ?)",
+                  (sensor_id, name, value))
+        self.db.close(conn)
+
+    def test_debounced_light(self):
+        self.engine.update(5, 300, now=0)
+        self.assertIsNone(self.engine.decide({5}))
+        self.engine.update(5, 300, now=30)
+        self.assertEqual(self.engine.decide({5}), ROLLED_OUT)
+        # Light is not a rule of the temperature screen.
+        self.assertIsNone(self.engine.decide({3}))
+
+    def test_wind_overrides_every_screen(self):
+        self.engine.update(3, 30, now=0)
+        self.assertEqual(self.engine.decide({3}), ROLLED_OUT)
+        self.engine.update(1, 11, now=1)
+        self.assertEqual(self.engine.decide({3}), ROLLED_IN)
+        self.assertEqual(self.engine.decide({5}), ROLLED_IN)
+
+    def test_settings_change_keeps_votes(self):
+        self.engine.update(3, 30, now=0)
+        self.set(3, 'max_value', 40)
+        self.engine.update(3, 30, now=1)
+        # 30 is now within the band, so the rule keeps rolling out.
+        self.assertEqual(self.engine.rules[3].max_value, 40)
+        self.assertEqual(self.engine.decide({3}), ROLLED_OUT)
+
+
+if __name__ == '__main__':
+    unittest.main()
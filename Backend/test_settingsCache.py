@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from database import DB
+from settingsCache import SettingsCache
+
+
+class SettingsCacheTest(unittest.TestCase):
+    """ Test picking up settings changed in the database. """
+
+    def setUp(self):
+        """ Create a database with the default settings in a temporary directory """
+        self.directory = tempfile.mkdtemp(prefix='sunroler-test-')
+        self.db = DB(os.path.join(self.directory, 'db.sqlite3'))
+        self.db.init()
+        self.cache = SettingsCache(self.db)
+
+    def tearDown(self):
+        """ Close the connections and remove the directory """
+        self.db.pool.close_all()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def change(self, sensor_id, setting_name, value):
+        """ Change a setting with SQL, like the web interface does. """
+        conn, c = self.db.open()
+        c.execute("UPDATE sensor_settings SET setting_value = ? WHERE sensor = ? AND setting_name = ?",
+                  (value, sensor_id, setting_name))
+        self.db.close(conn)
+
+    def test_change_picked_up_after_interval(self):
+        with mock.patch('settingsCache.time.monotonic', return_value=1000.0):
+            self.assertEqual(self.cache.get(5, 'max_value'), 250)
+            registry = self.cache.sensors()
+            self.assertEqual(registry.get(5).max_value, 250)
+            self.change(5, 'max_value', '300')
+            # The version is not checked again within the refresh interval.
+            self.assertEqual(self.cache.get(5, 'max_value'), 250)
+
+        with mock.patch('settingsCache.time.monotonic', return_value=1000.5):
+            self.assertEqual(self.cache.get(5, 'max_value'), 250)
+        with mock.patch('settingsCache.time.monotonic', return_value=1001.0):
+            self.assertEqual(self.cache.get(5, 'max_value'), 300)
+            self.assertIsNot(self.cache.sensors(), registry)
+            self.assertEqual(self.cache.sensors().get(5).max_value, 300)
+
+    def test_unchanged_settings_not_reloaded(self):
+        with mock.patch('settingsCache.time.monotonic', return_value=1000.0):
+            registry = self.cache.sensors()
+        with mock.patch('settingsCache.time.monotonic', return_value=1010.0):
+            self.assertIs(self.cache.sensors(), registry)
+
+    def test_invalidate(self):
+        with mock.patch('settingsCache.time.monotonic', return_value=1000.0):
+            self.cache.get(5, 'max_value')
+            self.change(5, 'max_value', '300')
+            self.cache.invalidate()
+            self.assertEqual(self.cache.get(5, 'max_value'), 300)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+from stateStore import HEADER, RECORD, SEQUENCE, SLOTS, StateStore
+
+
+def write_states(path, sensor_id, count):
+    """ Store a number of states of a sensor from another process. """
+    store = StateStore(path)
+    for value in range(count):
+        store.update(sensor_id, value, 0, 1700000000)
+    store.close()
+
+
+class StateStoreTest(unittest.TestCase):
+    """ Test sharing sensor states through the state file. """
+
+    def setUp(self):
+        """ Create a state file in a temporary directory """
+        self.directory = tempfile.mkdtemp(prefix='sunroler-test-')
+        self.path = os.path.join(self.directory, 'state.bin')
+        self.store = StateStore(self.path)
+
+    def tearDown(self):
+        """ Remove the state file """
+        self.store.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_update_and_get(self):
+        self.assertIsNone(self.store.get(5))
+        self.assertTrue(self.store.update(5, 300, 1, 1700000000))
+        self.assertEqual(self.store.get(5), (300, 1, 1700000000))
+        self.assertEqual(StateStore(self.path).get(5), (300, 1, 1700000000))
+        self.assertEqual(self.store.updates(), 1)
+
+    def test_sensor_id_out_of_range(self):
+        self.assertFalse(self.store.update(SLOTS, 300, 1))
+        self.assertFalse(self.store.update(-1, 300, 1))
+        self.assertIsNone(self.store.get(SLOTS))
+        self.assertEqual(self.store.updates(), 0)
+
+    def test_record_of_dead_writer(self):
+        self.store.update(5, 300, 1, 1700000000)
+        # A writer died after marking the record as being written.
+        offset = HEADER.size + 5 * RECORD.size
+        SEQUENCE.pack_into(self.store.map, offset, SEQUENCE.unpack_from(self.store.map, offset)[0] + 1)
+        self.assertIsNone(self.store.get(5))
+        self.store.update(5, 310, 0, 1700000001)
+        self.assertEqual(self.store.get(5), (310, 0, 1700000001))
+        self.assertEqual(SEQUENCE.unpack_from(self.store.map, offset)[0] % 2, 0)
+
+    def test_writers_in_several_processes(self):
+        processes = [multiprocessing.Process(target=write_states, args=(self.path, 5, 20000)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.store.updates(), 80000)
+        self.assertEqual(self.store.get(5), (19999, 0, 1700000000))
+
+
+if __name__ == '__main__':
+    unittest.main()
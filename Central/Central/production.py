@@ -0,0 +1,36 @@
+"""
+Django settings for serving Central in production.
+
+Used by gunicorn.conf.py. The secret key and the allowed hosts are taken from the environment
+variables SUNROLER_SECRET_KEY and SUNROLER_ALLOWED_HOSTS, a comma separated list, when set.
+"""
+
+import os
+from urllib.request import pathname2url
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get('SUNROLER_SECRET_KEY', SECRET_KEY)
+
+if os.environ.get('SUNROLER_ALLOWED_HOSTS'):
+    ALLOWED_HOSTS = os.environ['SUNROLER_ALLOWED_HOSTS'].split(',')
+
+
+# Database
+# Every worker thread keeps its connections open instead of connecting for every request.
+# Readings and rollups are read through a read-only connection, see CentralUnit.routers.
+
+DATABASES = {
+    'default': dict(DATABASES['default'], CONN_MAX_AGE=None, OPTIONS={'timeout': 10}),
+    'readonly': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'file:{path}?mode=ro'.format(path=pathname2url(DATABASES['default']['NAME'])),
+        'OPTIONS': {'uri': True},
+        'CONN_MAX_AGE': None,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['CentralUnit.routers.ReadOnlyRouter']
@@ -11,10 +11,15 @@ https://docs.djangoproject.com/en/1.10/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# Modules of the backend shared with the web interface, like the sensor state store
+BACKEND_DIR = os.path.join(os.path.dirname(BASE_DIR), 'Backend')
+sys.path.append(BACKEND_DIR)
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/1.10/howto/deployment/checklist/
@@ -42,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'CentralUnit.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -79,6 +85,12 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # The tables of the readings and settings are created by the backend through a connection of its own,
+        # so the test database is a file, which is filled by the tests rather than by Django.
+        'TEST': {
+            'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3'),
+            'SERIALIZE': False,
+        },
     }
 }
 
@@ -121,6 +133,23 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Static files are collected with a hash of their content in their name and a compressed copy,
+# so browsers can cache them forever. Run 'manage.py collectstatic' after changing one.
+STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+STATICFILES_STORAGE = 'CentralUnit.assets.CompressedManifestStaticFilesStorage'
+
+# Last known state of every sensor, written by the backend ingest service
+SENSOR_STATE_FILE = os.path.join(BASE_DIR, 'sensor_state.bin')
+
+# Column arrays of readings which do not change anymore, used to compute statistics
+ANALYTICS_CACHE_DIR = os.path.join(BASE_DIR, 'analytics_cache')
+
+# Number of days raw readings are kept in the database before they are moved to the archive,
+# and number of days rollups of a resolution in seconds are kept
+READING_RETENTION_DAYS = 90
+READING_ARCHIVE_DIR = os.path.join(BASE_DIR, 'archive')
+ROLLUP_RETENTION_DAYS = {60: 365}
+
 BOOTSTRAP3 = {
 
     # The URL to the jQuery JavaScript file
@@ -13,10 +13,15 @@ Including another URLconf
     1. Import the include() function: from django.conf.urls import url, include
     2. Add a URL to urlpatterns:  url(r'^blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.conf.urls import include, url
 from django.contrib import admin
+from CentralUnit import assets
 
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
     url(r'^', include('CentralUnit.urls')),
 ]
+
+if not settings.DEBUG:
+    urlpatterns.insert(0, url(r'^static/(?P<path>.*)$', assets.serve))
@@ -1,12 +1,14 @@
 from django.contrib import admin
 
-from .models import Anemometer, Humidity, Light, Rain, Temperature, Log, SensorSettings
+from .models import Reading, Log, SensorSettings
 
-admin.site.register(Anemometer)
-admin.site.register(Humidity)
-admin.site.register(Light)
-admin.site.register(Rain)
-admin.site.register(Temperature)
+
+class ReadingAdmin(admin.ModelAdmin):
+    list_display = ('sensor_id', 'sensor_value', 'screen_position', 'reading_time')
+    list_filter = ('sensor_id',)
+
+
+admin.site.register(Reading, ReadingAdmin)
 admin.site.register(Log)
 admin.site.register(SensorSettings)
 # Register your models here.
@@ -0,0 +1,164 @@
+import os
+import time
+import numpy as np
+from django.conf import settings
+from django.db import connections, router
+from .configuration import sensor_registry
+from .models import Reading
+
+PERIODS = {'day': 86400, 'week': 7 * 86400}
+# Periods start at midnight UTC, weeks on Monday, like the 5th of January 1970.
+PERIOD_ORIGIN = 4 * 86400
+PERCENTILES = (10, 50, 90)
+
+# Readings further apart than this are not counted as time above the maximum value, since the sensor was offline.
+MAX_GAP = 300
+
+# Readings are cached per chunk of 30 days, once the chunk ended at least a day ago.
+CHUNK = 30 * 86400
+CHUNK_DELAY = 86400
+
+
+def query_readings(sensor_id, start, end):
+    """ Select the readings of a sensor within a time range from the database with a single query.
+
+    Returns an array with a row of reading time, sensor value and screen position per reading, ordered by time.
+    """
+    cursor = connections[router.db_for_read(Reading)].cursor()
+    cursor.execute("SELECT reading_time, sensor_value, screen_position FROM readings "
+                   "WHERE sensor_id = %s AND reading_time BETWEEN %s AND %s ORDER BY reading_time",
+                   [sensor_id, start, end])
+    return np.array(cursor.fetchall(), dtype=np.int64).reshape(-1, 3)
+
+
+def load_chunk(sensor_id, chunk):
+    """ Load the readings of a sensor within a closed chunk of time, from the column cache when possible.
+
+    Readings of a chunk which ended more than CHUNK_DELAY seconds ago do not change anymore,
+    so they are selected from the database once and kept in the column cache directory.
+    """
+    path = os.path.join(settings.ANALYTICS_CACHE_DIR, '{s}-{c}.npy'.format(s=sensor_id, c=chunk))
+    try:
+        return np.load(path)
+    except (IOError, ValueError):
+        pass
+
+    readings = query_readings(sensor_id, chunk * CHUNK, (chunk + 1) * CHUNK - 1)
+    os.makedirs(settings.ANALYTICS_CACHE_DIR, exist_ok=True)
+    temporary = path + '.tmp.npy'
+    np.save(temporary, readings)
+    os.replace(temporary, path)
+    return readings
+
+
+def load_readings(sensor_id, start, end):
+    """ Load the readings of a sensor within a time range into column arrays.
+
+    Closed chunks of time are loaded from the column cache, the rest is selected from the database.
+    Returns arrays of reading times, sensor values and screen positions, ordered by reading time.
+    """
+    closed = (int(time.time()) - CHUNK_DELAY) // CHUNK
+    parts = []
+    for chunk in range(start // CHUNK, end // CHUNK + 1):
+        if chunk < closed:
+            readings = load_chunk(sensor_id, chunk)
+            if chunk * CHUNK < start or (chunk + 1) * CHUNK - 1 > end:
+                readings = readings[(readings[:, 0] >= start) & (readings[:, 0] <= end)]
+        else:
+            readings = query_readings(sensor_id, max(start, chunk * CHUNK), end)
+            parts.append(readings)
+            break
+        parts.append(readings)
+
+    columns = np.concatenate(parts) if parts else np.empty((0, 3), dtype=np.int64)
+    return columns[:, 0], columns[:, 1], columns[:, 2]
+
+
+def invalidate(sensor_id, start, end):
+    """ Remove the cached chunks of a sensor within a time range, after readings within it have been changed. """
+    for chunk in range(start // CHUNK, end // CHUNK + 1):
+        try:
+            os.remove(os.path.join(settings.ANALYTICS_CACHE_DIR, '{s}-{c}.npy'.format(s=sensor_id, c=chunk)))
+        except FileNotFoundError:
+            pass
+
+
+def moving_average(values, window):
+    """ Get the moving average of values over a window of readings, the first window - 1 values are averaged
+        over the readings available so far.
+    """
+    sums = np.cumsum(values, dtype=np.float64)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts = np.minimum(np.arange(1, len(values) + 1), window)
+    return sums / counts
+
+
+def sensor_statistics(times, values, positions, start, period, max_value, window=10):
+    """ Compute the statistics of the readings of one sensor per period.
+
+    Readings must be ordered by time. Periods start at a period boundary, so the first period only holds
+    the readings from the start on. Returns a list with a dictionary of statistics for every period
+    which has readings: count, minimum, maximum, mean, percentiles, maximum of the moving average,
+    seconds the value was above the maximum value setting and number of screen movements.
+    """
+    if len(times) == 0:
+        return []
+
+    start -= (start - PERIOD_ORIGIN) % period
+    groups = (times - start) // period
+    # Readings are ordered by time, so every group is a contiguous slice.
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    counts = np.diff(np.r_[starts, len(times)])
+    ids = groups[starts]
+
+    # Sort values within every group at once by sorting on group and value combined in one key.
+    offset = values.min()
+    sorted_values = np.sort(((groups - groups[0]) << 32) | (values - offset)) & 0xFFFFFFFF
+    sorted_values += offset
+    percentiles = {}
+    for q in PERCENTILES:
+        percentiles['p{q}'.format(q=q)] = sorted_values[starts + (q * (counts - 1)) // 100]
+
+    totals = np.add.reduceat(values, starts)
+    minimums = np.minimum.reduceat(values, starts)
+    maximums = np.maximum.reduceat(values, starts)
+    smoothed = np.maximum.reduceat(moving_average(values, window), starts)
+
+    gaps = np.minimum(np.diff(times), MAX_GAP)
+    above = np.r_[np.where(values[:-1] > max_value, gaps, 0), 0]
+    seconds_above = np.add.reduceat(above, starts)
+
+    movements = np.r_[0, positions[1:] != positions[:-1]].astype(np.int64)
+    movement_counts = np.add.reduceat(movements, starts)
+
+    statistics = []
+    for i in range(len(starts)):
+        row = {
+            'period_start': int(start + ids[i] * period),
+            'count': int(counts[i]),
+            'min': int(minimums[i]),
+            'max': int(maximums[i]),
+            'mean': float(totals[i] / counts[i]),
+            'moving_average_max': float(smoothed[i]),
+            'seconds_above_max_value': int(seconds_above[i]),
+            'screen_movements': int(movement_counts[i]),
+        }
+        for name, column in percentiles.items():
+            row[name] = int(column[i])
+        statistics.append(row)
+    return statistics
+
+
+def statistics(start, end, period='day', sensors=None, window=10):
+    """ Compute the statistics per period of every sensor, or of the sensor IDs given, within a time range.
+
+    Returns a dictionary mapping sensor names to lists of statistics per period.
+    """
+    result = dict()
+    for sensor in sensor_registry():
+        if sensors is not None and sensor.id not in sensors:
+            continue
+        times, values, positions = load_readings(sensor.id, start, end)
+        result[sensor.name] = sensor_statistics(times, values, positions, start, PERIODS[period],
+                                                sensor.max_value, window)
+    return result
@@ -0,0 +1,90 @@
+import os
+import numpy as np
+
+# Columns of the readings table, in the order they are stored in archive chunks.
+COLUMNS = ('ID', 'sensor_id', 'sensor_value', 'screen_position', 'reading_time')
+
+
+def chunk_path(directory, month, first_id, last_id):
+    """ Get the path of the archive chunk holding the readings of a month within a range of IDs. """
+    return os.path.join(directory, month, 'readings-{f:012d}-{l:012d}.npz'.format(f=first_id, l=last_id))
+
+
+def write_chunk(path, rows):
+    """ Write rows of readings to a compressed columnar archive chunk.
+
+    Every column is stored as an array, together with the first and last reading time of the chunk.
+    The chunk is written to a temporary file first and renamed, so a chunk is either complete or absent.
+    """
+    columns = np.array(rows, dtype=np.int64).reshape(-1, len(COLUMNS))
+    times = columns[:, COLUMNS.index('reading_time')]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        np.savez_compressed(f, min_time=times.min(), max_time=times.max(),
+                            **{name: columns[:, i] for i, name in enumerate(COLUMNS)})
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def write_months(directory, rows):
+    """ Write rows of readings, ordered by ID, to an archive chunk per month of their reading times.
+
+    Returns the number of chunks written.
+    """
+    columns = np.array(rows, dtype=np.int64).reshape(-1, len(COLUMNS))
+    months = columns[:, COLUMNS.index('reading_time')].astype('datetime64[s]').astype('datetime64[M]')
+    unique_months = np.unique(months)
+    for month in unique_months:
+        month_columns = columns[months == month]
+        write_chunk(chunk_path(directory, str(month), int(month_columns[0, 0]), int(month_columns[-1, 0])),
+                    month_columns)
+    return len(unique_months)
+
+
+def read_chunk(path):
+    """ Read an archive chunk.
+
+    Returns a dictionary with an array per column and the first and last reading time of the chunk.
+    """
+    with np.load(path) as chunk:
+        return {name: chunk[name] for name in chunk.files}
+
+
+def chunk_paths(directory):
+    """ Get the paths of every archive or export chunk within a directory, ordered by month and first ID. """
+    paths = []
+    for root, directories, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files if name.endswith('.npz'))
+    return sorted(paths)
+
+
+def scan(directory, start=None, end=None, sensors=None):
+    """ Read the readings within a time range, and of the sensor IDs given, from the chunks in a directory.
+
+    Chunks whose first and last reading time are outside the time range are skipped without
+    decompressing any column, and the other columns of a chunk are only decompressed when the
+    reading times and sensor IDs of some of its readings match. Memory use is bounded by the size
+    of a single chunk.
+
+    Yields a dictionary with an array per column for every chunk with matching readings.
+    """
+    for path in chunk_paths(directory):
+        with np.load(path) as chunk:
+            if (start is not None and chunk['max_time'] < start) or (end is not None and chunk['min_time'] > end):
+                continue
+            times = chunk['reading_time']
+            mask = np.ones(len(times), dtype=bool)
+            if start is not None:
+                mask &= times >= start
+            if end is not None:
+                mask &= times <= end
+            if sensors is not None:
+                mask &= np.isin(chunk['sensor_id'], list(sensors))
+            if not mask.any():
+                continue
+            if mask.all():
+                yield {name: chunk[name] for name in COLUMNS}
+            else:
+                yield {name: chunk[name][mask] for name in COLUMNS}
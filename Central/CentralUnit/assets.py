@@ -0,0 +1,99 @@
+import gzip
+import mimetypes
+import os
+import posixpath
+import re
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+# Extensions of the static files which are worth compressing, images and fonts like woff are compressed already.
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.eot', '.ttf', '.json', '.txt', '.html')
+
+# Names of static files collected with a hash of their content, like bootstrap.min.5c0ff0b4bd1b.css.
+FINGERPRINTED = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+# Seconds browsers may keep static files, fingerprinted files never change so they are kept for a year.
+FINGERPRINTED_MAX_AGE = 365 * 24 * 60 * 60
+STATIC_MAX_AGE = 60
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ Collect static files under a name containing a hash of their content, next to a gzip compressed copy.
+
+    Templates refer to the fingerprinted names through the static tag, so a file can be cached by the browser
+    forever while a changed file gets a new name.
+
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        """ Fingerprint the collected files, then compress every fingerprinted file. """
+        for processed in super().post_process(paths, dry_run, **options):
+            yield processed
+
+        if dry_run:
+            return
+
+        for name in set(self.hashed_files.values()):
+            if name.endswith(COMPRESSED_EXTENSIONS):
+                self.compress(name)
+
+    def compress(self, name):
+        """ Write a gzip compressed copy of a collected file, when that is smaller than the file itself.
+
+        Args:
+            name: The name of the collected file.
+
+        """
+        path = self.path(name)
+        with open(path, 'rb') as source:
+            content = source.read()
+        compressed = gzip.compress(content, 9)
+        if len(compressed) < len(content):
+            with open(path + '.gz', 'wb') as target:
+                target.write(compressed)
+
+
+def serve(request, path):
+    """ Serve a collected static file when the server does not run in debug mode.
+
+    The gzip compressed copy is served to browsers accepting it. Fingerprinted files are cached by browsers
+    for a year, other files are revalidated with their modification time.
+
+    Args:
+        request: The request.
+        path: The path of the file relative to STATIC_ROOT.
+
+    Returns:
+        The file, or an empty response when the browser has the current version already.
+
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    full_path = safe_join(settings.STATIC_ROOT, path)
+    if not os.path.isfile(full_path):
+        raise Http404('Static file not found')
+
+    stat = os.stat(full_path)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime, stat.st_size):
+        return HttpResponseNotModified()
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    serve_path = full_path
+    if 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '') and os.path.isfile(full_path + '.gz'):
+        serve_path = full_path + '.gz'
+        encoding = 'gzip'
+
+    response = FileResponse(open(serve_path, 'rb'), content_type=content_type or 'application/octet-stream')
+    response['Content-Length'] = os.path.getsize(serve_path)
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if FINGERPRINTED.search(path):
+        response['Cache-Control'] = 'public, max-age={s}, immutable'.format(s=FINGERPRINTED_MAX_AGE)
+    else:
+        response['Cache-Control'] = 'public, max-age={s}'.format(s=STATIC_MAX_AGE)
+    return response
@@ -0,0 +1,172 @@
+import re
+from django.db import DatabaseError, connection, models, transaction
+from django.db.models import Case, Value, When
+from sensorRegistry import SensorRegistry
+from stateStore import SLOTS
+from .models import SensorSettings
+
+registry = None
+
+
+def is_integer(value):
+    """ Check whether a setting value is a whole number. """
+    return re.match(r'^-?[0-9]+$', value) is not None
+
+
+def is_number(value):
+    """ Check whether a setting value is a number. """
+    return re.match(r'^-?[0-9]+(\.[0-9]+)?$', value) is not None
+
+
+# Settings of the sunscreen itself, stored for sensor 0, and settings of every sensor, with the function
+# checking their value. Roll distances are sent to the control unit as a single byte, 255 is the keepalive.
+SUNSCREEN_SETTINGS = {
+    'roll_in_distance': lambda value: is_integer(value) and 0 <= int(value) <= 254,
+    'roll_out_distance': lambda value: is_integer(value) and 0 <= int(value) <= 254,
+}
+SENSOR_SETTINGS = {
+    'sensor_name': lambda value: re.match(r'^[a-z0-9_]+$', value) is not None,
+    'kind': lambda value: re.match(r'^[a-z0-9_]+$', value) is not None,
+    'unit': lambda value: len(value) <= 16,
+    'scale': lambda value: is_number(value),
+    'offset': lambda value: is_number(value),
+    'min_value': is_integer,
+    'max_value': is_integer,
+    'motor_override_up': lambda value: value in ('0', '1'),
+    'motor_override_down': lambda value: value in ('0', '1'),
+    'priority': is_integer,
+    'debounce': lambda value: is_integer(value) and int(value) >= 0,
+}
+
+# Number of rows changed by one UPDATE statement, which keeps it below the SQLite limit of query parameters.
+UPDATE_BATCH = 200
+
+
+def validate_change(change):
+    """ Check a single change of a setting.
+
+    Args:
+        change: Dictionary with the 'sensor', 'setting_name' and 'value' of the change.
+
+    Returns:
+        The sensor, setting name and value as stored in the database.
+
+    Raises:
+        ValueError: When the change is incomplete, the setting is unknown or the value is invalid.
+
+    """
+    if not isinstance(change, dict) or not {'sensor', 'setting_name', 'value'} <= set(change):
+        raise ValueError('Every change needs a sensor, setting_name and value')
+
+    sensor = change['sensor']
+    name = change['setting_name']
+    value = str(change['value'])
+    # Control units send the sensor ID as a single byte and the state store has a slot for every such ID.
+    if not isinstance(sensor, int) or isinstance(sensor, bool) or not 0 <= sensor < SLOTS:
+        raise ValueError('Invalid sensor {s!r}'.format(s=sensor))
+
+    check = (SUNSCREEN_SETTINGS if sensor == 0 else SENSOR_SETTINGS).get(name)
+    if check is None:
+        raise ValueError('Unknown setting {n!r} for sensor {s}'.format(n=name, s=sensor))
+    if not check(value):
+        raise ValueError('Invalid value {v!r} for setting {n!r} of sensor {s}'.format(v=value, n=name, s=sensor))
+
+    return sensor, name, value
+
+
+def settings_version():
+    """ Get the version of the settings, which the database increases whenever a setting changes. """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT version FROM settings_version WHERE ID = 1")
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    return row[0] if row else None
+
+
+def readings_version():
+    """ Get the version of the stored readings, which the backend increases in every transaction storing readings. """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT version FROM readings_version WHERE ID = 1")
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    return row[0] if row else None
+
+
+def sensor_registry():
+    """ Get the registry of every sensor, which is built again only when the settings version has changed. """
+    global registry
+    version = settings_version()
+    if registry is None or version is None or registry[0] != version:
+        registry = (version, SensorRegistry(
+            SensorSettings.objects.values_list('sensor', 'setting_name', 'setting_value')))
+    return registry[1]
+
+
+def current_settings():
+    """ Get every setting by sensor and name. """
+    settings = {}
+    for sensor, name, value in SensorSettings.objects.values_list('sensor', 'setting_name', 'setting_value'):
+        settings.setdefault(sensor, {})[name] = value
+    return settings
+
+
+def apply_changes(changes):
+    """ Validate and store changes of many settings in a single transaction.
+
+    Existing settings are updated with as few UPDATE statements as possible and missing settings are
+    created, so nothing is stored when any change is invalid. The database triggers increase the settings
+    version, which makes the backend reload its settings.
+
+    Args:
+        changes: List of dictionaries with the 'sensor', 'setting_name' and 'value' of every change.
+
+    Returns:
+        The number of settings changed.
+
+    Raises:
+        ValueError: When any change is invalid.
+
+    """
+    if not isinstance(changes, list):
+        raise ValueError('Changes should be a list')
+
+    values = {}
+    for change in changes:
+        sensor, name, value = validate_change(change)
+        values[(sensor, name)] = value
+
+    with transaction.atomic():
+        existing = {(setting.sensor, setting.setting_name): setting for setting in SensorSettings.objects.all()}
+
+        def value_of(sensor, name):
+            if (sensor, name) in values:
+                return int(values[(sensor, name)])
+            if (sensor, name) not in existing:
+                return 0
+            stored = existing[(sensor, name)].setting_value
+            if not is_integer(stored):
+                raise ValueError('Stored value {v!r} of setting {n!r} of sensor {s} is not a whole number, '
+                                 'change it as well'.format(v=stored, n=name, s=sensor))
+            return int(stored)
+
+        for sensor in {sensor for sensor, name in values if sensor != 0}:
+            if value_of(sensor, 'min_value') > value_of(sensor, 'max_value'):
+                raise ValueError('The min_value of sensor {s} is above its max_value'.format(s=sensor))
+
+        updates = [(existing[key].ID, value) for key, value in values.items()
+                   if key in existing and existing[key].setting_value != value]
+        for start in range(0, len(updates), UPDATE_BATCH):
+            batch = updates[start:start + UPDATE_BATCH]
+            SensorSettings.objects.filter(ID__in=[setting_id for setting_id, value in batch]).update(
+                setting_value=Case(*[When(ID=setting_id, then=Value(value)) for setting_id, value in batch],
+                                   output_field=models.TextField()))
+
+        SensorSettings.objects.bulk_create([
+            SensorSettings(sensor=sensor, setting_name=name, setting_value=value)
+            for (sensor, name), value in values.items() if (sensor, name) not in existing])
+
+    return len(updates) + sum(1 for key in values if key not in existing)
@@ -0,0 +1,23 @@
+import json
+import time
+from django.core.management.base import BaseCommand, CommandError
+from CentralUnit.analytics import PERIODS, statistics
+
+
+class Command(BaseCommand):
+    help = 'Print statistics per day or week of the readings of every sensor as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='start', type=int, help='Start of the time range in seconds since the epoch')
+        parser.add_argument('--to', dest='end', type=int, help='End of the time range in seconds since the epoch')
+        parser.add_argument('--period', choices=sorted(PERIODS), default='day')
+        parser.add_argument('--sensor', type=int, action='append', help='ID of sensor to compute statistics of')
+        parser.add_argument('--window', type=int, default=10, help='Number of readings in the moving average')
+
+    def handle(self, *args, **options):
+        if options['window'] < 1:
+            raise CommandError('The window must be at least 1 reading')
+        end = options['end'] if options['end'] is not None else int(time.time())
+        start = options['start'] if options['start'] is not None else end - 7 * 86400
+        result = statistics(start, end, options['period'], options['sensor'], options['window'])
+        self.stdout.write(json.dumps(result, indent=2))
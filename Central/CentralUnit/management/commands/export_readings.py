@@ -0,0 +1,49 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from CentralUnit.archive import write_months
+
+
+class Command(BaseCommand):
+    help = ('Export readings to compressed columnar chunks, one file per month of every batch, '
+            'which can be loaded with numpy.load and restored with import_readings')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory to write the chunks to')
+        parser.add_argument('--from', dest='start', type=int, help='Start of the time range in seconds since the epoch')
+        parser.add_argument('--to', dest='end', type=int, help='End of the time range in seconds since the epoch')
+        parser.add_argument('--sensor', type=int, action='append', help='ID of sensor to export readings of')
+        parser.add_argument('--batch', type=int, default=100000, help='Number of readings read per query')
+
+    def handle(self, *args, **options):
+        started = time.time()
+        conditions = ["ID > %s"]
+        parameters = []
+        if options['start'] is not None:
+            conditions.append("reading_time >= %s")
+            parameters.append(options['start'])
+        if options['end'] is not None:
+            conditions.append("reading_time <= %s")
+            parameters.append(options['end'])
+        if options['sensor']:
+            conditions.append("sensor_id IN ({p})".format(p=', '.join(['%s'] * len(options['sensor']))))
+            parameters.extend(options['sensor'])
+        query = ("SELECT ID, sensor_id, sensor_value, screen_position, reading_time FROM readings "
+                 "WHERE {c} ORDER BY ID LIMIT %s".format(c=' AND '.join(conditions)))
+
+        cursor = connection.cursor()
+        exported = 0
+        chunks = 0
+        last_id = 0
+        while True:
+            cursor.execute(query, [last_id] + parameters + [options['batch']])
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            chunks += write_months(options['directory'], rows)
+            exported += len(rows)
+            last_id = rows[-1][0]
+
+        self.stdout.write('Exported {n} readings in {c} chunks in {s:.1f}s.'.format(
+            n=exported, c=chunks, s=time.time() - started))
@@ -0,0 +1,105 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from database import ROLLUP_RESOLUTIONS
+from CentralUnit.analytics import invalidate
+from CentralUnit.archive import COLUMNS, scan
+
+
+class Command(BaseCommand):
+    help = ('Import readings from the compressed columnar chunks written by export_readings or by the retention '
+            'archive, reading only the chunks and columns within the time range')
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory to read the chunks from')
+        parser.add_argument('--from', dest='start', type=int, help='Start of the time range in seconds since the epoch')
+        parser.add_argument('--to', dest='end', type=int, help='End of the time range in seconds since the epoch')
+        parser.add_argument('--sensor', type=int, action='append', help='ID of sensor to import readings of')
+        parser.add_argument('--new-ids', action='store_true',
+                            help='Give the readings new IDs, to import them into another database. '
+                                 'By default the IDs are kept and readings which exist already are skipped, '
+                                 'so importing twice has no effect')
+        rollups = parser.add_mutually_exclusive_group()
+        rollups.add_argument('--skip-rollups', action='store_true',
+                             help='Do not add the readings to the rollups at all')
+        rollups.add_argument('--add-rollups', action='store_true',
+                             help='Add the readings to every rollup, also to rollups which exist already, when '
+                                  'importing readings of another database. By default readings are only added '
+                                  'to rollups which do not exist yet, since the rollups of readings archived '
+                                  'from this database are kept and already count them')
+
+    def handle(self, *args, **options):
+        started = time.time()
+        cursor = connection.cursor()
+        imported = 0
+        skipped = 0
+        # Rollups created by this import, which later chunks of the same time range are added to, and existing
+        # rollups the readings were not added to.
+        self.created = set()
+        self.kept = set()
+        for columns in scan(options['directory'], options['start'], options['end'], options['sensor']):
+            rows = np.column_stack([columns[name] for name in COLUMNS]).tolist()
+            with transaction.atomic():
+                if not options['new_ids']:
+                    cursor.execute("SELECT ID FROM readings WHERE ID BETWEEN %s AND %s",
+                                   [int(columns['ID'].min()), int(columns['ID'].max())])
+                    existing = {row[0] for row in cursor.fetchall()}
+                    new_rows = [row for row in rows if row[0] not in existing]
+                    cursor.executemany("INSERT INTO readings (ID, sensor_id, sensor_value, screen_position, "
+                                       "reading_time) VALUES (%s, %s, %s, %s, %s)", new_rows)
+                else:
+                    new_rows = rows
+                    cursor.executemany("INSERT INTO readings (sensor_id, sensor_value, screen_position, "
+                                       "reading_time) VALUES (%s, %s, %s, %s)", [row[1:] for row in rows])
+                if not options['skip_rollups']:
+                    self.roll_up(cursor, new_rows, options['add_rollups'])
+                cursor.execute("UPDATE readings_version SET version = version + 1 WHERE ID = 1")
+
+            for sensor_id in {row[1] for row in new_rows}:
+                times = [row[4] for row in new_rows if row[1] == sensor_id]
+                invalidate(sensor_id, min(times), max(times))
+            imported += len(new_rows)
+            skipped += len(rows) - len(new_rows)
+
+        self.stdout.write('Imported {n} readings, skipped {s} existing readings and kept {k} existing rollups '
+                          'in {t:.1f}s.'.format(n=imported, s=skipped, k=len(self.kept), t=time.time() - started))
+
+    def roll_up(self, cursor, rows, add_existing=False):
+        """ Add imported readings to the minimum, maximum, total and count of their rollups.
+
+        Args:
+            cursor: Cursor to the database.
+            rows: List of imported (ID, sensor ID, value, screen position, reading time) rows.
+            add_existing: Whether to add the readings to rollups which exist already as well.
+
+        """
+        rollups = {}
+        for reading_id, sensor_id, value, screen_pos, reading_time in rows:
+            for resolution in ROLLUP_RESOLUTIONS:
+                key = (sensor_id, resolution, reading_time // resolution * resolution)
+                rollup = rollups.get(key)
+                if rollup is None:
+                    rollups[key] = [value, value, value, 1]
+                else:
+                    rollup[0] = min(rollup[0], value)
+                    rollup[1] = max(rollup[1], value)
+                    rollup[2] += value
+                    rollup[3] += 1
+        if not add_existing:
+            for sensor_id, resolution in {key[:2] for key in rollups}:
+                buckets = [key[2] for key in rollups if key[:2] == (sensor_id, resolution)]
+                cursor.execute("SELECT bucket FROM rollups WHERE sensor_id = %s AND resolution = %s "
+                               "AND bucket BETWEEN %s AND %s", [sensor_id, resolution, min(buckets), max(buckets)])
+                for row in cursor.fetchall():
+                    key = (sensor_id, resolution, row[0])
+                    if key not in self.created and rollups.pop(key, None) is not None:
+                        self.kept.add(key)
+            self.created.update(rollups)
+
+        cursor.executemany("INSERT INTO rollups (sensor_id, resolution, bucket, min_value, max_value, total, count) "
+                           "VALUES (%s, %s, %s, %s, %s, %s, %s) ON CONFLICT (sensor_id, resolution, bucket) DO UPDATE "
+                           "SET min_value = MIN(min_value, excluded.min_value), "
+                           "max_value = MAX(max_value, excluded.max_value), "
+                           "total = total + excluded.total, count = count + excluded.count",
+                           [key + tuple(rollup) for key, rollup in rollups.items()])
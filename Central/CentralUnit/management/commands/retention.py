@@ -0,0 +1,78 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from CentralUnit.archive import write_months
+
+
+class Command(BaseCommand):
+    help = 'Archive and delete readings older than the retention period, prune old rollups and reclaim free space'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.READING_RETENTION_DAYS,
+                            help='Number of days raw readings are kept in the database')
+        parser.add_argument('--batch', type=int, default=20000, help='Number of readings archived per transaction')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Seconds to wait between transactions, so ingest is not blocked')
+        parser.add_argument('--vacuum-pages', type=int, default=1000,
+                            help='Number of free pages reclaimed per incremental vacuum step')
+        parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                            help='Switch the database to incremental vacuum, which needs one full vacuum')
+
+    def handle(self, *args, **options):
+        cursor = connection.cursor()
+        now = int(time.time())
+
+        archived = self.archive(cursor, now - options['days'] * 86400, options['batch'], options['pause'])
+        self.stdout.write('Archived {n} readings.'.format(n=archived))
+
+        for resolution, days in sorted(settings.ROLLUP_RETENTION_DAYS.items()):
+            cursor.execute("DELETE FROM rollups WHERE resolution = %s AND bucket < %s",
+                           [resolution, now - days * 86400])
+            self.stdout.write('Pruned {n} rollups of {r}s.'.format(n=cursor.rowcount, r=resolution))
+
+        self.vacuum(cursor, options['vacuum_pages'], options['pause'], options['enable_incremental_vacuum'])
+
+    def archive(self, cursor, cutoff, batch, pause):
+        """ Move readings older than the cutoff to archive chunks, a batch at a time.
+
+        A chunk is written per month of every batch before the readings of the batch are deleted in
+        a short transaction, and chunks are named after their ID range, so the archive is append only
+        and running again after a crash archives the remaining readings only.
+        """
+        archived = 0
+        last_id = 0
+        while True:
+            cursor.execute("SELECT ID, sensor_id, sensor_value, screen_position, reading_time FROM readings "
+                           "WHERE ID > %s AND reading_time < %s ORDER BY ID LIMIT %s", [last_id, cutoff, batch])
+            rows = cursor.fetchall()
+            if not rows:
+                return archived
+
+            write_months(settings.READING_ARCHIVE_DIR, rows)
+
+            cursor.execute("DELETE FROM readings WHERE ID BETWEEN %s AND %s AND reading_time < %s",
+                           [rows[0][0], rows[-1][0], cutoff])
+            archived += len(rows)
+            last_id = rows[-1][0]
+            time.sleep(pause)
+
+    def vacuum(self, cursor, pages, pause, enable):
+        """ Give free pages back to the file system in small steps. """
+        cursor.execute("PRAGMA auto_vacuum")
+        if cursor.fetchone()[0] != 2:
+            if not enable:
+                self.stdout.write('Incremental vacuum is not enabled, run with --enable-incremental-vacuum once.')
+                return
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+
+        while True:
+            cursor.execute("PRAGMA freelist_count")
+            free = cursor.fetchone()[0]
+            if free == 0:
+                break
+            cursor.execute("PRAGMA incremental_vacuum({p})".format(p=int(pages)))
+            cursor.fetchall()
+            time.sleep(pause)
+        self.stdout.write('Reclaimed free space.')
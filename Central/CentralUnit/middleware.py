@@ -0,0 +1,36 @@
+import time
+import metrics
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+class MetricsMiddleware:
+    """ Observe the duration and the number of database queries of every view.
+
+    The middleware is only used when metrics are enabled with the SUNROLER_METRICS environment variable.
+
+    """
+
+    def __init__(self, get_response):
+        """ Initialize middleware with the next handler of the request """
+        if not metrics.enabled:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """ Handle the request, observing its duration and counting its queries per view. """
+        for connection in connections.all():
+            connection.force_debug_cursor = True
+            connection.queries_log.clear()
+        start = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - start
+        queries = 0
+        for connection in connections.all():
+            queries += len(connection.queries_log)
+            connection.force_debug_cursor = False
+        view = request.resolver_match.func.__name__ if request.resolver_match else 'none'
+        metrics.histogram('sunroler_view_seconds', 'Duration of handling a request', view=view).observe(duration)
+        metrics.inc('sunroler_view_queries_total', 'Number of database queries', queries, view=view)
+        metrics.inc('sunroler_view_requests_total', 'Number of requests', view=view)
+        return response
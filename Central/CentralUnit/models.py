@@ -3,11 +3,14 @@ from django.db import models
 
 # Create your models here.
 
-class Anemometer(models.Model):
+class Reading(models.Model):
+    """ Value of any sensor, the sensors themselves are described by their settings. """
     class Meta:
-        db_table = 'anemometer'
+        db_table = 'readings'
+        index_together = [['sensor_id', 'reading_time']]
 
     ID = models.IntegerField(primary_key=True)
+    sensor_id = models.IntegerField()
     sensor_value = models.IntegerField()
     screen_position = models.IntegerField()
     reading_time = models.IntegerField()
@@ -16,56 +19,22 @@ class Anemometer(models.Model):
         return str(self.sensor_value)+' at '+str(self.reading_time)
 
 
-class Humidity(models.Model):
+class Rollup(models.Model):
     class Meta:
-        db_table = 'humidity'
+        db_table = 'rollups'
+        unique_together = [['sensor_id', 'resolution', 'bucket']]
 
     ID = models.IntegerField(primary_key=True)
-    sensor_value = models.IntegerField()
-    screen_position = models.IntegerField()
-    reading_time = models.IntegerField()
-
-    def __str__(self):
-        return str(self.sensor_value)+' at '+str(self.reading_time)
-
-
-class Light(models.Model):
-    class Meta:
-        db_table = 'light'
-
-    ID = models.IntegerField(primary_key=True)
-    sensor_value = models.IntegerField()
-    screen_position = models.IntegerField()
-    reading_time = models.IntegerField()
-
-    def __str__(self):
-        return str(self.sensor_value)+'lx at '+str(self.reading_time)
-
-
-class Rain(models.Model):
-    class Meta:
-        db_table = 'rain'
-
-    ID = models.IntegerField(primary_key=True)
-    sensor_value = models.IntegerField()
-    screen_position = models.IntegerField()
-    reading_time = models.IntegerField()
-
-    def __str__(self):
-        return str(self.sensor_value)+' at '+str(self.reading_time)
-
-
-class Temperature(models.Model):
-    class Meta:
-        db_table = 'temperature'
-
-    ID = models.IntegerField(primary_key=True)
-    sensor_value = models.IntegerField()
-    screen_position = models.IntegerField()
-    reading_time = models.IntegerField()
+    sensor_id = models.IntegerField()
+    resolution = models.IntegerField()
+    bucket = models.IntegerField()
+    min_value = models.IntegerField()
+    max_value = models.IntegerField()
+    total = models.IntegerField()
+    count = models.IntegerField()
 
     def __str__(self):
-        return str(self.sensor_value)+'℃ at '+str(self.reading_time)
+        return str(self.total / self.count)+' at '+str(self.bucket)
 
 
 class Log(models.Model):
@@ -0,0 +1,30 @@
+from django.conf import settings
+
+# Alias of the read-only connection to the database, configured by the production settings.
+READ_ONLY_DATABASE = 'readonly'
+
+
+class ReadOnlyRouter:
+    """ Route reads of readings and rollups to a read-only connection to the database.
+
+    Readings and rollups are only written by the backend, so the web interface never needs a writable
+    connection for them. A read-only connection cannot take a write lock, and in WAL mode readers never
+    block the ingest writer, however many dashboard clients are served at once.
+
+    """
+
+    models = ('reading', 'rollup')
+
+    def db_for_read(self, model, **hints):
+        """ Get the read-only database for readings and rollups, when it is configured. """
+        if model._meta.model_name in self.models and READ_ONLY_DATABASE in settings.DATABASES:
+            return READ_ONLY_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        """ Leave every write to the default database. """
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        """ Never migrate through the read-only connection. """
+        return db != READ_ONLY_DATABASE
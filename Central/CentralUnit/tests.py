@@ -1,3 +1,565 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+import numpy as np
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from database import DB, close_pools
+from sensorRegistry import DEFAULT_SENSORS
+from . import analytics, configuration, views
+from .archive import scan
+from .configuration import apply_changes, validate_change
+from .models import Reading, Rollup, SensorSettings
 
-# Create your tests here.
+
+def create_backend_tables():
+    """ Create the tables of the test database like the backend does, unless they exist already. """
+    db = DB(connection.settings_dict['NAME'])
+    if 'sensor_settings' in connection.introspection.table_names():
+        db.upgrade()
+    else:
+        db.init()
+    close_pools()
+
+
+def create_default_settings():
+    """ Store the settings of a new database, like the backend does, unless there are settings already. """
+    if SensorSettings.objects.exists():
+        return
+    rows = [(0, 'roll_in_distance', 10), (0, 'roll_out_distance', 30)]
+    for sensor, (name, min_value, max_value) in DEFAULT_SENSORS.items():
+        rows += [(sensor, 'sensor_name', name), (sensor, 'min_value', min_value), (sensor, 'max_value', max_value),
+                 (sensor, 'motor_override_up', 0), (sensor, 'motor_override_down', 0)]
+    SensorSettings.objects.bulk_create([SensorSettings(sensor=sensor, setting_name=name, setting_value=str(value))
+                                        for sensor, name, value in rows])
+
+
+class BackendDataMixin:
+    """ Set up the tables of the backend, the default settings and an empty state store for every test. """
+
+    @classmethod
+    def setUpClass(cls):
+        create_backend_tables()
+        super().setUpClass()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='sunroler-test-')
+        self.settings_override = override_settings(
+            SENSOR_STATE_FILE=self.directory + '/sensor_state.bin',
+            ANALYTICS_CACHE_DIR=self.directory + '/analytics_cache',
+            READING_ARCHIVE_DIR=self.directory + '/archive')
+        self.settings_override.enable()
+        views.state_store = None
+        configuration.registry = None
+        cache.clear()
+        create_default_settings()
+
+    def tearDown(self):
+        if views.state_store is not None:
+            views.state_store.close()
+            views.state_store = None
+        configuration.registry = None
+        close_pools()
+        self.settings_override.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def setting(self, sensor, name):
+        """ Get the stored value of a setting. """
+        return SensorSettings.objects.get(sensor=sensor, setting_name=name).setting_value
+
+
+class ConfigurationTest(BackendDataMixin, TestCase):
+    """ Test validating and storing changes of settings. """
+
+    def test_validate_change(self):
+        self.assertEqual(validate_change({'sensor': 3, 'setting_name': 'max_value', 'value': 25}),
+                         (3, 'max_value', '25'))
+        self.assertEqual(validate_change({'sensor': 0, 'setting_name': 'roll_in_distance', 'value': '254'}),
+                         (0, 'roll_in_distance', '254'))
+
+    def test_validate_change_rejects(self):
+        for change in ({'sensor': 3, 'setting_name': 'max_value'},
+                       [3, 'max_value', 25],
+                       {'sensor': '3', 'setting_name': 'max_value', 'value': 25},
+                       {'sensor': True, 'setting_name': 'max_value', 'value': 25},
+                       {'sensor': 256, 'setting_name': 'max_value', 'value': 25},
+                       {'sensor': -1, 'setting_name': 'max_value', 'value': 25},
+                       {'sensor': 3, 'setting_name': 'roll_in_distance', 'value': 25},
+                       {'sensor': 0, 'setting_name': 'roll_in_distance', 'value': 255},
+                       {'sensor': 3, 'setting_name': 'max_value', 'value': '2.5'},
+                       {'sensor': 3, 'setting_name': 'sensor_name', 'value': 'Light; DROP'}):
+            with self.assertRaises(ValueError, msg=change):
+                validate_change(change)
+
+    def test_apply_changes(self):
+        changed = apply_changes([{'sensor': 3, 'setting_name': 'max_value', 'value': 30},
+                                 {'sensor': 3, 'setting_name': 'min_value', 'value': 20},
+                                 {'sensor': 3, 'setting_name': 'debounce', 'value': 60}])
+        # The minimum value did not change and the debounce is a new setting.
+        self.assertEqual(changed, 2)
+        self.assertEqual(self.setting(3, 'max_value'), '30')
+        self.assertEqual(self.setting(3, 'debounce'), '60')
+
+    def test_apply_changes_is_atomic(self):
+        with self.assertRaises(ValueError):
+            apply_changes([{'sensor': 3, 'setting_name': 'max_value', 'value': 30},
+                           {'sensor': 5, 'setting_name': 'max_value', 'value': 'bright'}])
+        with self.assertRaises(ValueError):
+            apply_changes([{'sensor': 3, 'setting_name': 'max_value', 'value': 30},
+                           {'sensor': 5, 'setting_name': 'min_value', 'value': 300}])
+        self.assertEqual(self.setting(3, 'max_value'), '25')
+        self.assertEqual(self.setting(5, 'min_value'), '150')
+
+    def test_min_value_above_stored_max_value(self):
+        with self.assertRaisesRegex(ValueError, 'min_value of sensor 3'):
+            apply_changes([{'sensor': 3, 'setting_name': 'min_value', 'value': 26}])
+
+    def test_stored_value_not_a_number(self):
+        SensorSettings.objects.filter(sensor=3, setting_name='max_value').update(setting_value='25.5')
+        with self.assertRaisesRegex(ValueError, "'max_value' of sensor 3"):
+            apply_changes([{'sensor': 3, 'setting_name': 'min_value', 'value': 21}])
+        self.assertEqual(apply_changes([{'sensor': 3, 'setting_name': 'min_value', 'value': 21},
+                                        {'sensor': 3, 'setting_name': 'max_value', 'value': 26}]), 2)
+
+    def test_updates_in_batches(self):
+        changes = [{'sensor': sensor, 'setting_name': name, 'value': 1}
+                   for sensor in DEFAULT_SENSORS for name in ('motor_override_up', 'motor_override_down')]
+        with mock.patch.object(configuration, 'UPDATE_BATCH', 3), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(apply_changes(changes), 10)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 4)
+        self.assertEqual(set(SensorSettings.objects.filter(setting_name__startswith='motor_override')
+                             .values_list('setting_value', flat=True)), {'1'})
+
+
+class SettingsViewTest(BackendDataMixin, TestCase):
+    """ Test getting and changing settings through the web interface. """
+
+    def post(self, data, content_type='application/json'):
+        """ Post changes of settings. """
+        return self.client.post('/settings', data if isinstance(data, str) else json.dumps(data),
+                                content_type=content_type)
+
+    def test_get(self):
+        response = self.client.get('/settings')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['settings']['5']['sensor_name'], 'light')
+
+    def test_change(self):
+        version = self.client.get('/settings').json()['version']
+        response = self.post({'changes': [{'sensor': 5, 'setting_name': 'max_value', 'value': 300}]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['changed'], 1)
+        self.assertGreater(response.json()['version'], version)
+        self.assertEqual(self.setting(5, 'max_value'), '300')
+
+    def test_form_is_rejected(self):
+        response = self.client.post('/settings', {'sensor': 5, 'setting_name': 'max_value', 'value': 300})
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(self.setting(5, 'max_value'), '250')
+
+    def test_malformed_json(self):
+        response = self.post('[{"sensor": 5,')
+        self.assertEqual(response.status_code, 400)
+
+    def test_min_value_above_max_value(self):
+        response = self.post([{'sensor': 5, 'setting_name': 'min_value', 'value': 300},
+                              {'sensor': 5, 'setting_name': 'max_value', 'value': 200}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('min_value', response.json()['message'])
+        self.assertEqual(self.setting(5, 'min_value'), '150')
+
+
+class HistoryViewTest(BackendDataMixin, TransactionTestCase):
+    """ Test getting the history of a sensor from the readings and the rollups stored by the backend. """
+
+    # Readings of the light sensor every 30 seconds for two hours, from a whole day on.
+    START = 1700006400
+
+    def setUp(self):
+        super().setUp()
+        DB(connection.settings_dict['NAME']).insert_sensor_values(
+            [(5, minute, 0, self.START + minute * 30) for minute in range(240)])
+
+    def history(self, **parameters):
+        """ Get the history of the light sensor for the first hour of readings, unless a range is given. """
+        parameters.setdefault('from', self.START)
+        parameters.setdefault('to', self.START + 3599)
+        return self.client.get('/history/light', parameters)
+
+    def test_raw_readings(self):
+        response = self.history()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['resolution'], 0)
+        self.assertEqual(response.json()['value'], list(range(120)))
+
+    def test_finest_resolution_within_points(self):
+        self.assertEqual(self.history(points=100).json()['resolution'], 60)
+        data = self.history(points=100, to=self.START + 7199).json()
+        self.assertEqual(data['resolution'], 3600)
+        self.assertEqual(data['time'], [self.START, self.START + 3600])
+        self.assertEqual(data['min'], [0, 120])
+        self.assertEqual(data['max'], [119, 239])
+        self.assertEqual(data['avg'], [59.5, 179.5])
+        self.assertEqual(data['count'], [120, 120])
+
+    def test_rollups_from_bucket_of_start(self):
+        data = self.history(resolution=60, **{'from': self.START + 90, 'to': self.START + 179}).json()
+        self.assertEqual(data['time'], [self.START + 60, self.START + 120])
+        self.assertEqual(data['count'], [2, 2])
+
+    def test_readings_more_often_than_expected(self):
+        DB(connection.settings_dict['NAME']).insert_sensor_values(
+            [(5, 1000, 0, self.START + second) for second in range(1, 30)])
+        data = self.history(points=140).json()
+        self.assertEqual(data['resolution'], 60)
+        self.assertEqual(data['count'][0], 31)
+
+    def test_points_limit_raw_readings(self):
+        response = self.history(resolution=0, points=100)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.history(resolution=0, points=120).status_code, 200)
+
+    def test_points_limit_rollups(self):
+        self.assertEqual(self.history(resolution=60, points=59).status_code, 400)
+        self.assertEqual(self.history(resolution=60, points=60).status_code, 200)
+
+    def test_invalid_parameters(self):
+        self.assertEqual(self.history(points=0).status_code, 400)
+        self.assertEqual(self.history(points=views.MAX_POINTS + 1).status_code, 400)
+        self.assertEqual(self.history(resolution=120).status_code, 400)
+        self.assertEqual(self.history(to='soon').status_code, 400)
+        self.assertEqual(self.client.get('/history/sun').status_code, 404)
+
+
+class ConditionalResponseTest(BackendDataMixin, TransactionTestCase):
+    """ Test the ETag of the dashboard responses and invalidating the cached responses. """
+
+    def setUp(self):
+        super().setUp()
+        self.db = DB(connection.settings_dict['NAME'])
+
+    def test_not_modified(self):
+        response = self.client.get('/sensors')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('ETag'))
+        response = self.client.get('/sensors', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.client.get('/sensors', HTTP_IF_NONE_MATCH='"0-0-0"').status_code, 200)
+
+    def test_etag_changes_after_settings_change(self):
+        etag = self.client.get('/sensors')['ETag']
+        self.client.post('/settings', json.dumps([{'sensor': 5, 'setting_name': 'max_value', 'value': 300}]),
+                         content_type='application/json')
+        response = self.client.get('/sensors', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_changes_after_insert(self):
+        response = self.client.get('/sensors')
+        etag = response['ETag']
+        self.assertIsNone(response.json()['light'])
+        self.db.insert_sensor_values([(5, 200, 1, 1700000000)])
+        response = self.client.get('/sensors', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        # The cached response of the old version is not returned.
+        self.assertEqual(response.json()['history_lights_y'], [200])
+
+    def test_etag_changes_after_state_update(self):
+        etag = self.client.get('/sensors')['ETag']
+        views.get_state_store().update(5, 200, 1, 1700000000)
+        response = self.client.get('/sensors', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['light'], 200)
+        self.assertEqual(response.json()['light_motor'], 'down')
+
+    def test_sensors_without_state(self):
+        # The state store is new, like after a reboot, so the last readings come from the database.
+        self.db.insert_sensor_values([(5, 200, 1, 1700000000), (5, 210, 0, 1700000030)])
+        sensors = {sensor['id']: sensor for sensor in self.client.get('/sensors').json()['sensors']}
+        self.assertEqual((sensors[5]['value'], sensors[5]['motor']), (210, 'up'))
+        self.assertEqual((sensors[3]['value'], sensors[3]['motor']), (None, None))
+        views.get_state_store().update(5, 220, 1, 1700000060)
+        sensors = {sensor['id']: sensor for sensor in self.client.get('/sensors').json()['sensors']}
+        self.assertEqual((sensors[5]['value'], sensors[5]['motor']), (220, 'down'))
+
+    def test_response_cached_per_version(self):
+        self.client.get('/sensors')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/sensors').status_code, 200)
+        self.assertFalse([query for query in queries if 'readings' in query['sql'] and 'version' not in query['sql']])
+
+
+class ImportExportTest(BackendDataMixin, TransactionTestCase):
+    """ Test exporting readings to chunks and importing them again. """
+
+    def setUp(self):
+        super().setUp()
+        # Readings of two sensors every 30 seconds for two hours.
+        DB(connection.settings_dict['NAME']).insert_sensor_values(
+            [(sensor, minute, 0, 1700006400 + minute * 30) for minute in range(240) for sensor in (3, 5)])
+        self.readings = self.stored_readings()
+        self.rollups = self.stored_rollups()
+        self.export = self.directory + '/export'
+        call_command('export_readings', self.export, '--batch', '100', stdout=StringIO())
+
+    def stored_readings(self):
+        """ Get every stored reading. """
+        return list(Reading.objects.order_by('ID').values_list(
+            'ID', 'sensor_id', 'sensor_value', 'screen_position', 'reading_time'))
+
+    def stored_rollups(self):
+        """ Get the minimum, maximum, total and count of every stored rollup by sensor, resolution and bucket. """
+        return {rollup[:3]: rollup[3:] for rollup in Rollup.objects.values_list(
+            'sensor_id', 'resolution', 'bucket', 'min_value', 'max_value', 'total', 'count')}
+
+    def import_readings(self, *arguments):
+        """ Import the exported readings and return the output. """
+        output = StringIO()
+        call_command('import_readings', self.export, *arguments, stdout=output)
+        return output.getvalue()
+
+    def test_round_trip(self):
+        Reading.objects.all().delete()
+        Rollup.objects.all().delete()
+        self.assertIn('Imported 480 readings, skipped 0', self.import_readings())
+        self.assertEqual(self.stored_readings(), self.readings)
+        self.assertEqual(self.stored_rollups(), self.rollups)
+
+    def test_existing_readings_skipped(self):
+        Reading.objects.filter(ID__gt=self.readings[399][0]).delete()
+        output = self.import_readings()
+        self.assertIn('Imported 80 readings, skipped 400', output)
+        self.assertEqual(self.stored_readings(), self.readings)
+        self.assertEqual(self.stored_rollups(), self.rollups)
+        self.assertIn('Imported 0 readings, skipped 480', self.import_readings())
+
+    def test_time_range_and_sensor(self):
+        Reading.objects.all().delete()
+        self.import_readings('--from', '1700006400', '--to', '1700010000', '--sensor', '5', '--skip-rollups')
+        self.assertEqual(self.stored_readings(), [reading for reading in self.readings
+                                                  if reading[1] == 5 and reading[4] <= 1700010000])
+
+    def test_existing_rollups_kept(self):
+        Reading.objects.all().delete()
+        output = self.import_readings()
+        self.assertIn('kept {n} existing rollups'.format(n=len(self.rollups)), output)
+        self.assertEqual(self.stored_rollups(), self.rollups)
+
+    def test_add_rollups(self):
+        Reading.objects.all().delete()
+        self.import_readings('--add-rollups')
+        self.assertEqual(self.stored_rollups(), {
+            key: (min_value, max_value, 2 * total, 2 * count)
+            for key, (min_value, max_value, total, count) in self.rollups.items()})
+
+    def test_skip_rollups(self):
+        Reading.objects.all().delete()
+        Rollup.objects.all().delete()
+        self.import_readings('--skip-rollups')
+        self.assertEqual(self.stored_readings(), self.readings)
+        self.assertFalse(Rollup.objects.exists())
+
+    def test_new_ids(self):
+        self.assertIn('Imported 480 readings', self.import_readings('--new-ids', '--skip-rollups'))
+        readings = self.stored_readings()
+        self.assertEqual(len(readings), 960)
+        self.assertEqual([reading[1:] for reading in readings[480:]], [reading[1:] for reading in self.readings])
+
+
+class RetentionTest(BackendDataMixin, TransactionTestCase):
+    """ Test archiving old readings, pruning old rollups and reclaiming the free space. """
+
+    def setUp(self):
+        super().setUp()
+        now = int(time.time())
+        self.old = [now - 400 * 86400 + minute * 30 for minute in range(100)]
+        self.expired = [now - 100 * 86400 + minute * 30 for minute in range(100)]
+        self.recent = [now - 86400 + minute * 30 for minute in range(100)]
+        DB(connection.settings_dict['NAME']).insert_sensor_values(
+            [(5, value, 0, reading_time) for value, reading_time in enumerate(self.old + self.expired + self.recent)])
+
+    def retention(self, *arguments):
+        """ Run the retention command and return the output. """
+        output = StringIO()
+        call_command('retention', '--days', '30', '--batch', '30', '--pause', '0', *arguments, stdout=output)
+        return output.getvalue()
+
+    def test_old_readings_archived(self):
+        output = self.retention()
+        self.assertIn('Archived 200 readings.', output)
+        self.assertEqual(list(Reading.objects.order_by('ID').values_list('reading_time', flat=True)), self.recent)
+        chunks = list(scan(self.directory + '/archive'))
+        self.assertEqual(sorted(time for chunk in chunks for time in chunk['reading_time'].tolist()),
+                         self.old + self.expired)
+        self.assertEqual(sorted(value for chunk in chunks for value in chunk['sensor_value'].tolist()),
+                         list(range(200)))
+        # Running again finds nothing left to archive.
+        self.assertIn('Archived 0 readings.', self.retention())
+
+    def test_old_rollups_pruned(self):
+        output = self.retention()
+        self.assertIn('Pruned {n} rollups of 60s.'.format(n=len({time // 60 for time in self.old})), output)
+        self.assertEqual(min(Rollup.objects.filter(resolution=60).values_list('bucket', flat=True)),
+                         self.expired[0] // 60 * 60)
+        self.assertEqual(min(Rollup.objects.filter(resolution=3600).values_list('bucket', flat=True)),
+                         self.old[0] // 3600 * 3600)
+
+    def test_incremental_vacuum(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA auto_vacuum = NONE")
+            cursor.execute("VACUUM")
+        self.assertIn('run with --enable-incremental-vacuum once', self.retention())
+        DB(connection.settings_dict['NAME']).insert_sensor_values(
+            [(5, value, 0, self.old[0]) for value in range(5000)])
+        self.assertIn('Reclaimed free space.', self.retention('--enable-incremental-vacuum'))
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA auto_vacuum")
+            self.assertEqual(cursor.fetchone()[0], 2)
+            cursor.execute("PRAGMA freelist_count")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class StatisticsTest(SimpleTestCase):
+    """ Test computing the statistics of readings per period. """
+
+    # Midnight UTC of Wednesday the 15th of November 2023.
+    DAY = 1700006400
+
+    def setUp(self):
+        self.times = np.array([3600, 7200, 10800, 86400, 86460]) + self.DAY
+        self.values = np.array([10, 30, 20, 5, 7])
+        self.positions = np.array([0, 1, 1, 1, 0])
+
+    def test_moving_average(self):
+        self.assertEqual(analytics.moving_average(np.array([1, 2, 3, 4]), 3).tolist(), [1, 1.5, 2, 3])
+
+    def test_days(self):
+        days = analytics.sensor_statistics(self.times, self.values, self.positions, self.DAY + 3600, 86400,
+                                           max_value=15, window=2)
+        self.assertEqual(days, [
+            {'period_start': self.DAY, 'count': 3, 'min': 10, 'max': 30, 'mean': 20.0, 'p10': 10, 'p50': 20,
+             'p90': 20, 'moving_average_max': 25.0, 'seconds_above_max_value': 600, 'screen_movements': 1},
+            {'period_start': self.DAY + 86400, 'count': 2, 'min': 5, 'max': 7, 'mean': 6.0, 'p10': 5, 'p50': 5,
+             'p90': 5, 'moving_average_max': 12.5, 'seconds_above_max_value': 0, 'screen_movements': 1}])
+
+    def test_periods_start_at_boundary(self):
+        # The range starts in the afternoon, the first day still starts at midnight.
+        days = analytics.sensor_statistics(self.times[3:], self.values[3:], self.positions[3:],
+                                           self.DAY + 50000, 86400, max_value=15)
+        self.assertEqual([day['period_start'] for day in days], [self.DAY + 86400])
+        weeks = analytics.sensor_statistics(self.times, self.values, self.positions, self.DAY + 3600,
+                                            analytics.PERIODS['week'], max_value=15)
+        self.assertEqual(len(weeks), 1)
+        self.assertEqual(weeks[0]['period_start'], self.DAY - 2 * 86400)
+        self.assertEqual(weeks[0]['count'], 5)
+
+    def test_no_readings(self):
+        empty = np.array([], dtype=np.int64)
+        self.assertEqual(analytics.sensor_statistics(empty, empty, empty, self.DAY, 86400, max_value=15), [])
+
+
+class ChunkCacheTest(BackendDataMixin, TransactionTestCase):
+    """ Test caching the readings of closed chunks of time. """
+
+    def setUp(self):
+        super().setUp()
+        self.db = DB(connection.settings_dict['NAME'])
+        self.chunk = 1600000000 // analytics.CHUNK
+        self.start = self.chunk * analytics.CHUNK
+        self.db.insert_sensor_values([(5, value, value % 2, self.start + value * 60) for value in range(100)])
+
+    def test_closed_chunk_cached(self):
+        times, values, positions = analytics.load_readings(5, self.start, self.start + analytics.CHUNK - 1)
+        self.assertEqual(values.tolist(), list(range(100)))
+        self.assertTrue(os.path.exists('{d}/analytics_cache/5-{c}.npy'.format(d=self.directory, c=self.chunk)))
+
+        # The cached chunk is used without querying the database.
+        Reading.objects.all().delete()
+        times, values, positions = analytics.load_readings(5, self.start + 600, self.start + 1199)
+        self.assertEqual(values.tolist(), list(range(10, 20)))
+        self.assertEqual(positions.tolist(), [value % 2 for value in range(10, 20)])
+
+        analytics.invalidate(5, self.start, self.start)
+        self.assertEqual(len(analytics.load_readings(5, self.start, self.start + 1199)[0]), 0)
+
+    def test_open_chunk_not_cached(self):
+        now = int(time.time())
+        self.db.insert_sensor_values([(5, 300, 0, now)])
+        times, values, positions = analytics.load_readings(5, self.start, now)
+        self.assertEqual(values.tolist(), list(range(100)) + [300])
+        cached = os.listdir(self.directory + '/analytics_cache')
+        self.assertIn('5-{c}.npy'.format(c=self.chunk), cached)
+        self.assertNotIn('5-{c}.npy'.format(c=now // analytics.CHUNK), cached)
+
+
+class FakeClock:
+    """ Stand in for the time module, running the functions scheduled at a time when sleeping past it. """
+
+    def __init__(self, scheduled=None):
+        self.now = 0
+        self.scheduled = dict(scheduled or {})
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+        if self.now in self.scheduled:
+            self.scheduled.pop(self.now)()
+
+
+class EventStreamTest(BackendDataMixin, TestCase):
+    """ Test the server-sent events of new readings. """
+
+    def stream(self, clock, *arguments):
+        """ Get every event of a stream of the light sensor, with the time the clock had when it was yielded. """
+        with mock.patch.object(views, 'time', clock):
+            sensors = [configuration.sensor_registry().get(5)]
+            return [(clock.now, event) for event in views.event_stream(sensors, *arguments)]
+
+    def test_events(self):
+        store = views.get_state_store()
+        clock = FakeClock({3: lambda: store.update(5, 200, 1, 1700000000),
+                           4: lambda: store.update(3, 20, 0, 1700000000),
+                           5: lambda: store.update(5, 200, 1, 1700000000)})
+        events = self.stream(clock, None, 25)
+        self.assertEqual(events[0], (0, 'retry: 3000\n\n'))
+        self.assertEqual(events[1][0], 3)
+        self.assertTrue(events[1][1].startswith('id: 1700000000\nevent: reading\ndata: '))
+        data = json.loads(events[1][1].split('data: ')[1])
+        self.assertEqual((data['id'], data['value'], data['motor']), (5, 200, 'down'))
+        # Readings of other sensors and readings which did not change anything are not sent.
+        self.assertEqual(events[2:], [(20, ': keepalive\n\n')])
+        self.assertEqual(clock.now, 25)
+
+    def test_stream_ends(self):
+        events = self.stream(FakeClock(), None, views.EVENT_STREAM_DURATION)
+        self.assertEqual(len(events), 1 + views.EVENT_STREAM_DURATION // views.EVENT_KEEPALIVE)
+        self.assertEqual(events[-1][0], views.EVENT_STREAM_DURATION)
+
+    def test_reconnect(self):
+        views.get_state_store().update(5, 200, 1, 1700000100)
+        events = self.stream(FakeClock(), 1700000000, 1)
+        self.assertEqual(len(events), 2)
+        self.assertTrue(events[1][1].startswith('id: 1700000100\n'))
+        self.assertEqual(len(self.stream(FakeClock(), 1700000100, 1)), 1)
+        self.assertEqual(len(self.stream(FakeClock(), None, 1)), 1)
+
+    def test_view(self):
+        views.get_state_store().update(5, 200, 1, 1700000100)
+        with mock.patch.object(views, 'time', FakeClock()):
+            response = self.client.get('/events', HTTP_LAST_EVENT_ID='1700000000')
+            events = list(response.streaming_content)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(events[0], b'retry: 3000\n\n')
+        self.assertTrue(events[1].startswith(b'id: 1700000100\n'))
@@ -3,6 +3,11 @@ from . import views
 
 urlpatterns = [
     url('sensors', views.sensors, name='index'),
+    url('analytics$', views.analytics, name='analytics'),
+    url('events$', views.events, name='events'),
+    url('settings$', views.sensor_settings, name='settings'),
+    url('metrics$', views.metrics_view, name='metrics'),
+    url('history/(?P<sensor>[a-z0-9_]+)$', views.history, name='history'),
     url('update/rollout/(?P<value>[0-9]+)', views.updateRollOut, name='rollout'),
     url('update/rollin/(?P<value>[0-9]+)', views.updateRollIn, name='rollin'),
     url(r'^$', views.index, name='index'),
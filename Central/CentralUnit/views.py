@@ -1,21 +1,151 @@
 import datetime
-from django.http import JsonResponse
-from django.shortcuts import render
-from .models import Temperature, Light, SensorSettings
+import json
+import metrics
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_http_methods
+from database import ROLLUP_RESOLUTIONS
+from stateStore import StateStore
+from .configuration import apply_changes, current_settings, readings_version, sensor_registry, settings_version
+from .models import Reading, Rollup, SensorSettings
 
+state_store = None
 
-def index(request):
+# Seconds between two readings of a sensor.
+READING_INTERVAL = 30
+
+# Seconds between checks for new readings and between keepalive messages of the event stream, and seconds
+# an event stream is kept open before the client is made to reconnect, so it does not hold a thread forever.
+EVENT_INTERVAL = 1
+EVENT_KEEPALIVE = 15
+EVENT_STREAM_DURATION = 300
+
+# Seconds a rendered response is kept in the cache, a new reading or setting gives it a new key anyway.
+RESPONSE_CACHE_TIMEOUT = 300
+
+# Maximum number of values of a sensor returned by one request for its history.
+MAX_POINTS = 10000
+
+
+def get_state_store():
+    """ Get the state store shared with the backend, opening it on first use. """
+    global state_store
+    if state_store is None:
+        state_store = StateStore(settings.SENSOR_STATE_FILE)
+    return state_store
+
+
+def latest_state(sensor_id):
+    """ Get the last value and screen position of a sensor, from the state store shared with the backend
+        or from the database when the state store does not know the sensor yet.
+    """
+    state = get_state_store().get(sensor_id)
+    if state is not None:
+        return state[0], state[1]
+    return Reading.objects.filter(sensor_id=sensor_id).order_by('-reading_time')\
+        .values_list('sensor_value', 'screen_position').first() or (None, None)
+
+
+def dashboard_sensor(kind):
+    """ Get the first sensor of a kind shown on the dashboard, None when there is no such sensor. """
+    sensors = sensor_registry().of_kind(kind)
+    return sensors[0] if sensors else None
+
+
+def sensor_history(sensor, count=10):
+    """ Get the current value and motor direction of a sensor with its last values and their times.
+
+    Args:
+        sensor: The Sensor from the registry, None when the dashboard has no such sensor.
+        count: Number of last values to get.
+
+    Returns:
+        Tuple of the current value, motor direction, last values and times of the last values.
+
+    """
+    if sensor is None:
+        return None, 'up', [], []
+
+    value, position = latest_state(sensor.id)
+    rows = Reading.objects.filter(sensor_id=sensor.id).order_by('-reading_time')\
+        .values_list('sensor_value', 'reading_time')[:count]
+    return (sensor.convert(value) if value is not None else None,
+            'down' if position == 1 else 'up',
+            [sensor.convert(row[0]) for row in rows],
+            [datetime.datetime.fromtimestamp(int(row[1])).strftime('%H:%M') for row in rows])
+
+
+def data_version(request):
+    """ Get the version of the data shown by the dashboard, which changes whenever the backend decodes
+        a new reading, commits new readings, or a setting like a roll distance changes. It is used as ETag
+        of the responses.
+
+        The state store is updated when a reading is decoded, before the reading is committed, so a response
+        built in between lacks the reading in the history. It is cached under the version of the readings
+        before the commit, which the commit increases.
+    """
+    readings = readings_version()
+    settings = settings_version()
+    if readings is None or settings is None:
+        return None
+    return '{u}-{r}-{s}'.format(u=get_state_store().updates(), r=readings, s=settings)
+
+
+def data_modified(request):
+    """ Get the time the version of the data shown by the dashboard was first seen, used as Last-Modified. """
+    version = data_version(request)
+    if version is None:
+        return None
+    key = 'modified-' + version
+    cache.add(key, datetime.datetime.utcnow(), RESPONSE_CACHE_TIMEOUT)
+    return cache.get(key)
+
+
+def cached_response(name, request, build):
+    """ Get a response from the cache, building it only once for every version of the data.
+
+    Args:
+        name: The name of the response in the cache.
+        request: The request.
+        build: Function building the response.
+
+    Returns:
+        The response.
+
+    """
+    version = data_version(request)
+    if version is None:
+        return build()
+    key = 'response-{n}-{v}'.format(n=name, v=version)
+    response = cache.get(key)
+    if response is None:
+        response = build()
+        cache.set(key, response, RESPONSE_CACHE_TIMEOUT)
+    return response
+
+
+def render_index():
+    """ Render the dashboard with the current roll distances and the last temperature and light. """
     context = dict()
 
-    latest_temp = Temperature.objects.order_by('-reading_time')[:1]
-    latest_light = Light.objects.order_by('-reading_time')[:1]
-    roll_in_distance = SensorSettings.objects.get(setting_name='roll_in_distance')
-    roll_out_distance = SensorSettings.objects.get(setting_name='roll_out_distance')
-    context['roll_in_distance'] = roll_in_distance.setting_value
-    context['roll_out_distance'] = roll_out_distance.setting_value
-    context['temperature'] = [t.sensor_value for t in latest_temp][0]
-    context['light'] = [l.sensor_value for l in latest_light][0]
-    return render(request, 'CentralUnit/index.html', context)
+    distances = dict(SensorSettings.objects.filter(
+        setting_name__in=('roll_in_distance', 'roll_out_distance')).values_list('setting_name', 'setting_value'))
+    context['roll_in_distance'] = distances['roll_in_distance']
+    context['roll_out_distance'] = distances['roll_out_distance']
+    for kind in ('temperature', 'light'):
+        sensor = dashboard_sensor(kind)
+        value = latest_state(sensor.id)[0] if sensor is not None else None
+        context[kind] = sensor.convert(value) if value is not None else None
+    return HttpResponse(render_to_string('CentralUnit/index.html', context))
+
+
+@condition(etag_func=data_version, last_modified_func=data_modified)
+def index(request):
+    return cached_response('index', request, render_index)
 
 
 def updateRollIn(request, value):
@@ -44,46 +174,261 @@ def updateRollOut(request, value):
     })
 
 
+@condition(etag_func=data_version, last_modified_func=data_modified)
 def sensors(request):
-    latest_temps = Temperature.objects.order_by('-reading_time')[:10]
-    current_temperature = [t.sensor_value for t in latest_temps][0]
-    history_temperature_y = list()
-    history_temperature_x = list()
-    for t in latest_temps:
-        history_temperature_y.append(t.sensor_value)
-        history_temperature_x.append(
-            datetime.datetime.fromtimestamp(
-                int(t.reading_time)
-            ).strftime('%H:%M')
-        )
-
-    temperature_motor = 'up'
-    if [t.screen_position for t in latest_temps][0] == 1:
-        temperature_motor = 'down'
-
-    latest_lights = Light.objects.order_by('-reading_time')[:10]
-    current_light = [l.sensor_value for l in latest_lights][0]
-    history_lights_y = list()
-    history_lights_x = list()
-    for l in latest_lights:
-        history_lights_y.append(l.sensor_value)
-        history_lights_x.append(
-            datetime.datetime.fromtimestamp(
-                int(l.reading_time)
-            ).strftime('%H:%M')
-        )
-
-    light_motor = 'up'
-    if [l.screen_position for l in latest_lights][0] == 1:
-        light_motor = 'down'
+    return cached_response('sensors', request, sensors_response)
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def sensor_settings(request):
+    """ Get every setting, or change many settings at once.
+
+    A POST request holds a JSON list of changes like {"sensor": 3, "setting_name": "max_value", "value": 25},
+    which are all stored in a single transaction or, when any of them is invalid, not at all. The settings
+    and their version are returned, the backend picks up the new version within a second.
+
+    The request is exempt from the CSRF check for scripts, but must have a JSON content type, which a form
+    on another site cannot send without the browser asking this site for permission first.
+    """
+    if request.method == 'POST':
+        if request.content_type != 'application/json':
+            return JsonResponse({'status': 'error', 'message': 'Content-Type must be application/json',
+                                 'code': 415}, status=415)
+        try:
+            changes = json.loads(request.body.decode('utf-8'))
+            changed = apply_changes(changes.get('changes') if isinstance(changes, dict) else changes)
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'message': str(e), 'code': 400}, status=400)
+    else:
+        changed = 0
 
     return JsonResponse({
+        'status': 'success',
+        'changed': changed,
+        'version': settings_version(),
+        'settings': current_settings(),
+        'code': 200
+    })
+
+
+def sensors_response():
+    """ Build the ID, current value, screen position and last ten values of the temperature and light sensors
+        shown on the dashboard, and the current value and screen position of every sensor.
+    """
+    temperature_sensor = dashboard_sensor('temperature')
+    light_sensor = dashboard_sensor('light')
+    current_temperature, temperature_motor, history_temperature_y, history_temperature_x = \
+        sensor_history(temperature_sensor)
+    current_light, light_motor, history_lights_y, history_lights_x = sensor_history(light_sensor)
+
+    sensors = list()
+    for sensor in sensor_registry():
+        value, screen_position = latest_state(sensor.id)
+        sensors.append({
+            'id': sensor.id,
+            'name': sensor.name,
+            'kind': sensor.kind,
+            'unit': sensor.unit,
+            'value': sensor.convert(value) if value is not None else None,
+            'motor': ('down' if screen_position == 1 else 'up') if screen_position is not None else None
+        })
+
+    return JsonResponse({
+        'light_sensor': light_sensor.id if light_sensor is not None else None,
         'light': current_light,
         'light_motor': light_motor,
         'history_lights_y': history_lights_y,
         'history_lights_x': history_lights_x,
+        'temperature_sensor': temperature_sensor.id if temperature_sensor is not None else None,
         'temperature': current_temperature,
         'temperature_motor': temperature_motor,
         'history_temperature_y': history_temperature_y,
-        'history_temperature_x': history_temperature_x
+        'history_temperature_x': history_temperature_x,
+        'sensors': sensors
     })
+
+
+def reading_events(store, sensors, last):
+    """ Yield a server-sent event for every sensor whose state differs from the last state sent.
+
+    The reading time is the ID of the event, which the client sends back when it reconnects.
+    """
+    for sensor in sensors:
+        state = store.get(sensor.id)
+        if state is None or state == last[sensor.id]:
+            continue
+        last[sensor.id] = state
+        value, screen_position, reading_time = state
+        yield 'id: {i}\nevent: reading\ndata: {data}\n\n'.format(i=reading_time, data=json.dumps({
+            'id': sensor.id,
+            'sensor': sensor.name,
+            'kind': sensor.kind,
+            'value': sensor.convert(value),
+            'motor': 'down' if screen_position == 1 else 'up',
+            'time': datetime.datetime.fromtimestamp(reading_time).strftime('%H:%M')
+        }))
+
+
+def event_stream(sensors, last_event_id=None, duration=EVENT_STREAM_DURATION):
+    """ Yield a server-sent event for every new reading of the sensors given, and a keepalive comment when idle.
+
+    Only the state store is checked for new readings, so the database is not queried however many
+    clients are listening. The stream ends after the duration given and the client reconnects with
+    the ID of the last event it got, readings newer than that are sent right away.
+    """
+    store = get_state_store()
+    updates = store.updates()
+    last = {sensor.id: store.get(sensor.id) for sensor in sensors}
+    if last_event_id is not None:
+        for sensor_id, state in last.items():
+            if state is not None and state[2] > last_event_id:
+                last[sensor_id] = None
+    idle = 0
+    closing = time.monotonic() + duration
+
+    # Make the client reconnect after a few seconds when the connection is lost or the stream ends.
+    yield 'retry: 3000\n\n'
+    yield from reading_events(store, sensors, last)
+
+    while time.monotonic() < closing:
+        time.sleep(EVENT_INTERVAL)
+        if store.updates() == updates:
+            idle += EVENT_INTERVAL
+            if idle >= EVENT_KEEPALIVE:
+                idle = 0
+                yield ': keepalive\n\n'
+            continue
+
+        updates = store.updates()
+        idle = 0
+        yield from reading_events(store, sensors, last)
+
+
+def events(request):
+    """ Push new readings and screen positions of every sensor to the client as server-sent events. """
+    try:
+        last_event_id = int(request.META['HTTP_LAST_EVENT_ID'])
+    except (KeyError, ValueError):
+        last_event_id = None
+    response = StreamingHttpResponse(event_stream(list(sensor_registry()), last_event_id),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def finest_resolution(duration, points, candidates=(0,) + ROLLUP_RESOLUTIONS):
+    """ Get the finest resolution which gives at most a number of points for a duration, else the coarsest. """
+    for candidate in candidates:
+        if duration / (candidate or READING_INTERVAL) <= points:
+            return candidate
+    return candidates[-1]
+
+
+def too_many_points(points):
+    """ Get the response to a request for the history of a sensor with more values than it asked for at most. """
+    return JsonResponse({'status': 'error', 'message': 'More than {p} values, use a shorter range or a coarser '
+                         'resolution'.format(p=points), 'code': 400}, status=400)
+
+
+def history(request, sensor):
+    """ Get the values of a sensor within a time range.
+
+    The time range is given by the 'from' and 'to' parameters in seconds since the epoch and defaults
+    to the last day. Unless a resolution in seconds is given, the finest resolution which returns at
+    most 'points' values is used. Raw readings are returned at resolution 0, otherwise the minimum,
+    maximum, average and count of the values per bucket are returned from the rollups. When a resolution
+    is given and the range holds more than 'points' values the request fails, so the range must be split
+    or a coarser resolution used.
+    """
+    if sensor.isdigit():
+        sensor_id = int(sensor)
+    else:
+        found = sensor_registry().find(sensor)
+        if found is None:
+            raise Http404('Unknown sensor')
+        sensor_id = found.id
+
+    try:
+        end = int(request.GET.get('to', time.time()))
+        start = int(request.GET.get('from', end - 86400))
+        points = int(request.GET.get('points', 500))
+        resolution = request.GET.get('resolution')
+        resolution = int(resolution) if resolution is not None else None
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid parameter', 'code': 400}, status=400)
+
+    if not 1 <= points <= MAX_POINTS:
+        return JsonResponse({'status': 'error', 'message': 'Points must be between 1 and {m}'.format(m=MAX_POINTS),
+                             'code': 400}, status=400)
+
+    requested = resolution is not None
+    if resolution is None:
+        resolution = finest_resolution(end - start, points)
+    elif resolution != 0 and resolution not in ROLLUP_RESOLUTIONS:
+        return JsonResponse({'status': 'error', 'message': 'Unknown resolution', 'code': 400}, status=400)
+
+    if resolution == 0:
+        rows = Reading.objects.filter(sensor_id=sensor_id, reading_time__gte=start, reading_time__lte=end)\
+            .order_by('reading_time').values_list('reading_time', 'sensor_value')[:points + 1]
+        if len(rows) <= points:
+            return JsonResponse({
+                'sensor': sensor_id,
+                'resolution': resolution,
+                'time': [row[0] for row in rows],
+                'value': [row[1] for row in rows]
+            })
+        if requested:
+            return too_many_points(points)
+        # The sensor sends readings more often than expected, use the finest rollups instead.
+        resolution = finest_resolution(end - start, points, ROLLUP_RESOLUTIONS)
+
+    rows = Rollup.objects.filter(sensor_id=sensor_id, resolution=resolution,
+                                 bucket__gte=start - start % resolution, bucket__lte=end)\
+        .order_by('bucket').values_list('bucket', 'min_value', 'max_value', 'total', 'count')
+    if requested:
+        rows = rows[:points + 1]
+        if len(rows) > points:
+            return too_many_points(points)
+    return JsonResponse({
+        'sensor': sensor_id,
+        'resolution': resolution,
+        'time': [row[0] for row in rows],
+        'min': [row[1] for row in rows],
+        'max': [row[2] for row in rows],
+        'avg': [row[3] / row[4] for row in rows],
+        'count': [row[4] for row in rows]
+    })
+
+
+def analytics(request):
+    """ Get statistics per day or week of the readings of every sensor within a time range.
+
+    The time range is given by the 'from' and 'to' parameters in seconds since the epoch and defaults
+    to the last week, the period by the 'period' parameter. Days start at midnight UTC and weeks on Monday.
+    """
+    from .analytics import PERIODS, statistics
+
+    try:
+        end = int(request.GET.get('to', time.time()))
+        start = int(request.GET.get('from', end - 7 * 86400))
+        window = int(request.GET.get('window', 10))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid parameter', 'code': 400}, status=400)
+
+    if window < 1:
+        return JsonResponse({'status': 'error', 'message': 'Window must be at least 1', 'code': 400}, status=400)
+
+    period = request.GET.get('period', 'day')
+    if period not in PERIODS:
+        return JsonResponse({'status': 'error', 'message': 'Unknown period', 'code': 400}, status=400)
+
+    return JsonResponse(statistics(start, end, period, window=window))
+
+
+def metrics_view(request):
+    """ Get the metrics of the web interface in the Prometheus text format, when metrics are enabled. """
+    if not metrics.enabled:
+        raise Http404('Metrics are not enabled')
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,31 @@
+# Gunicorn configuration for serving the Central web interface in production, run from this directory:
+#
+#   python manage.py collectstatic --noinput
+#   gunicorn -c gunicorn.conf.py Central.wsgi
+#
+# Every environment variable below is optional.
+import multiprocessing
+import os
+
+bind = os.environ.get('SUNROLER_BIND', '0.0.0.0:8000')
+raw_env = ['DJANGO_SETTINGS_MODULE=Central.production']
+
+# Requests wait on the database and the disk rather than on the CPU, so a few processes with many threads
+# serve more clients than many processes would, in less memory. One process per core, at most four, so a
+# Raspberry Pi keeps a core for the ingest service.
+worker_class = 'gthread'
+workers = int(os.environ.get('SUNROLER_WEB_WORKERS', min(multiprocessing.cpu_count(), 4)))
+
+# Every open event stream of a dashboard keeps a thread busy, so there should be more threads in total than
+# dashboards open at once. A thread keeps its own database connections open.
+threads = int(os.environ.get('SUNROLER_THREADS', 32))
+
+# Let browsers reuse their connection for the requests of a page and the polling of the dashboard.
+keepalive = 5
+
+# Restart a process now and then, to return memory fragmented by long running event streams.
+max_requests = 10000
+max_requests_jitter = 1000
+
+# Load the application before starting the processes, so they share the memory of the imported code.
+preload_app = True
@@ -0,0 +1,118 @@
+import argparse
+import http.client
+import json
+import threading
+import time
+import urllib.parse
+
+
+def percentile(values, q):
+    """ Get a percentile of a sorted list of values.
+
+    Args:
+        values: Sorted list of values.
+        q: The percentile to get, from 0 to 100.
+
+    Returns:
+        The value at the percentile, or None for an empty list.
+
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, len(values) * q // 100)]
+
+
+def client(url, paths, deadline, interval, conditional, results):
+    """ Request the paths in turn over a single keep-alive connection until the deadline, like a dashboard.
+
+    Args:
+        url: The parsed URL of the web interface.
+        paths: The paths to request.
+        deadline: Time at which to stop.
+        interval: Seconds to wait between requests, 0 to send the next request right away.
+        conditional: Whether to send the ETag of the last response, like a browser revalidating its cache.
+        results: List to append a tuple of path, status and latency in seconds of every request to.
+
+    """
+    connection = None
+    etags = {}
+    while time.perf_counter() < deadline:
+        for path in paths:
+            headers = {'If-None-Match': etags[path]} if conditional and path in etags else {}
+            start = time.perf_counter()
+            try:
+                if connection is None:
+                    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=30)
+                connection.request('GET', url.path.rstrip('/') + path, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+                if response.getheader('ETag'):
+                    etags[path] = response.getheader('ETag')
+            except (OSError, http.client.HTTPException):
+                status = None
+                connection = None
+            results.append((path, status, time.perf_counter() - start))
+            if interval:
+                time.sleep(interval)
+
+
+def run(url='http://127.0.0.1:8000/', paths=('/', '/sensors'), clients=50, duration=10.0, interval=0.0,
+        conditional=False):
+    """ Request pages of the web interface from many concurrent clients and measure the responses.
+
+    Args:
+        url: URL of the web interface.
+        paths: The paths every client requests in turn.
+        clients: Number of concurrent clients.
+        duration: Number of seconds to send requests.
+        interval: Seconds every client waits between requests.
+        conditional: Whether clients revalidate their cached responses with the ETag.
+
+    Returns:
+        Dictionary with the results, in total and per path.
+
+    """
+    parsed = urllib.parse.urlsplit(url)
+    results = []
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=client, args=(parsed, paths, deadline, interval, conditional, results))
+               for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    def summary(selected):
+        latencies = sorted(latency * 1000 for path, status, latency in selected)
+        statuses = {}
+        for path, status, latency in selected:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        return {
+            'requests': len(selected),
+            'requests_per_second': len(selected) / elapsed,
+            'latency_ms_p50': percentile(latencies, 50),
+            'latency_ms_p95': percentile(latencies, 95),
+            'latency_ms_p99': percentile(latencies, 99),
+            'statuses': statuses,
+        }
+
+    result = {'clients': clients}
+    result.update(summary(results))
+    result['paths'] = {path: summary([r for r in results if r[0] == path]) for path in paths}
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure the web interface with many concurrent dashboard clients.')
+    parser.add_argument('url', nargs='?', default='http://127.0.0.1:8000/', help='URL of the web interface')
+    parser.add_argument('--path', action='append', help='Path to request, the index and sensors by default')
+    parser.add_argument('--clients', type=int, default=50, help='Number of concurrent clients')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to send requests')
+    parser.add_argument('--interval', type=float, default=0.0, help='Seconds every client waits between requests')
+    parser.add_argument('--conditional', action='store_true', help='Revalidate cached responses with their ETag')
+    arguments = parser.parse_args()
+    print(json.dumps(run(arguments.url, arguments.path or ('/', '/sensors'), arguments.clients, arguments.duration,
+                         arguments.interval, arguments.conditional), indent=2))